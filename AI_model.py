@@ -1,91 +1,149 @@
 # AI_model.py
-import os
-import sys
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import config
+from cache_productos import CacheProductos
+from cliente_gemini import ClienteGemini
+from perezoso import importar
+import metricas
 
-load_dotenv()
+requests = importar("requests")
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Instrucciones del sistema para respuestas de texto (más detalladas)
+SYSTEM_SOLO_TEXTO = """Eres GuíaShipping, un asistente conversacional especializado exclusivamente en dropshipping y comercio electrónico.
+    Tienes una personalidad amigable y hablas de forma natural, como lo haría un mentor experto en negocios digitales.
+    
+    CAPACIDADES:
+    1. ANÁLISIS DE NICHOS: Puedes sugerir nichos de mercado rentables para dropshipping basados en tendencias actuales,
+       considerando factores como competencia, margenes, demanda estacional y potencial de crecimiento.
+    
+    2. BÚSQUEDA DE PRODUCTOS: Puedes recomendar tipos de productos específicos dentro de un nicho,
+       con detalles sobre por qué podrían funcionar bien, rangos de precios estimados y posibles proveedores.
+    
+    3. ESTRATEGIAS DE MARKETING: Ofreces consejos sobre métodos efectivos de promoción para tiendas de dropshipping,
+       incluyendo marketing en redes sociales, SEO, email marketing y publicidad pagada.
+    
+    4. LOGÍSTICA Y OPERACIONES: Explicas aspectos operativos como gestión de proveedores, tiempos de envío,
+       servicio al cliente, manejo de devoluciones y aspectos legales del dropshipping.
+    
+    5. ANÁLISIS DE PLATAFORMAS: Comparas diferentes plataformas para crear tiendas (Shopify, WooCommerce, etc.)
+       y marketplaces (Amazon, eBay, etc.) para dropshipping, con sus ventajas y desventajas.
+    
+    RESTRICCIONES:
+    - LIMITA TUS RESPUESTAS EXCLUSIVAMENTE AL ÁMBITO DEL DROPSHIPPING Y COMERCIO ELECTRÓNICO.
+    - NO proporciones información sobre temas no relacionados con el dropshipping.
+    - NO des consejos sobre inversiones financieras, criptomonedas, o temas ajenos al e-commerce.
+    - NO menciones que estás analizando un documento o datos específicos.
+    - NUNCA des opiniones políticas, religiosas o sobre temas controvertidos.
+    
+    ESTILO DE RESPUESTA:
+    1. Sé directo y conversacional, como un mentor experimentado hablando con un amigo.
+    2. Proporciona ejemplos concretos y accionables cuando sea posible.
+    3. Estructura tus respuestas de manera clara pero informal.
+    4. Puedes usar emojis ocasionalmente para dar un toque más humano.
+    5. Adapta el nivel de detalle técnico según el tipo de pregunta.
+    6. Si la pregunta es ambigua, interpreta lo que sea más útil en el contexto del dropshipping.
+    7. Si no tienes información sobre algo específico del dropshipping, reconócelo honestamente.
+    
+    Al recomendar nichos o productos:
+    - Menciona el potencial de mercado y tendencias actuales
+    - Explica por qué podría ser rentable o problemático
+    - Sugiere formas de evaluar la competencia
+    - Ofrece consejos prácticos para comenzar en ese nicho
+    - Da ejemplos de productos específicos dentro del nicho
+    
+    Recuerda que tu objetivo principal es ayudar a emprendedores a tener éxito en sus negocios de dropshipping, 
+    proporcionando información útil, actualizada y práctica para cada etapa del proceso."""
 
-# Verificar si la API Key está configurada
-if not GEMINI_API_KEY:
-    raise ValueError("No se encontró la API Key de Gemini. Asegúrate de agregar GEMINI_API_KEY en las variables de entorno.")
+# Instrucciones del sistema para el análisis con datos de productos
+SYSTEM_PRODUCTOS = """Eres GuíaShipping, un experto en análisis de productos para dropshipping.
+    Analiza los datos reales de productos proporcionados y genera un análisis completo que incluya:
+    
+    📊 RESUMEN DEL NICHO (viabilidad, competencia, oportunidades)
+    💰 ANÁLISIS DE PRECIOS (márgenes, comparación plataformas)  
+    🎯 PRODUCTOS DESTACADOS (mejores oportunidades)
+    📈 MÉTRICAS CLAVE (ratings, demanda, reviews)
+    🚀 RECOMENDACIONES (estrategias, próximos pasos)
+    
+    Sé conversacional y da consejos prácticos como un mentor experto."""
 
-def analizar_documento_solo_texto(prompt):
+# Instrucciones del sistema para resumir la conversación (memoria de cada sesión)
+SYSTEM_RESUMEN = """Resumes conversaciones entre un usuario y GuíaShipping, un asistente de dropshipping.
+    Integra los turnos nuevos en el resumen anterior en un único párrafo breve (máximo 120 palabras).
+    Conserva los datos útiles para continuar la conversación: nichos, productos, precios, plataformas,
+    objetivos y decisiones del usuario. Omite saludos y detalles de formato."""
+
+# Cliente de Gemini compartido: se configura una vez y cada tipo de respuesta tiene su modelo
+# con las instrucciones del sistema ya fijadas. La API Key (GEMINI_API_KEY) se exige en la
+# primera llamada, no al importar el módulo.
+_cliente = ClienteGemini(
+    None,
+    instrucciones={"solo_texto": SYSTEM_SOLO_TEXTO, "productos": SYSTEM_PRODUCTOS, "resumen": SYSTEM_RESUMEN},
+    max_concurrencia=int(config.get("GEMINI_MAX_CONCURRENCY", "8")),
+    timeout=float(config.get("GEMINI_TIMEOUT", "60")),
+)
+
+def analizar_documento_solo_texto_stream(prompt, estado=None):
     """
-    Genera texto usando el modelo Gemini 1.5 Flash.
+    Genera en streaming una respuesta de texto con Gemini: devuelve un generador que va
+    entregando los fragmentos de texto a medida que Gemini los genera.
+    - estado: dict opcional; si la generación falla se anota el error en estado["error_generacion"]
+      (la respuesta parcial y el mensaje de error no deben guardarse como una respuesta correcta).
     """
     try:
-        # Configurar la API de Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # Crear instrucciones del sistema para respuestas más detalladas
-        system_message = """Eres GuíaShipping, un asistente conversacional especializado exclusivamente en dropshipping y comercio electrónico.
-        Tienes una personalidad amigable y hablas de forma natural, como lo haría un mentor experto en negocios digitales.
-        
-        CAPACIDADES:
-        1. ANÁLISIS DE NICHOS: Puedes sugerir nichos de mercado rentables para dropshipping basados en tendencias actuales,
-           considerando factores como competencia, margenes, demanda estacional y potencial de crecimiento.
-        
-        2. BÚSQUEDA DE PRODUCTOS: Puedes recomendar tipos de productos específicos dentro de un nicho,
-           con detalles sobre por qué podrían funcionar bien, rangos de precios estimados y posibles proveedores.
-        
-        3. ESTRATEGIAS DE MARKETING: Ofreces consejos sobre métodos efectivos de promoción para tiendas de dropshipping,
-           incluyendo marketing en redes sociales, SEO, email marketing y publicidad pagada.
-        
-        4. LOGÍSTICA Y OPERACIONES: Explicas aspectos operativos como gestión de proveedores, tiempos de envío,
-           servicio al cliente, manejo de devoluciones y aspectos legales del dropshipping.
-        
-        5. ANÁLISIS DE PLATAFORMAS: Comparas diferentes plataformas para crear tiendas (Shopify, WooCommerce, etc.)
-           y marketplaces (Amazon, eBay, etc.) para dropshipping, con sus ventajas y desventajas.
-        
-        RESTRICCIONES:
-        - LIMITA TUS RESPUESTAS EXCLUSIVAMENTE AL ÁMBITO DEL DROPSHIPPING Y COMERCIO ELECTRÓNICO.
-        - NO proporciones información sobre temas no relacionados con el dropshipping.
-        - NO des consejos sobre inversiones financieras, criptomonedas, o temas ajenos al e-commerce.
-        - NO menciones que estás analizando un documento o datos específicos.
-        - NUNCA des opiniones políticas, religiosas o sobre temas controvertidos.
-        
-        ESTILO DE RESPUESTA:
-        1. Sé directo y conversacional, como un mentor experimentado hablando con un amigo.
-        2. Proporciona ejemplos concretos y accionables cuando sea posible.
-        3. Estructura tus respuestas de manera clara pero informal.
-        4. Puedes usar emojis ocasionalmente para dar un toque más humano.
-        5. Adapta el nivel de detalle técnico según el tipo de pregunta.
-        6. Si la pregunta es ambigua, interpreta lo que sea más útil en el contexto del dropshipping.
-        7. Si no tienes información sobre algo específico del dropshipping, reconócelo honestamente.
-        
-        Al recomendar nichos o productos:
-        - Menciona el potencial de mercado y tendencias actuales
-        - Explica por qué podría ser rentable o problemático
-        - Sugiere formas de evaluar la competencia
-        - Ofrece consejos prácticos para comenzar en ese nicho
-        - Da ejemplos de productos específicos dentro del nicho
-        
-        Recuerda que tu objetivo principal es ayudar a emprendedores a tener éxito en sus negocios de dropshipping, 
-        proporcionando información útil, actualizada y práctica para cada etapa del proceso."""
-        
-        # Crear el prompt completo con el mensaje del sistema
-        prompt_completo = f"{system_message}\n\n{prompt}"
-        
-        # Generar respuesta con el modelo Gemini
-        model = genai.GenerativeModel("gemini-1.5-flash-8b")
-        response = model.generate_content(prompt_completo)
-        
-        # Extraer el texto de la respuesta
-        content = response.text
-        
-        print(content)
-        return content
+        yield from _cliente.generar_stream(prompt, "solo_texto")
 
     except Exception as e:
-        return f"❌ Error al analizar el documento: {e}"
+        if estado is not None:
+            estado["error_generacion"] = str(e)
+        yield f"❌ Error al analizar el documento: {e}"
+
+def resumir_conversacion(resumen_anterior, turnos):
+    """
+    Retorna el resumen de la conversación actualizado con los turnos dados
+    (lista de pares (consulta, respuesta)). Los errores se propagan.
+    """
+    texto_turnos = "\n\n".join(f"Usuario: {consulta}\nAsistente: {respuesta}" for consulta, respuesta in turnos)
+    prompt = f"Resumen anterior:\n{resumen_anterior or '(vacío)'}\n\nTurnos nuevos:\n{texto_turnos}"
+    return _cliente.generar(prompt, "resumen").strip()
+
+# Tiempo máximo total (segundos) para obtener los datos de todas las fuentes de productos
+PRODUCT_FETCH_DEADLINE = 10
+
+# Caché de búsquedas de productos (configurable por variables de entorno)
+_product_cache = CacheProductos(
+    ttl=int(config.get("PRODUCT_CACHE_TTL", "3600")),
+    max_entradas=int(config.get("PRODUCT_CACHE_SIZE", "256")),
+    ruta_sqlite=config.get("PRODUCT_CACHE_DB") or None,
+)
+
+def _es_dato_real(datos):
+    """Solo se cachean los datos reales, nunca los simulados de respaldo"""
+    return "Mock" not in datos.get("source", "")
 
-def get_amazon_real_data(search_term, rapidapi_key):
+# Sesión HTTP compartida (keep-alive + pool de conexiones) y pool de hilos para las consultas
+_http_session = None
+_http_session_lock = threading.Lock()
+_product_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="productos")
+
+def _get_http_session():
+    """Retorna la sesión HTTP compartida, creándola la primera vez"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16))
+                _http_session = session
+    return _http_session
+
+def get_amazon_real_data(search_term, rapidapi_key, timeout=PRODUCT_FETCH_DEADLINE):
     """Obtiene datos reales de Amazon usando RapidAPI"""
+    with metricas.span("fetch_amazon"):
+        return _get_amazon_real_data(search_term, rapidapi_key, timeout)
+
+def _get_amazon_real_data(search_term, rapidapi_key, timeout):
     try:
-        import requests
         
         url = "https://amazon-product-reviews-keywords.p.rapidapi.com/product/search"
         
@@ -100,7 +158,7 @@ def get_amazon_real_data(search_term, rapidapi_key):
             "category": "aps"
         }
         
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        response = _get_http_session().get(url, headers=headers, params=params, timeout=timeout)
         
         if response.status_code == 200:
             data = response.json()
@@ -118,16 +176,20 @@ def get_amazon_real_data(search_term, rapidapi_key):
             return {"productos": productos, "source": "Amazon API Real"}
         else:
             print(f"⚠️ Error Amazon API: {response.status_code}")
+            metricas.contar("rapidapi_errores")
             return get_amazon_mock_data(search_term)
             
     except Exception as e:
         print(f"⚠️ Error conectando Amazon API: {e}")
         return get_amazon_mock_data(search_term)
 
-def get_aliexpress_real_data(search_term, rapidapi_key):
+def get_aliexpress_real_data(search_term, rapidapi_key, timeout=PRODUCT_FETCH_DEADLINE):
     """Obtiene datos reales de AliExpress usando RapidAPI"""
+    with metricas.span("fetch_aliexpress"):
+        return _get_aliexpress_real_data(search_term, rapidapi_key, timeout)
+
+def _get_aliexpress_real_data(search_term, rapidapi_key, timeout):
     try:
-        import requests
         
         url = "https://aliexpress-datahub.p.rapidapi.com/item_search"
         
@@ -141,7 +203,7 @@ def get_aliexpress_real_data(search_term, rapidapi_key):
             "page": 1
         }
         
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        response = _get_http_session().get(url, headers=headers, params=params, timeout=timeout)
         
         if response.status_code == 200:
             data = response.json()
@@ -160,6 +222,7 @@ def get_aliexpress_real_data(search_term, rapidapi_key):
             return {"productos": productos, "source": "AliExpress API Real"}
         else:
             print(f"⚠️ Error AliExpress API: {response.status_code}")
+            metricas.contar("rapidapi_errores")
             return get_aliexpress_mock_data(search_term)
             
     except Exception as e:
@@ -186,53 +249,56 @@ def get_aliexpress_mock_data(search_term):
         "source": "AliExpress Mock Data"
     }
 
-def analizar_con_datos_productos(nicho_query):
+def obtener_datos_productos(nicho_query, rapidapi_key, deadline=PRODUCT_FETCH_DEADLINE):
     """
-    Analiza un nicho usando datos reales de productos para dropshipping
+    Obtiene en paralelo los datos de Amazon y AliExpress con un único plazo total.
+    La fuente que no responda a tiempo se sustituye por sus datos simulados.
+    Retorna (amazon_data, aliexpress_data)
+    """
+    if not rapidapi_key:
+        return get_amazon_mock_data(nicho_query), get_aliexpress_mock_data(nicho_query)
+    
+    fuentes = {
+        "Amazon": (get_amazon_real_data, get_amazon_mock_data, "US"),
+        "AliExpress": (get_aliexpress_real_data, get_aliexpress_mock_data, ""),
+    }
+    
+    def consultar(nombre, real, pais):
+        # Las búsquedas frecuentes se sirven desde la caché sin esperar a la red
+        return _product_cache.obtener(
+            nombre, nicho_query, pais,
+            lambda: real(nicho_query, rapidapi_key, deadline),
+            cachear=_es_dato_real,
+        )
+    
+    futuros = {
+        nombre: _product_executor.submit(metricas.en_contexto(consultar), nombre, real, pais)
+        for nombre, (real, _, pais) in fuentes.items()
+    }
+    wait(futuros.values(), timeout=deadline)
+    
+    resultados = []
+    for nombre, (_, mock, _) in fuentes.items():
+        futuro = futuros[nombre]
+        if futuro.done():
+            resultados.append(futuro.result())
+        else:
+            futuro.cancel()
+            print(f"⚠️ {nombre} no respondió en {deadline}s, usando datos simulados")
+            metricas.contar("productos_timeout")
+            resultados.append(mock(nicho_query))
+    return tuple(resultados)
+
+def analizar_productos_stream(prompt, estado=None):
+    """
+    Genera en streaming el análisis de productos a partir de un prompt ya construido
+    (ver prompts.prompt_productos).
+    - estado: como en analizar_documento_solo_texto_stream.
     """
     try:
-        # Configurar la API de Gemini
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        # API Keys
-        rapidapi_key = os.getenv("RAPIDAPI_KEY")
-        
-        # Obtener datos reales de productos
-        amazon_data = get_amazon_real_data(nicho_query, rapidapi_key) if rapidapi_key else get_amazon_mock_data(nicho_query)
-        aliexpress_data = get_aliexpress_real_data(nicho_query, rapidapi_key) if rapidapi_key else get_aliexpress_mock_data(nicho_query)
-        
-        # Crear contexto con datos de productos
-        context = f"""
-        ANÁLISIS DE PRODUCTOS PARA DROPSHIPPING: {nicho_query}
-        
-        DATOS DE AMAZON:
-        {amazon_data}
-        
-        DATOS DE ALIEXPRESS: 
-        {aliexpress_data}
-        """
-        
-        # Prompt especializado para análisis con datos de productos
-        system_message = """Eres GuíaShipping, un experto en análisis de productos para dropshipping.
-        Analiza los datos reales de productos proporcionados y genera un análisis completo que incluya:
-        
-        📊 RESUMEN DEL NICHO (viabilidad, competencia, oportunidades)
-        💰 ANÁLISIS DE PRECIOS (márgenes, comparación plataformas)  
-        🎯 PRODUCTOS DESTACADOS (mejores oportunidades)
-        📈 MÉTRICAS CLAVE (ratings, demanda, reviews)
-        🚀 RECOMENDACIONES (estrategias, próximos pasos)
-        
-        Sé conversacional y da consejos prácticos como un mentor experto."""
-        
-        prompt_completo = f"{system_message}\n\n{context}\n\nAnaliza este nicho para dropshipping."
-        
-        # Generar respuesta
-        model = genai.GenerativeModel("gemini-1.5-flash-8b")
-        response = model.generate_content(prompt_completo)
-        
-        content = response.text
-        print(content)
-        return content
+        yield from _cliente.generar_stream(prompt, "productos")
         
     except Exception as e:
-        return f"❌ Error en análisis con datos de productos: {e}"
+        if estado is not None:
+            estado["error_generacion"] = str(e)
+        yield f"❌ Error en análisis con datos de productos: {e}"
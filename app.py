@@ -1,19 +1,20 @@
 import streamlit as st
-import os
-from documentos import DocumentUploader
-from AI_model import analizar_documento_solo_texto, analizar_con_datos_productos
-from faiss_manager import FAISSManager
-from dotenv import load_dotenv
+import orquestador
+import metricas
+from AI_model import resumir_conversacion
+from memoria import MemoriaConversacion
+from motor_busqueda import obtener_motor
+import config
 import re
 
 # ===== CARGA DE VARIABLES DE ENTORNO =====
-load_dotenv()
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+config.cargar()
+MISTRAL_API_KEY = config.get("MISTRAL_API_KEY")
 if not MISTRAL_API_KEY:
     raise ValueError("⚠️ No se encontró la API Key de Mistral.")
 
-# ===== INSTANCIAR FAISS MANAGER =====
-faiss_manager = FAISSManager(api_key=MISTRAL_API_KEY)
+# Exportar métricas en formato Prometheus si METRICS_PORT está configurado (una vez por proceso)
+metricas.iniciar_servidor()
 
 # ===== CONFIGURACIÓN DE PÁGINA EN STREAMLIT =====
 st.set_page_config(
@@ -23,94 +24,31 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Mensajes del historial que se muestran de una vez; los anteriores se cargan con "Ver mensajes anteriores"
+CHAT_HISTORY_WINDOW = int(config.get("CHAT_HISTORY_WINDOW", "20"))
+
 # ===== INICIALIZACIÓN DE ESTADO DE SESIÓN =====
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "mensajes_visibles" not in st.session_state:
+    st.session_state.mensajes_visibles = CHAT_HISTORY_WINDOW
 if "use_web_search" not in st.session_state:
     st.session_state.use_web_search = "auto"  # auto, si, no
+if "memoria" not in st.session_state:
+    # Últimos turnos literales + resumen de los anteriores, para que el asistente recuerde el contexto
+    st.session_state.memoria = MemoriaConversacion(
+        resumir_conversacion,
+        turnos_recientes=int(config.get("MEMORY_RECENT_TURNS", "4")),
+        max_tokens_resumen=int(config.get("MEMORY_SUMMARY_TOKENS", "250")),
+    )
 
 # Función para limpiar el historial de chat
 def limpiar_chat():
     st.session_state.messages = []
+    st.session_state.mensajes_visibles = CHAT_HISTORY_WINDOW
+    st.session_state.memoria.limpiar()
     # No usar st.rerun() aquí porque no funciona en callbacks
 
-# Función para detectar si una consulta necesita búsqueda web
-def necesita_analisis_productos(mensaje):
-    """Detecta automáticamente si una consulta se beneficiaría de análisis de productos"""
-    palabras_clave_productos = [
-        'nicho', 'nichos', 'producto', 'productos', 'precio', 'precios',
-        'margen', 'ganancia', 'rentable', 'vender', 'dropshipping',
-        'aliexpress', 'amazon', 'competencia', 'proveedor', 'proveedores',
-        'qué vender', 'mejores productos', 'análisis de mercado',
-        'oportunidad', 'saturado', 'demanda', 'tendencia'
-    ]
-    
-    mensaje_lower = mensaje.lower()
-    for palabra in palabras_clave_productos:
-        if palabra in mensaje_lower:
-            return True
-    return False
-
-# Función para obtener respuesta inteligente
-def obtener_respuesta_inteligente(user_message, context=""):
-    """Obtiene respuesta usando la mejor estrategia según el tipo de consulta"""
-    try:
-        # Determinar qué tipo de análisis usar
-        if st.session_state.use_web_search == "productos":
-            # Análisis de productos forzado
-            return analizar_con_datos_productos(user_message), "📊 Análisis con datos de productos"
-                
-        elif st.session_state.use_web_search == "basico":
-            # Sin análisis de productos
-            if context:
-                prompt = f"""Usa el siguiente contexto para responder a la consulta del usuario sobre dropshipping.
-
-Contexto:
-{context}
-
-Consulta:
-{user_message}
-
-Recuerda ser conversacional y amigable, como un mentor experto en e-commerce."""
-            else:
-                prompt = f"""Analiza la siguiente consulta de dropshipping y proporciona información detallada.
-
-Consulta:
-{user_message}
-
-Recuerda ser conversacional y amigable, enfocándote exclusivamente en temas de dropshipping."""
-            
-            return analizar_documento_solo_texto(prompt), "📝 Respuesta básica"
-            
-        else:  # auto
-            # Detección automática
-            if necesita_analisis_productos(user_message):
-                return analizar_con_datos_productos(user_message), "📊 Análisis con datos de productos (detectado automáticamente)"
-            else:
-                # Usar contexto si está disponible
-                if context:
-                    prompt = f"""Usa el siguiente contexto para responder a la consulta del usuario sobre dropshipping.
-
-Contexto:
-{context}
-
-Consulta:
-{user_message}
-
-Recuerda ser conversacional y amigable, como un mentor experto en e-commerce."""
-                else:
-                    prompt = f"""Analiza la siguiente consulta de dropshipping y proporciona información detallada.
-
-Consulta:
-{user_message}
-
-Recuerda ser conversacional y amigable, enfocándote exclusivamente en temas de dropshipping."""
-                
-                return analizar_documento_solo_texto(prompt), "📝 Respuesta del conocimiento base"
-                
-    except Exception as e:
-        return f"❌ Ocurrió un error al procesar tu consulta: {str(e)}", "⚠️ Error"
-
 # ===== DISEÑO EN STREAMLIT (CSS) =====
 st.markdown("""
     <style>
@@ -369,9 +307,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ===== CARGA DEL PDF =====
-doc_uploader = DocumentUploader()
 pdf_path = "DROPSHIPPING.pdf"
-documento_cargado = False
 
 with st.sidebar:
     st.markdown("""
@@ -429,19 +365,19 @@ with st.sidebar:
     
     st.markdown("---")
     
-    # Cargar el documento en segundo plano sin mostrar mensajes
-    if os.path.exists(pdf_path):
-        with open(pdf_path, "rb") as f:
-            doc_uploader.add_document(f)
-        
-        # Crear el índice FAISS a partir del PDF
-        documentos = doc_uploader.get_documents()
-        if documentos:
-            try:
-                faiss_manager.create_faiss_index(documentos)
-                documento_cargado = True
-            except Exception:
-                pass
+    # Obtener el motor de búsqueda compartido (el índice se construye una sola vez por proceso)
+    motor = obtener_motor(pdf_path, MISTRAL_API_KEY)
+    
+    # Panel de depuración: desglose de tiempos de la última consulta
+    if st.checkbox("🛠️ Panel de depuración", value=False):
+        ultima = st.session_state.get("ultima_traza")
+        if ultima is None:
+            st.caption("Aún no hay ninguna consulta.")
+        else:
+            st.markdown(f"**Última consulta:** {ultima['duracion_s']} s ({ultima['atributos'].get('modo', '-')})")
+            st.table([{"etapa": etapa, "segundos": segundos} for etapa, segundos in ultima["spans_s"].items()])
+            if ultima["contadores"]:
+                st.table([{"contador": nombre, "valor": valor} for nombre, valor in ultima["contadores"].items()])
     
     st.markdown("""
     <div class="about-app">
@@ -527,30 +463,60 @@ st.markdown("""
     <div class="chat-messages" id="chat-messages">
 """, unsafe_allow_html=True)
 
-# Mostrar historial de mensajes
-for message in st.session_state.messages:
+# Etiquetas HTML que pueden aparecer en la respuesta: <div>, </div> y cualquier otro "<" o "</"
+_ETIQUETAS = re.compile(r"</?(?:div>?)?")
+
+# Función para generar el HTML de un mensaje del chat
+def renderizar_mensaje(message):
     sender_class = "user-message" if message["role"] == "user" else "assistant-message"
     sender_name = "Tú" if message["role"] == "user" else "Asistente IA"
     
-    # Limpiar contenido de todas las etiquetas HTML que puedan aparecer en la respuesta
-    content = message["content"]
-    content = content.replace("</div>", "").replace("<div>", "")
-    content = content.replace("</div", "").replace("<div", "")
-    content = content.replace("</", "").replace("<", "")
-    content = content.replace("`</div>`", "").replace("`<div>`", "")
+    # Limpiar contenido de todas las etiquetas HTML que puedan aparecer en la respuesta (una sola pasada)
+    content = _ETIQUETAS.sub("", message["content"])
     
     # Mostrar indicador de tipo de respuesta si está disponible
     analysis_type = message.get("analysis_type", "")
     type_indicator = f"<small style='color: #666; font-style: italic;'>{analysis_type}</small><br>" if analysis_type else ""
     
-    st.markdown(f"""
+    return f"""
     <div class="{sender_class}">
         <div class="message-header">
             <span class="message-sender">{sender_name}</span>
             <span class="message-time">{message["time"]}</span>
         </div>
         {type_indicator}{content}
-    """, unsafe_allow_html=True)
+    </div>
+    """
+
+# Función para guardar un mensaje en el historial con su HTML ya generado
+def agregar_mensaje(role, content, time, analysis_type=""):
+    """
+    El HTML se genera y se limpia una sola vez, al guardar el mensaje; en cada recarga
+    de la página solo se reutiliza.
+    """
+    message = {"role": role, "content": content, "time": time, "analysis_type": analysis_type}
+    message["html"] = renderizar_mensaje(message)
+    st.session_state.messages.append(message)
+    return message
+
+def ver_mensajes_anteriores():
+    st.session_state.mensajes_visibles += CHAT_HISTORY_WINDOW
+
+# Mostrar historial de mensajes: solo la ventana de los más recientes, en un único bloque,
+# para que el coste de cada recarga no crezca con la longitud de la conversación
+mensajes = st.session_state.messages
+visibles = mensajes[-st.session_state.mensajes_visibles:]
+if len(mensajes) > len(visibles):
+    st.button(
+        f"⬆️ Ver mensajes anteriores ({len(mensajes) - len(visibles)})",
+        on_click=ver_mensajes_anteriores,
+        key="ver_anteriores",
+    )
+if visibles:
+    st.markdown("".join(message["html"] for message in visibles), unsafe_allow_html=True)
+
+# Zona donde se muestra la respuesta mientras se está generando
+area_respuesta = st.container()
 
 st.markdown("""
     </div>
@@ -575,36 +541,37 @@ if send_clicked and user_message.strip():
     current_time = datetime.now().strftime("%H:%M")
     
     # Guardar mensaje del usuario
-    st.session_state.messages.append({
-        "role": "user",
-        "content": user_message,
-        "time": current_time
-    })
-    
-    # Generar respuesta usando la función inteligente
-    spinner_text = "📊 Analizando productos..." if (st.session_state.use_web_search == "productos" or 
-                   (st.session_state.use_web_search == "auto" and necesita_analisis_productos(user_message))) else "El asistente está pensando..."
-    
-    with st.spinner(spinner_text):
-        context = ""
-        if documento_cargado:
-            try:
-                # Buscar fragmentos relevantes en el documento
-                top_chunks = faiss_manager.search_similar_chunks(user_message, k=2)
-                context = "\n\n".join(top_chunks)
-            except Exception:
-                context = ""
-        
-        # Obtener respuesta usando la función inteligente
-        response, analysis_type = obtener_respuesta_inteligente(user_message, context)
-    
-    # Guardar respuesta del asistente con el tipo de análisis
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": response,
-        "time": datetime.now().strftime("%H:%M"),
-        "analysis_type": analysis_type
-    })
+    mensaje_usuario = agregar_mensaje("user", user_message, current_time)
+    
+    with area_respuesta:
+        st.markdown(mensaje_usuario["html"], unsafe_allow_html=True)
+        placeholder = st.empty()
+    
+    # Enrutado, búsqueda en el documento, caché semántica, datos de productos y generación
+    # (ver orquestador.responder_stream), todo dentro de la traza de la consulta
+    eventos = orquestador.responder_stream(
+        motor, user_message, st.session_state.use_web_search, memoria=st.session_state.memoria
+    )
+    tipo, valor = next(eventos)
+    if tipo == "modo":
+        modo, analysis_type = valor
+        spinner_text = "📊 Analizando productos..." if modo == "productos" else "El asistente está pensando..."
+        with st.spinner(spinner_text):
+            # El spinner se mantiene solo hasta que llega el primer fragmento
+            tipo, valor = next(eventos)
+        mensaje_parcial = {"role": "assistant", "time": datetime.now().strftime("%H:%M"), "analysis_type": analysis_type}
+    
+    # Mostrar la respuesta a medida que se genera
+    response = ""
+    while tipo == "fragmento":
+        response += valor
+        with metricas.span("render"):
+            placeholder.markdown(renderizar_mensaje({**mensaje_parcial, "content": response + "▌"}), unsafe_allow_html=True)
+        tipo, valor = next(eventos)
+    
+    # Guardar respuesta del asistente con el tipo de análisis (la memoria ya la incorpora el orquestador)
+    st.session_state.ultima_traza = valor["traza"]
+    agregar_mensaje("assistant", valor["respuesta"], datetime.now().strftime("%H:%M"), valor["analysis_type"])
     
     # No intentar modificar st.session_state.user_input directamente
     # Recargar para mostrar la nueva conversación
@@ -0,0 +1,372 @@
+# benchmark.py
+#
+# Mide el rendimiento de la ingesta y de las respuestas sin llamar a ninguna API externa:
+# Mistral, Gemini y RapidAPI se sustituyen por clientes simulados con latencia, variación
+# (jitter) y tasa de errores 429 configurables.
+# Uso:
+#   python benchmark.py --sesiones 20 --consultas 5 --salida resultados.json
+#
+# El resultado es un JSON con percentiles de latencia, rendimiento y memoria máxima,
+# pensado para comparar entre commits.
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import AI_model
+import metricas
+import orquestador
+from faiss_manager import FAISSManager
+from memoria import MemoriaConversacion
+from motor_busqueda import MotorBusqueda
+
+VOCABULARIO = (
+    "dropshipping tienda proveedor producto nicho margen envío cliente pedido precio marketing "
+    "anuncios shopify aliexpress amazon devoluciones inventario competencia demanda tendencia "
+    "calidad reseñas logística pago conversión embudo audiencia campaña temporada catálogo"
+).split()
+
+CONSULTAS_BASICAS = [
+    "¿Cómo funciona el dropshipping?",
+    "Pasos para crear una tienda online",
+    "Consejos de marketing para una tienda nueva",
+    "¿Cómo gestiono las devoluciones con el proveedor?",
+    "¿Qué plataforma es mejor para empezar?",
+]
+
+CONSULTAS_PRODUCTOS = [
+    "¿Qué nicho es más rentable para mascotas?",
+    "Análisis de productos de fitness en casa",
+    "Precios de accesorios para móviles en Amazon vs AliExpress",
+    "Margen de ganancia en lámparas LED",
+]
+
+
+class PerfilLatencia:
+    def __init__(self, latencia=0.1, jitter=0.05, tasa_429=0.0, seed=None):
+        """
+        Comportamiento de un servicio simulado.
+        - latencia: segundos medios por llamada.
+        - jitter: variación máxima (uniforme, ±) sobre la latencia.
+        - tasa_429: probabilidad de que una llamada falle por límite de tasa.
+        """
+        self.latencia = latencia
+        self.jitter = jitter
+        self.tasa_429 = tasa_429
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.errores_429 = 0
+
+    def esperar(self, factor=1.0):
+        with self._lock:
+            espera = max(0.0, self.latencia + self._random.uniform(-self.jitter, self.jitter)) * factor
+        time.sleep(espera)
+
+    def falla(self):
+        with self._lock:
+            self.llamadas += 1
+            fallo = self._random.random() < self.tasa_429
+            self.errores_429 += fallo
+            return fallo
+
+    def resumen(self):
+        return {"llamadas": self.llamadas, "errores_429": self.errores_429}
+
+
+class ErrorSimulado(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"Error simulado {status_code}")
+        self.status_code = status_code
+
+
+class _Objeto:
+    def __init__(self, **atributos):
+        self.__dict__.update(atributos)
+
+
+class MistralSimulado:
+    def __init__(self, perfil, dim=1024):
+        """Sustituye a mistralai.Mistral: embeddings deterministas por texto."""
+        self.perfil = perfil
+        self.dim = dim
+        self.embeddings = self
+
+    def create(self, model, inputs):
+        self.perfil.esperar()
+        if self.perfil.falla():
+            raise ErrorSimulado(429)
+        data = []
+        for texto in inputs:
+            rng = np.random.default_rng(zlib.crc32(texto.encode("utf-8")))
+            data.append(_Objeto(embedding=rng.standard_normal(self.dim).astype(np.float32).tolist()))
+        return _Objeto(data=data)
+
+
+class GeminiSimulado:
+    def __init__(self, perfil, fragmentos=20, palabras_por_fragmento=12):
+        """
+        Sustituye a genai.GenerativeModel. La latencia del perfil es la del primer fragmento;
+        el resto llega con una décima parte de esa latencia cada uno.
+        """
+        self.perfil = perfil
+        self.fragmentos = fragmentos
+        self.palabras_por_fragmento = palabras_por_fragmento
+
+    def _fragmentos(self):
+        rng = random.Random()
+        for i in range(self.fragmentos):
+            if i:
+                self.perfil.esperar(0.1)
+            yield _Objeto(text=" ".join(rng.choice(VOCABULARIO) for _ in range(self.palabras_por_fragmento)) + " ")
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        self.perfil.esperar()
+        if self.perfil.falla():
+            raise ErrorSimulado(429)
+        if stream:
+            return self._fragmentos()
+        return _Objeto(text="".join(f.text for f in self._fragmentos()))
+
+
+class RapidAPISimulada:
+    def __init__(self, perfil):
+        """Sustituye a la sesión HTTP de AI_model con respuestas de Amazon y AliExpress."""
+        self.perfil = perfil
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        self.perfil.esperar()
+        if self.perfil.falla():
+            return _Objeto(status_code=429, json=lambda: {})
+        termino = (params or {}).get("keyword") or (params or {}).get("q", "")
+        if "amazon" in url:
+            datos = {"products": [
+                {"title": f"{termino} modelo {i}", "price": f"${10 + i * 5}.99", "rating": 4.2,
+                 "reviews_count": 100 * i, "url": f"https://example.com/{i}"}
+                for i in range(1, 6)
+            ]}
+        else:
+            datos = {"result": {"resultList": [
+                {"subject": f"{termino} lote {i}",
+                 "priceInfo": {"discountPrice": f"{2 + i}.50", "originalPrice": f"{5 + i}.00"},
+                 "tradeInfo": {"sellerOrderCount": 500 * i}, "evalInfo": {"starRating": 4.5},
+                 "logisticsInfo": {"freeshipping": i % 2 == 0}}
+                for i in range(1, 6)
+            ]}}
+        return _Objeto(status_code=200, json=lambda: datos)
+
+
+def instalar_simulados(perfiles, dim):
+    """
+    Sustituye los clientes reales de Gemini y RapidAPI por los simulados.
+    Retorna la función que hay que aplicar a cada FAISSManager para simular Mistral.
+    """
+    gemini = GeminiSimulado(perfiles["gemini"])
+    AI_model._cliente.modelos = {nombre: gemini for nombre in (*AI_model._cliente.instrucciones, None)}
+    AI_model._http_session = RapidAPISimulada(perfiles["rapidapi"])
+    os.environ["RAPIDAPI_KEY"] = "benchmark"
+
+    def simular_mistral(faiss_manager):
+        faiss_manager.mistral_client = MistralSimulado(perfiles["mistral"], dim)
+        return faiss_manager
+    return simular_mistral
+
+
+def documentos_sinteticos(n_documentos, paginas, palabras_por_pagina, seed=0):
+    """Retorna {doc_id: [(página, texto), ...]} con texto aleatorio del vocabulario."""
+    rng = random.Random(seed)
+    documentos = {}
+    for d in range(n_documentos):
+        paginas_doc = []
+        for p in range(1, paginas + 1):
+            frases = []
+            restantes = palabras_por_pagina
+            while restantes > 0:
+                n = min(restantes, rng.randint(8, 20))
+                frases.append(" ".join(rng.choice(VOCABULARIO) for _ in range(n)).capitalize() + ".")
+                restantes -= n
+            paginas_doc.append((p, "\n\n".join(" ".join(frases[i:i + 4]) for i in range(0, len(frases), 4))))
+        documentos[f"doc{d}.pdf"] = paginas_doc
+    return documentos
+
+
+def memoria_maxima_mb():
+    """Memoria residente máxima del proceso (MB), o None si no se puede medir."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(latencias):
+    if not latencias:
+        return {}
+    valores = np.percentile(latencias, [50, 95, 99])
+    return {
+        "p50": round(float(valores[0]), 4),
+        "p95": round(float(valores[1]), 4),
+        "p99": round(float(valores[2]), 4),
+        "media": round(float(np.mean(latencias)), 4),
+        "max": round(float(np.max(latencias)), 4),
+    }
+
+
+def medir_ingesta(simular_mistral, documentos, tipo_indice, directorio):
+    faiss_manager = simular_mistral(FAISSManager(
+        api_key="benchmark", cache_dir=None,
+        embedding_cache_dir=os.path.join(directorio, "embeddings"), index_type=tipo_indice,
+    ))
+    inicio = time.perf_counter()
+    faiss_manager.create_faiss_index(documentos)
+    segundos = time.perf_counter() - inicio
+    chunks = len(faiss_manager.chunks)
+    paginas = sum(len(p) for p in documentos.values())
+    resultado = {
+        "documentos": len(documentos),
+        "paginas": paginas,
+        "chunks": chunks,
+        "segundos": round(segundos, 3),
+        "paginas_por_s": round(paginas / segundos, 1),
+        "chunks_por_s": round(chunks / segundos, 1),
+        "embeddings_por_s": round(faiss_manager.api_embeddings / segundos, 1),
+        "reintentos": faiss_manager.embedding_pipeline.retries,
+        "memoria_max_mb": memoria_maxima_mb(),
+    }
+    return faiss_manager, resultado
+
+
+def medir_consultas(motor, sesiones, consultas_por_sesion, proporcion_productos, seed=0):
+    """
+    Simula sesiones concurrentes; cada una hace sus consultas en secuencia, con su propia memoria.
+    """
+    latencias = {"total": [], "productos": [], "basico": []}
+    errores = 0
+    lock = threading.Lock()
+
+    def sesion(n):
+        nonlocal errores
+        rng = random.Random(seed * 1000 + n)
+        memoria = MemoriaConversacion(AI_model.resumir_conversacion)
+        for i in range(consultas_por_sesion):
+            modo = "productos" if rng.random() < proporcion_productos else "basico"
+            base = rng.choice(CONSULTAS_PRODUCTOS if modo == "productos" else CONSULTAS_BASICAS)
+            # Consultas distintas para no medir solo aciertos de caché
+            consulta = f"{base} (sesión {n}, consulta {i})"
+            inicio = time.perf_counter()
+            respuesta, _ = orquestador.obtener_respuesta_inteligente(motor, consulta, modo, memoria=memoria)
+            segundos = time.perf_counter() - inicio
+            with lock:
+                latencias["total"].append(segundos)
+                latencias[modo].append(segundos)
+                errores += respuesta.startswith("❌")
+
+    reintentos_previos = motor.faiss_manager.embedding_pipeline.retries
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sesiones) as executor:
+        list(executor.map(sesion, range(sesiones)))
+    segundos = time.perf_counter() - inicio
+
+    return {
+        "sesiones": sesiones,
+        "consultas": len(latencias["total"]),
+        "errores": errores,
+        "segundos": round(segundos, 3),
+        "consultas_por_s": round(len(latencias["total"]) / segundos, 2),
+        "reintentos_embeddings": motor.faiss_manager.embedding_pipeline.retries - reintentos_previos,
+        "latencia_s": {modo: percentiles(valores) for modo, valores in latencias.items() if valores},
+        "memoria_max_mb": memoria_maxima_mb(),
+    }
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de GuíaShipping con servicios simulados.")
+    parser.add_argument("--sesiones", type=int, default=10, help="Sesiones concurrentes")
+    parser.add_argument("--consultas", type=int, default=5, help="Consultas por sesión")
+    parser.add_argument("--proporcion-productos", type=float, default=0.5, help="Fracción de consultas de productos")
+    parser.add_argument("--documentos", type=int, default=2)
+    parser.add_argument("--paginas", type=int, default=50, help="Páginas por documento")
+    parser.add_argument("--palabras-por-pagina", type=int, default=300)
+    parser.add_argument("--tipo-indice", default="flat", choices=FAISSManager.INDEX_TYPES)
+    parser.add_argument("--dim", type=int, default=1024, help="Dimensión de los embeddings simulados")
+    for servicio, latencia, jitter in (("mistral", 0.15, 0.05), ("gemini", 0.6, 0.2), ("rapidapi", 0.8, 0.3)):
+        parser.add_argument(f"--{servicio}-latencia", type=float, default=latencia)
+        parser.add_argument(f"--{servicio}-jitter", type=float, default=jitter)
+        parser.add_argument(f"--{servicio}-429", type=float, default=0.0, help="Tasa de errores 429 (0-1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--salida", default=None, help="Fichero JSON de resultados (por defecto, la salida estándar)")
+    args = parser.parse_args(argv)
+
+    perfiles = {
+        servicio: PerfilLatencia(
+            getattr(args, f"{servicio}_latencia"), getattr(args, f"{servicio}_jitter"),
+            getattr(args, f"{servicio}_429"), seed=args.seed + i,
+        )
+        for i, servicio in enumerate(("mistral", "gemini", "rapidapi"))
+    }
+    simular_mistral = instalar_simulados(perfiles, args.dim)
+
+    directorio = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        documentos = documentos_sinteticos(args.documentos, args.paginas, args.palabras_por_pagina, args.seed)
+        faiss_manager, ingesta = medir_ingesta(simular_mistral, documentos, args.tipo_indice, directorio)
+        print(f"Ingesta: {ingesta['chunks']} chunks en {ingesta['segundos']}s", file=sys.stderr)
+
+        motor = MotorBusqueda(faiss_manager, True)
+        motor.preparar()
+        consultas = medir_consultas(motor, args.sesiones, args.consultas, args.proporcion_productos, args.seed)
+        print(f"Consultas: {consultas['consultas']} en {consultas['segundos']}s "
+              f"(p95 {consultas['latencia_s']['total']['p95']}s)", file=sys.stderr)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    resultados = {
+        "commit": _commit_actual(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parametros": vars(args),
+        "ingesta": ingesta,
+        "consultas": consultas,
+        "servicios": {servicio: perfil.resumen() for servicio, perfil in perfiles.items()},
+        # Tiempo medio de cada etapa y contadores (caché, reintentos, tokens) de todo el proceso
+        "etapas_s": {
+            nombre: {"n": h["count"], "media": round(h["sum"] / h["count"], 4)}
+            for nombre, h in metricas.registro.histogramas.items() if h["count"]
+        },
+        "contadores": dict(metricas.registro.contadores),
+    }
+    texto = json.dumps(resultados, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# bm25.py
+
+import heapq
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from perezoso import importar
+
+np = importar("numpy")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Palabras vacías más frecuentes en español (sin tildes, como quedan tras normalizar)
+STOPWORDS = {
+    "a", "al", "algo", "como", "con", "cual", "cuando", "de", "del", "desde", "donde", "e", "el",
+    "ella", "ellos", "en", "entre", "era", "es", "esa", "ese", "eso", "esta", "este", "esto", "fue",
+    "ha", "han", "hay", "la", "las", "le", "les", "lo", "los", "mas", "me", "mi", "muy", "ni", "no",
+    "nos", "o", "para", "pero", "por", "que", "se", "sea", "ser", "si", "sin", "sobre", "son", "su",
+    "sus", "te", "tu", "un", "una", "unas", "uno", "unos", "y", "ya", "yo",
+}
+
+
+def tokenize(text):
+    """Minúsculas, sin tildes y sin palabras vacías."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        """
+        Índice invertido local con puntuación BM25.
+        - postings: término -> {id del chunk: frecuencia del término}
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_len = {}
+        self.total_len = 0
+
+    def add(self, doc_id, text):
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        self.doc_len[doc_id] = len(tokens)
+        self.total_len += len(tokens)
+
+    def remove(self, doc_id, text):
+        """Elimina un chunk; hace falta su texto para saber en qué listas aparece."""
+        if doc_id not in self.doc_len:
+            return
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(doc_id)
+
+    def search(self, query, k=10):
+        """
+        Retorna una lista de pares (id, puntuación) con los k chunks de mayor puntuación BM25.
+        """
+        n = len(self.doc_len)
+        if n == 0:
+            return []
+        avg_len = self.total_len / n
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path):
+        """
+        Guarda el índice en `path` (JSON con los parámetros y el vocabulario) y sus listas de
+        postings en ficheros .npy junto a él, que FrozenBM25Index abre mapeados en memoria.
+        """
+        terms = sorted(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(self.postings[term]) for term in terms])
+        ids = np.empty(offsets[-1], dtype=np.int64)
+        tfs = np.empty(offsets[-1], dtype=np.int32)
+        for row, term in enumerate(terms):
+            docs = sorted(self.postings[term].items())
+            ids[offsets[row]:offsets[row + 1]] = [doc_id for doc_id, _ in docs]
+            tfs[offsets[row]:offsets[row + 1]] = [tf for _, tf in docs]
+        doc_len = np.full(max(self.doc_len, default=-1) + 1, -1, dtype=np.int32)
+        for doc_id, n in self.doc_len.items():
+            doc_len[doc_id] = n
+        _write(path, self.k1, self.b, terms, {"offsets": offsets, "ids": ids, "tfs": tfs, "doc_len": doc_len})
+
+    @classmethod
+    def load(cls, path):
+        """Carga el índice completo en memoria (modificable)."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        if "postings" in data:
+            # Formato anterior: todo en el JSON, que guarda las claves como texto
+            index.postings = {term: {int(i): tf for i, tf in docs.items()} for term, docs in data["postings"].items()}
+            index.doc_len = {int(i): n for i, n in data["doc_len"].items()}
+        else:
+            arrays = _read_arrays(path)
+            offsets, ids, tfs = arrays["offsets"], arrays["ids"], arrays["tfs"]
+            for row, term in enumerate(data["terms"]):
+                start, end = offsets[row], offsets[row + 1]
+                index.postings[term] = dict(zip(ids[start:end].tolist(), tfs[start:end].tolist()))
+            index.doc_len = {int(i): int(n) for i, n in enumerate(arrays["doc_len"]) if n >= 0}
+        index.total_len = sum(index.doc_len.values())
+        return index
+
+    @classmethod
+    def open(cls, path):
+        """
+        Abre el índice guardado en solo lectura con las postings mapeadas en memoria
+        (FrozenBM25Index): no se leen completas y los procesos comparten sus páginas.
+        Los ficheros del formato anterior se cargan completos.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if "postings" in data:
+            return cls.load(path)
+        return FrozenBM25Index(data, _read_arrays(path, mmap_mode="r"))
+
+
+class FrozenBM25Index:
+    def __init__(self, data, arrays):
+        """
+        Índice BM25 de solo lectura sobre listas de postings en formato CSR: las postings del
+        término de la fila i son ids[offsets[i]:offsets[i + 1]] (y sus frecuencias en tfs).
+        doc_len tiene la longitud de cada chunk por id (-1 si el chunk no está en el índice).
+        Solo el vocabulario (término -> fila) se carga en memoria.
+        """
+        self.k1 = data["k1"]
+        self.b = data["b"]
+        self.terms = data["terms"]
+        self.vocab = {term: row for row, term in enumerate(self.terms)}
+        self.arrays = arrays
+        self.offsets = arrays["offsets"]
+        self.ids = arrays["ids"]
+        self.tfs = arrays["tfs"]
+        self.doc_len = arrays["doc_len"]
+        self.n = data["n"]
+        self.total_len = data["total_len"]
+
+    def search(self, query, k=10):
+        """Igual que BM25Index.search."""
+        if self.n == 0:
+            return []
+        avg_len = self.total_len / self.n
+        all_ids, all_scores = [], []
+        for term in set(tokenize(query)):
+            row = self.vocab.get(term)
+            if row is None:
+                continue
+            start, end = self.offsets[row], self.offsets[row + 1]
+            ids = np.asarray(self.ids[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float64)
+            idf = math.log(1 + (self.n - (end - start) + 0.5) / ((end - start) + 0.5))
+            norm = tfs + self.k1 * (1 - self.b + self.b * self.doc_len[ids] / avg_len)
+            all_ids.append(ids)
+            all_scores.append(idf * tfs * (self.k1 + 1) / norm)
+        if not all_ids:
+            return []
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def save(self, path):
+        _write(path, self.k1, self.b, self.terms, self.arrays)
+
+
+ARRAYS = ("offsets", "ids", "tfs", "doc_len")
+
+
+def _array_path(path, name):
+    return f"{os.path.splitext(path)[0]}.{name}.npy"
+
+
+def _read_arrays(path, mmap_mode=None):
+    return {name: np.load(_array_path(path, name), mmap_mode=mmap_mode) for name in ARRAYS}
+
+
+def _write(path, k1, b, terms, arrays):
+    """Escribe los ficheros del índice (cada uno en un temporal que después se renombra; el JSON el último)."""
+    for name in ARRAYS:
+        target = _array_path(path, name)
+        with open(target + ".tmp", "wb") as f:
+            np.save(f, np.asarray(arrays[name]))
+        os.replace(target + ".tmp", target)
+    doc_len = np.asarray(arrays["doc_len"])
+    data = {
+        "k1": k1,
+        "b": b,
+        "n": int((doc_len >= 0).sum()),
+        "total_len": int(doc_len[doc_len >= 0].sum()),
+        "terms": terms,
+    }
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,129 @@
+# cache_productos.py
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import metricas
+
+
+class CacheProductos:
+    def __init__(self, ttl=3600, max_entradas=256, ruta_sqlite=None, max_antiguedad=86400, reloj=time.time):
+        """
+        Caché de búsquedas de productos con política stale-while-revalidate.
+        - ttl: segundos durante los que una entrada se considera fresca.
+        - max_entradas: tamaño máximo en memoria (desalojo LRU).
+        - ruta_sqlite: fichero SQLite opcional para conservar la caché entre reinicios.
+        - max_antiguedad: a partir de esta edad (segundos) una entrada ya no se sirve
+          y la búsqueda se hace de forma bloqueante.
+        - reloj: función que retorna la hora actual en segundos (para las pruebas).
+        """
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.max_antiguedad = max_antiguedad
+        self.reloj = reloj
+        self._entradas = OrderedDict()  # clave -> (marca_de_tiempo, valor)
+        self._lock = threading.Lock()
+        self._refrescando = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-productos")
+
+        self._db = None
+        if ruta_sqlite:
+            self._db = sqlite3.connect(ruta_sqlite, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS productos (clave TEXT PRIMARY KEY, marca REAL, valor TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def clave(fuente, termino, pais=""):
+        """Clave normalizada: (fuente, término en minúsculas y sin espacios extra, país)"""
+        termino = " ".join(termino.lower().split())
+        return f"{fuente.lower()}|{termino}|{pais.upper()}"
+
+    def _leer(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                return entrada
+            if self._db is None:
+                return None
+            fila = self._db.execute(
+                "SELECT marca, valor FROM productos WHERE clave = ?", (clave,)
+            ).fetchone()
+        if fila is None:
+            return None
+        entrada = (fila[0], json.loads(fila[1]))
+        self._guardar_en_memoria(clave, entrada)
+        return entrada
+
+    def _guardar_en_memoria(self, clave, entrada):
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def _guardar(self, clave, valor):
+        entrada = (self.reloj(), valor)
+        self._guardar_en_memoria(clave, entrada)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO productos (clave, marca, valor) VALUES (?, ?, ?)",
+                    (clave, entrada[0], json.dumps(valor, ensure_ascii=False)),
+                )
+                # Limpiar entradas demasiado antiguas para que el fichero no crezca sin límite
+                self._db.execute(
+                    "DELETE FROM productos WHERE marca < ?", (self.reloj() - self.max_antiguedad,)
+                )
+                self._db.commit()
+
+    def _refrescar(self, clave, cargar, cachear):
+        try:
+            valor = cargar()
+            if cachear(valor):
+                self._guardar(clave, valor)
+        except Exception as e:
+            print(f"⚠️ Error refrescando la caché de productos ({clave}): {e}")
+        finally:
+            with self._lock:
+                self._refrescando.discard(clave)
+
+    def _refrescar_en_segundo_plano(self, clave, cargar, cachear):
+        with self._lock:
+            if clave in self._refrescando:
+                return
+            self._refrescando.add(clave)
+        self._executor.submit(self._refrescar, clave, cargar, cachear)
+
+    def obtener(self, fuente, termino, pais, cargar, cachear=lambda valor: True):
+        """
+        Retorna los datos de (fuente, termino, pais).
+        - Si están en caché y frescos, se devuelven directamente.
+        - Si están caducados, se devuelven igualmente y se refrescan en segundo plano.
+        - Si no están (o son demasiado antiguos), se llama a cargar() y se guarda el resultado
+          cuando cachear(resultado) es verdadero.
+        """
+        clave = self.clave(fuente, termino, pais)
+        entrada = self._leer(clave)
+        if entrada is not None:
+            marca, valor = entrada
+            edad = self.reloj() - marca
+            if edad <= self.ttl:
+                metricas.contar("cache_productos_aciertos")
+                return valor
+            if edad <= self.max_antiguedad:
+                metricas.contar("cache_productos_caducados")
+                self._refrescar_en_segundo_plano(clave, cargar, cachear)
+                return valor
+
+        metricas.contar("cache_productos_fallos")
+
+        valor = cargar()
+        if cachear(valor):
+            self._guardar(clave, valor)
+        return valor
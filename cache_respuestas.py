@@ -0,0 +1,99 @@
+# cache_respuestas.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from perezoso import importar
+
+faiss = importar("faiss")
+np = importar("numpy")
+
+
+class CacheRespuestas:
+    def __init__(self, umbral=0.92, ttl=3600, max_entradas=500):
+        """
+        Caché semántica de respuestas del modelo.
+        Guarda (consulta, contexto recuperado, modo) -> respuesta, y reutiliza la respuesta
+        cuando llega una consulta cuyo embedding tiene similitud coseno >= umbral con
+        una consulta anterior del mismo modo y con el mismo contexto.
+        - ttl: segundos que una respuesta se considera válida.
+        - max_entradas: número máximo de respuestas guardadas (desalojo LRU).
+        """
+        self.umbral = umbral
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.index = None
+        self._entradas = OrderedDict()  # id -> dict con los datos de la entrada
+        self._siguiente_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash_contexto(contexto):
+        return hashlib.sha256((contexto or "").encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalizar(query_emb):
+        emb = np.array(query_emb, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(emb)
+        return emb
+
+    def _eliminar(self, ids):
+        for entrada_id in ids:
+            self._entradas.pop(entrada_id, None)
+        self.index.remove_ids(np.array(ids, dtype=np.int64))
+
+    def buscar(self, query_emb, contexto, modo, k=5):
+        """
+        Retorna la respuesta guardada más parecida que cumpla el umbral, o None.
+        """
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return None
+            scores, ids = self.index.search(self._normalizar(query_emb), min(k, self.index.ntotal))
+
+            contexto_hash = self._hash_contexto(contexto)
+            ahora = time.time()
+            caducadas = []
+            respuesta = None
+            for score, entrada_id in zip(scores[0], ids[0]):
+                if entrada_id < 0 or score < self.umbral:
+                    break
+                entrada = self._entradas.get(int(entrada_id))
+                if entrada is None:
+                    continue
+                if ahora - entrada["marca"] > self.ttl:
+                    caducadas.append(int(entrada_id))
+                    continue
+                if entrada["modo"] == modo and entrada["contexto_hash"] == contexto_hash:
+                    self._entradas.move_to_end(int(entrada_id))
+                    respuesta = entrada["respuesta"]
+                    break
+
+            if caducadas:
+                self._eliminar(caducadas)
+            return respuesta
+
+    def guardar(self, query, query_emb, contexto, modo, respuesta):
+        """
+        Guarda una respuesta nueva, desalojando las menos usadas si se supera el tamaño máximo.
+        """
+        emb = self._normalizar(query_emb)
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(emb.shape[1]))
+
+            entrada_id = self._siguiente_id
+            self._siguiente_id += 1
+            self._entradas[entrada_id] = {
+                "query": query,
+                "contexto_hash": self._hash_contexto(contexto),
+                "modo": modo,
+                "respuesta": respuesta,
+                "marca": time.time(),
+            }
+            self.index.add_with_ids(emb, np.array([entrada_id], dtype=np.int64))
+
+            sobrantes = len(self._entradas) - self.max_entradas
+            if sobrantes > 0:
+                self._eliminar(list(self._entradas.keys())[:sobrantes])
@@ -0,0 +1,56 @@
+# chunk_store.py
+
+import os
+from perezoso import importar
+
+np = importar("numpy")
+
+
+class ChunkStore:
+    def __init__(self, path):
+        """
+        Vista de solo lectura de los chunks guardados con ChunkStore.write.
+        - <path>.chunks.bin: texto UTF-8 de todos los chunks, uno detrás de otro.
+        - <path>.offsets.npy: matriz (n, 2) con el inicio y el fin de cada chunk (inicio -1 = eliminado).
+        Ambos ficheros se abren mapeados en memoria: cada chunk se decodifica solo cuando se pide,
+        y varios procesos que abren el mismo fichero comparten las páginas de la caché del sistema.
+        """
+        self.offsets = np.load(path + ".offsets.npy", mmap_mode="r")
+        if os.path.getsize(path + ".chunks.bin") > 0:
+            self.data = np.memmap(path + ".chunks.bin", dtype=np.uint8, mode="r")
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i]
+        if start < 0:
+            return None
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @staticmethod
+    def write(path, chunks):
+        """
+        Escribe los chunks (str o None si está eliminado) en el formato de ChunkStore.
+        """
+        offsets = np.empty((len(chunks), 2), dtype=np.int64)
+        position = 0
+        with open(path + ".chunks.bin.tmp", "wb") as f:
+            for i, chunk in enumerate(chunks):
+                if chunk is None:
+                    offsets[i] = (-1, -1)
+                    continue
+                data = chunk.encode("utf-8")
+                f.write(data)
+                offsets[i] = (position, position + len(data))
+                position += len(data)
+        with open(path + ".offsets.npy.tmp", "wb") as f:
+            np.save(f, offsets)
+        os.replace(path + ".chunks.bin.tmp", path + ".chunks.bin")
+        os.replace(path + ".offsets.npy.tmp", path + ".offsets.npy")
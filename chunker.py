@@ -0,0 +1,116 @@
+# chunker.py
+
+import re
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text):
+    """
+    Cuenta aproximada de tokens: palabras y signos de puntuación.
+    Es suficiente para limitar el tamaño de los chunks sin depender del tokenizador del proveedor.
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+class StructuredChunker:
+    def __init__(self, max_tokens=200, overlap_tokens=30):
+        """
+        Divide el texto en chunks respetando párrafos y frases.
+        - max_tokens: tamaño máximo de cada chunk (en tokens aproximados).
+        - overlap_tokens: tokens de las últimas frases de un chunk que se repiten al inicio del siguiente.
+        """
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens debe ser menor que max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def describe(self):
+        """Descripción de la configuración (forma parte de la clave de caché del índice)."""
+        return f"structured:max={self.max_tokens},overlap={self.overlap_tokens}"
+
+    def _sentences(self, paragraph):
+        """
+        Genera las frases del párrafo; las que superan max_tokens se cortan por palabras.
+        Retorna pares (frase, tokens).
+        """
+        for sentence in _SENTENCE_END_RE.split(paragraph):
+            n = count_tokens(sentence)
+            if n <= self.max_tokens:
+                if n:
+                    yield sentence, n
+                continue
+            words = []
+            words_tokens = 0
+            for word in sentence.split():
+                word_tokens = count_tokens(word)
+                if words and words_tokens + word_tokens > self.max_tokens:
+                    yield " ".join(words), words_tokens
+                    words = []
+                    words_tokens = 0
+                words.append(word)
+                words_tokens += word_tokens
+            if words:
+                yield " ".join(words), words_tokens
+
+    def _overlap(self, buffer):
+        """
+        Últimas frases del buffer que caben en overlap_tokens. Nunca incluye la primera
+        frase, para que el chunk siguiente siempre avance.
+        """
+        tail = []
+        tokens = 0
+        for item in reversed(buffer[1:]):
+            if tokens + item[1] > self.overlap_tokens:
+                break
+            tail.append(item)
+            tokens += item[1]
+        tail.reverse()
+        return tail, tokens
+
+    @staticmethod
+    def _emit(buffer, fresh):
+        # La página del chunk es la de su primera frase nueva (no la del solapamiento)
+        return {"text": " ".join(item[0] for item in buffer), "page": buffer[-fresh][2]}
+
+    def iter_chunks(self, pages):
+        """
+        Generador de chunks {"text": ..., "page": ...}.
+        - pages: texto completo (str) o iterable de pares (número de página, texto).
+          Se consume de forma perezosa, página a página.
+        Un chunk se cierra al llegar a max_tokens o al final de un párrafo si ya
+        ocupa al menos la mitad del tamaño máximo.
+        """
+        if isinstance(pages, str):
+            pages = [(None, pages)]
+
+        buffer = []  # (frase, tokens, página)
+        buffer_tokens = 0
+        fresh = 0  # Frases del buffer que no vienen del solapamiento
+        for page_no, page_text in pages:
+            for paragraph in _PARAGRAPH_RE.split(page_text):
+                paragraph = " ".join(paragraph.split())
+                if not paragraph:
+                    continue
+                for sentence, n in self._sentences(paragraph):
+                    if buffer_tokens + n > self.max_tokens:
+                        if fresh:
+                            yield self._emit(buffer, fresh)
+                            buffer, buffer_tokens = self._overlap(buffer)
+                            fresh = 0
+                        if buffer_tokens + n > self.max_tokens:
+                            # El solapamiento no cabe junto a esta frase
+                            buffer, buffer_tokens = [], 0
+                    buffer.append((sentence, n, page_no))
+                    buffer_tokens += n
+                    fresh += 1
+                # Preferir cortar en los límites de párrafo
+                if fresh and buffer_tokens * 2 >= self.max_tokens:
+                    yield self._emit(buffer, fresh)
+                    buffer, buffer_tokens = self._overlap(buffer)
+                    fresh = 0
+
+        if fresh:
+            yield self._emit(buffer, fresh)
@@ -0,0 +1,72 @@
+# cliente_gemini.py
+
+import threading
+import config
+from perezoso import importar
+
+genai = importar("google.generativeai")
+
+
+class ClienteGemini:
+    def __init__(self, api_key, modelo="gemini-1.5-flash-8b", instrucciones=None,
+                 max_concurrencia=8, timeout=60):
+        """
+        Cliente de Gemini creado una sola vez por proceso.
+        - instrucciones: dict nombre -> instrucciones del sistema. Por cada entrada se crea un
+          modelo con system_instruction, así las instrucciones no se repiten en cada prompt.
+        - max_concurrencia: llamadas simultáneas como máximo; el resto espera su turno.
+        - timeout: segundos máximos por llamada (también el tiempo máximo de espera de turno).
+        La librería de Gemini y los modelos se cargan en la primera llamada; sin api_key se usa
+        GEMINI_API_KEY.
+        """
+        self.api_key = api_key
+        self.modelo = modelo
+        self.instrucciones = instrucciones or {}
+        self.timeout = timeout
+        self._semaforo = threading.BoundedSemaphore(max_concurrencia)
+        self.modelos = None  # nombre -> GenerativeModel, se crean en la primera llamada
+        self._lock = threading.Lock()
+
+    def _obtener_modelo(self, instrucciones):
+        if self.modelos is None:
+            with self._lock:
+                if self.modelos is None:
+                    genai.configure(api_key=self.api_key or config.requerir("GEMINI_API_KEY", "la API Key de Gemini"))
+                    modelos = {
+                        nombre: genai.GenerativeModel(self.modelo, system_instruction=texto)
+                        for nombre, texto in self.instrucciones.items()
+                    }
+                    modelos[None] = genai.GenerativeModel(self.modelo)
+                    self.modelos = modelos
+        return self.modelos[instrucciones]
+
+    def _turno(self):
+        if not self._semaforo.acquire(timeout=self.timeout):
+            raise TimeoutError(f"Gemini está saturado: no hubo turno en {self.timeout}s")
+
+    def generar(self, prompt, instrucciones=None):
+        """Retorna el texto completo de la respuesta."""
+        self._turno()
+        try:
+            response = self._obtener_modelo(instrucciones).generate_content(
+                prompt, request_options={"timeout": self.timeout}
+            )
+            return response.text
+        finally:
+            self._semaforo.release()
+
+    def generar_stream(self, prompt, instrucciones=None):
+        """
+        Generador con los fragmentos de texto a medida que Gemini los genera.
+        El turno se mantiene hasta que termina el stream (o se cierra el generador).
+        """
+        self._turno()
+        try:
+            response = self._obtener_modelo(instrucciones).generate_content(
+                prompt, stream=True, request_options={"timeout": self.timeout}
+            )
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            self._semaforo.release()
@@ -0,0 +1,39 @@
+# config.py
+#
+# Carga la configuración (fichero .env y variables de entorno) una sola vez por proceso.
+# Los módulos leen sus valores con config.get(...) en lugar de llamar cada uno a load_dotenv().
+
+import os
+import threading
+
+_cargada = False
+_lock = threading.Lock()
+
+
+def cargar():
+    """Carga el fichero .env en las variables de entorno (solo la primera vez)."""
+    global _cargada
+    if _cargada:
+        return
+    with _lock:
+        if not _cargada:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _cargada = True
+
+
+def get(nombre, defecto=None):
+    """Valor de la variable de configuración `nombre` (o `defecto` si no está definida)."""
+    cargar()
+    return os.getenv(nombre, defecto)
+
+
+def requerir(nombre, descripcion=None):
+    """
+    Valor de una variable obligatoria. Si falta, lanza ValueError en el momento de usarla
+    (no al importar el módulo que la necesita).
+    """
+    valor = get(nombre)
+    if not valor:
+        raise ValueError(f"No se encontró {descripcion or nombre}. Asegúrate de agregar {nombre} en las variables de entorno.")
+    return valor
@@ -1,34 +1,118 @@
 # documentos.py
 
-from PyPDF2 import PdfReader
+import io
+import os
+import shutil
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import config
+from perezoso import importar
+
+PyPDF2 = importar("PyPDF2")
+
+# PdfReader de cada proceso del pool (se abre una vez por proceso en _init_worker)
+_reader = None
+
+
+def _init_worker(path):
+    global _reader
+    _reader = PyPDF2.PdfReader(path)
+
+
+def _extract_page_range(start, end):
+    """
+    Extrae el texto de las páginas [start, end) del PDF abierto en este proceso del pool.
+    """
+    return [(page_no + 1, _reader.pages[page_no].extract_text() or "") for page_no in range(start, end)]
+
 
 class DocumentUploader:
     def __init__(self):
-        self.documents = []
+        self.pages = []  # Por cada documento, lista de pares (número de página, texto)
+
+    @property
+    def documents(self):
+        """Texto completo de cada documento (se une a partir de sus páginas al pedirlo)."""
+        return ["".join(text for _, text in pages) for pages in self.pages]
 
     def add_document(self, file):
         """Leer documento y guardar su texto (solo PDF)"""
         try:
             if file.name.endswith(".pdf"):
-                text = self._extract_text_from_pdf(file)
+                pages = self._extract_pages_from_pdf(file)
             else:
                 raise ValueError("Formato de archivo no soportado. Solo se permiten archivos PDF.")
-            self.documents.append(text)
+            self.pages.append(pages)
         except Exception as e:
             raise ValueError(f"Error al procesar el archivo {file.name}: {e}")
 
+    def iter_pages(self, file, workers=None, min_parallel_pages=64, pages_per_task=16):
+        """
+        Generador de pares (número de página, texto) de un PDF, sin guardar el documento.
+        - workers: procesos para extraer páginas en paralelo (por defecto PDF_WORKERS, 2). Solo se
+          usan si el PDF tiene al menos min_parallel_pages páginas. Los procesos se crean con
+          "spawn", no con fork: quien llama puede tener hilos (p. ej. el servidor de Streamlit).
+        - pages_per_task: páginas que extrae cada tarea del pool.
+        Las páginas se entregan en orden y como mucho hay 2 * workers tareas pendientes,
+        así que la memoria usada no depende del tamaño del documento.
+        """
+        if not file.name.endswith(".pdf"):
+            raise ValueError(f"Error al procesar el archivo {file.name}: Formato de archivo no soportado. Solo se permiten archivos PDF.")
+
+        workers = workers or int(config.get("PDF_WORKERS", "2"))
+        reader = PyPDF2.PdfReader(file)
+        n_pages = len(reader.pages)
+
+        if workers <= 1 or n_pages < min_parallel_pages:
+            for page_no, page in enumerate(reader.pages, start=1):
+                yield page_no, page.extract_text() or ""
+            return
+
+        # Los procesos abren el PDF por su ruta; si no es un fichero en disco (p. ej. un archivo
+        # subido a Streamlit) se copia una vez a un fichero temporal
+        temp_path = None
+        if isinstance(file, io.BufferedReader) and os.path.exists(file.name):
+            path = file.name
+        else:
+            file.seek(0)
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                shutil.copyfileobj(file, tmp)
+            path = temp_path = tmp.name
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(path,),
+            ) as executor:
+                pending = deque()
+                for start in range(0, n_pages, pages_per_task):
+                    pending.append(executor.submit(_extract_page_range, start, min(start + pages_per_task, n_pages)))
+                    if len(pending) >= 2 * workers:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+        finally:
+            if temp_path is not None:
+                os.remove(temp_path)
+
+    def _extract_pages_from_pdf(self, file):
+        """Extraer el texto de cada página de un archivo PDF (numeradas desde 1)"""
+        return list(self.iter_pages(file, workers=1))
+
     def _extract_text_from_pdf(self, file):
         """Extraer texto de un archivo PDF"""
-        reader = PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text
+        return "".join(text for _, text in self.iter_pages(file, workers=1))
 
     def get_documents(self):
         """Retornar lista de documentos cargados"""
         return self.documents
 
+    def get_document_pages(self):
+        """Retornar, por cada documento cargado, su lista de pares (página, texto)"""
+        return self.pages
+
     def get_concatenated_text(self):
         """Concatenar texto de todos los documentos"""
         return " ".join(self.documents)
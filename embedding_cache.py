@@ -0,0 +1,302 @@
+# embedding_cache.py
+
+import os
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from perezoso import importar
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+np = importar("numpy")
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=".embedding_cache", max_queries=2000, flush_every=1024):
+        """
+        Caché persistente de embeddings indexada por (modelo, hash del texto normalizado).
+        - rows.bin: fichero mapeado en memoria con una fila por vector (clave de 32 bytes + vector
+          float32). La clave guardada en la fila detecta las filas que otro proceso ha reutilizado.
+        - journal.log: registro de solo anexado con la fila de cada clave ("c"/"q" clave fila) y
+          las filas liberadas ("f" fila). Cada put añade solo sus propias líneas.
+        - Varios procesos pueden compartir la carpeta (la app e ingesta.py): las filas se asignan
+          con un bloqueo de fichero (fcntl) y después de leer lo que han añadido los demás.
+        - Las consultas se desalojan con política LRU (max_queries); los chunks se conservan.
+        - flush_every: filas escritas entre cada volcado de los vectores a disco.
+        """
+        self.cache_dir = cache_dir
+        self.max_queries = max_queries
+        self.flush_every = flush_every
+        self.rows_path = os.path.join(cache_dir, "rows.bin")
+        self.journal_path = os.path.join(cache_dir, "journal.log")
+        self.lock_path = os.path.join(cache_dir, "lock")
+        self._lock = threading.RLock()
+        self.rows = None  # np.memmap de forma (capacity,) con los campos "key" y "vector"
+        self._reset()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._file_lock():
+            if not os.path.exists(self.journal_path) and os.path.exists(os.path.join(cache_dir, "index.json")):
+                self._migrate()
+            self._refresh()
+
+    @staticmethod
+    def make_key(model, text):
+        """
+        Clave de caché: hash del modelo y del texto normalizado (Unicode NFC y espacios colapsados).
+        """
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def _reset(self):
+        if self.rows is not None:
+            self.rows.flush()
+        self.dim = None
+        self.capacity = 0      # Filas reservadas en el fichero
+        self.size = 0          # Filas usadas (incluye las liberadas)
+        self.rows = None
+        self.chunk_rows = {}               # clave -> fila
+        self.query_rows = OrderedDict()    # clave -> fila, en orden LRU
+        self.free_rows = set()             # filas liberadas por el desalojo de consultas
+        self._row_keys = {}                # fila -> clave
+        self._records = 0                  # Líneas del journal (para compactarlo)
+        self._offset = 0                   # Bytes del journal ya aplicados
+        self._inode = None
+        self._unflushed = 0
+
+    @contextmanager
+    def _file_lock(self):
+        """Bloqueo exclusivo entre procesos sobre la carpeta de la caché."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _map(self):
+        """(Re)abre el fichero de filas con su tamaño actual."""
+        if self.rows is not None:
+            self.rows.flush()
+            self.rows = None
+        self._dtype = np.dtype([("key", np.uint8, 32), ("vector", np.float32, self.dim)])
+        size = os.path.getsize(self.rows_path) if os.path.exists(self.rows_path) else 0
+        self.capacity = size // self._dtype.itemsize
+        if self.capacity:
+            self.rows = np.memmap(self.rows_path, dtype=self._dtype, mode="r+", shape=(self.capacity,))
+
+    def _grow(self, needed):
+        """
+        Amplía el fichero de filas (al doble) para que quepan al menos `needed` filas.
+        """
+        new_capacity = max(needed, self.capacity * 2, 256)
+        size = new_capacity * self._dtype.itemsize
+        with open(self.rows_path, "ab") as f:
+            if os.fstat(f.fileno()).st_size < size:  # Otro proceso puede haberlo ampliado ya
+                f.truncate(size)
+        self._map()
+
+    def _apply(self, fields):
+        """Aplica una línea del journal al estado en memoria."""
+        op = fields[0]
+        if op == "d":
+            self.dim = int(fields[1])
+            self._map()
+        elif op in ("c", "q"):
+            key, row = fields[1], int(fields[2])
+            old_row = self.chunk_rows.pop(key, None)
+            if old_row is None:
+                old_row = self.query_rows.pop(key, None)
+            if old_row is not None and old_row != row:
+                self._row_keys.pop(old_row, None)
+            self.free_rows.discard(row)
+            self._row_keys[row] = key
+            self.size = max(self.size, row + 1)
+            if op == "c":
+                self.chunk_rows[key] = row
+            else:
+                self.query_rows[key] = row
+        elif op == "f":
+            row = int(fields[1])
+            key = self._row_keys.pop(row, None)
+            if key is not None:
+                self.chunk_rows.pop(key, None)
+                self.query_rows.pop(key, None)
+            self.free_rows.add(row)
+        else:
+            raise ValueError(f"operación desconocida: {op}")
+        self._records += 1
+
+    def _refresh(self):
+        """Aplica las líneas que se han añadido al journal (p. ej. desde otro proceso)."""
+        try:
+            with open(self.journal_path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                inode = stat.st_ino
+                if inode != self._inode or stat.st_size < self._offset:
+                    # Journal nuevo o compactado por otro proceso: se lee desde el principio
+                    self._reset()
+                    self._inode = inode
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1  # Una línea a medio escribir se aplica en la próxima lectura
+        errors = 0
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            try:
+                self._apply(line.split())
+            except (ValueError, IndexError):
+                errors += 1
+        if errors:
+            print(f"⚠️ Caché de embeddings: se ignoran {errors} líneas dañadas del journal.")
+        self._offset += end
+        if self.dim and self.size > self.capacity:
+            self._map()
+
+    def _append(self, lines):
+        if not lines:
+            return
+        data = "".join(line + "\n" for line in lines).encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            f.write(data)
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._offset += len(data)
+
+    def _allocate_row(self):
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.size >= self.capacity:
+            self._grow(self.size + 1)
+        row = self.size
+        self.size += 1
+        return row
+
+    def _write_row(self, row, key, vector):
+        # La clave se anula mientras se escribe el vector: un lector no puede tomarlo por el anterior
+        self.rows["key"][row] = 0
+        self.rows["vector"][row] = vector
+        self.rows["key"][row] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+        self._unflushed += 1
+
+    def _read_row(self, row, key):
+        if row >= self.capacity:
+            return None
+        vector = np.array(self.rows["vector"][row])
+        if self.rows["key"][row].tobytes() != bytes.fromhex(key):
+            return None  # Fila reutilizada por otro proceso
+        return vector
+
+    def _compact(self):
+        """Reescribe el journal solo con las entradas vivas (cuando casi todo son desalojos)."""
+        lines = [f"d {self.dim}"]
+        lines += [f"c {key} {row}" for key, row in self.chunk_rows.items()]
+        lines += [f"q {key} {row}" for key, row in self.query_rows.items()]
+        lines += [f"f {row}" for row in self.free_rows]
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(tmp_path, self.journal_path)
+        self._inode = os.stat(self.journal_path).st_ino
+        self._offset = os.path.getsize(self.journal_path)
+        self._records = len(lines)
+
+    def _migrate(self):
+        """Convierte una caché del formato anterior (index.json + vectors.f32) al actual."""
+        index_path = os.path.join(self.cache_dir, "index.json")
+        vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["dim"]:
+                vectors = np.memmap(vectors_path, dtype=np.float32, mode="r").reshape(-1, data["dim"])
+                entries = [("c", k, row) for k, row in data["chunks"].items()]
+                entries += [("q", k, row) for k, row in data["queries"]]
+                lines = [f"d {data['dim']}"]
+                self._apply(lines[0].split())
+                for op, key, old_row in entries:
+                    row = self._allocate_row()
+                    self._write_row(row, key, vectors[old_row])
+                    lines.append(f"{op} {key} {row}")
+                    self._apply(lines[-1].split())
+                self.flush()
+                self._append(lines)
+                del vectors
+        except Exception as e:
+            print(f"⚠️ Caché de embeddings dañada, se descarta: {e}")
+        self._reset()
+        for path in (index_path, vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def get(self, keys):
+        """
+        Retorna una lista con el vector de cada clave, o None si no está en caché.
+        """
+        results = []
+        with self._lock:
+            self._refresh()
+            for key in keys:
+                row = self.chunk_rows.get(key)
+                if row is None:
+                    row = self.query_rows.get(key)
+                    if row is not None:
+                        self.query_rows.move_to_end(key)
+                results.append(None if row is None else self._read_row(row, key))
+        return results
+
+    def put(self, keys, vectors, kind="chunk"):
+        """
+        Guarda los vectores dados. kind es "chunk" (permanente) o "query" (LRU).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        op = "c" if kind == "chunk" else "q"
+        with self._lock, self._file_lock():
+            self._refresh()
+            lines = []
+            if self.dim is None:
+                lines.append(f"d {vectors.shape[1]}")
+                self._apply(lines[-1].split())
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensión de embedding inesperada: {vectors.shape[1]} != {self.dim}")
+
+            for key, vector in zip(keys, vectors):
+                if key in self.chunk_rows:
+                    continue
+                row = self.query_rows.get(key)
+                if row is not None and kind != "chunk":
+                    self.query_rows.move_to_end(key)
+                    continue
+                if row is None:
+                    row = self._allocate_row()
+                    self._write_row(row, key, vector)
+                lines.append(f"{op} {key} {row}")
+                self._apply(lines[-1].split())
+
+            # Desalojar las consultas menos usadas recientemente
+            while len(self.query_rows) > self.max_queries:
+                row = next(iter(self.query_rows.values()))
+                lines.append(f"f {row}")
+                self._apply(lines[-1].split())
+
+            self._append(lines)
+            if self._unflushed >= self.flush_every:
+                self.flush()
+            if self._records > 4 * (len(self.chunk_rows) + len(self.query_rows)) + 4096:
+                self._compact()
+
+    def flush(self):
+        """Vuelca a disco los vectores escritos."""
+        with self._lock:
+            if self.rows is not None:
+                self.rows.flush()
+            self._unflushed = 0
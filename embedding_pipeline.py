@@ -0,0 +1,136 @@
+# embedding_pipeline.py
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metricas
+from perezoso import importar
+
+np = importar("numpy")
+
+
+class RetryableError(Exception):
+    """Error temporal del proveedor (429 o 5xx): el lote se puede reintentar."""
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        """
+        Limitador de tasa tipo token bucket.
+        - rate: tokens que se recuperan por segundo.
+        - capacity: máximo de tokens acumulables (ráfaga permitida).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n=1):
+        """Bloquea hasta que haya n tokens disponibles y los consume."""
+        n = min(n, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingPipeline:
+    def __init__(self, request_fn, max_workers=4, requests_per_second=2.0, tokens_per_minute=500000,
+                 max_tokens_per_batch=16000, max_texts_per_batch=128, max_retries=5,
+                 base_delay=1.0, max_delay=30.0):
+        """
+        Pipeline de embeddings por lotes en paralelo con control de la cuota del proveedor.
+        - request_fn: función que recibe una lista de textos y retorna un np.array de embeddings
+          (una sola llamada a la API). Debe lanzar RetryableError en los errores temporales.
+        - max_workers: lotes que se envían en paralelo.
+        - requests_per_second / tokens_per_minute: cuota del proveedor.
+        - max_tokens_per_batch / max_texts_per_batch: límites de tamaño de cada petición.
+        - max_retries, base_delay, max_delay: reintentos por lote con backoff exponencial y jitter.
+        """
+        self.request_fn = request_fn
+        self.max_workers = max_workers
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.max_texts_per_batch = max_texts_per_batch
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_bucket = TokenBucket(requests_per_second, max(1, max_workers))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60.0, max_tokens_per_batch)
+        self.retries = 0  # Reintentos acumulados (útil para métricas)
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Estimación conservadora de tokens (~3 caracteres por token)."""
+        return max(1, len(text) // 3)
+
+    def make_batches(self, texts):
+        """
+        Agrupa los textos en lotes consecutivos que respeten los límites de tokens y de textos.
+        Retorna una lista de pares (inicio, fin).
+        """
+        batches = []
+        start = 0
+        tokens = 0
+        for i, text in enumerate(texts):
+            n = self.estimate_tokens(text)
+            if i > start and (tokens + n > self.max_tokens_per_batch or i - start >= self.max_texts_per_batch):
+                batches.append((start, i))
+                start = i
+                tokens = 0
+            tokens += n
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def _run_batch(self, batch):
+        tokens = sum(self.estimate_tokens(t) for t in batch)
+        attempt = 0
+        while True:
+            self.request_bucket.acquire()
+            self.token_bucket.acquire(tokens)
+            try:
+                return self.request_fn(batch)
+            except RetryableError as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise Exception("Se alcanzó el máximo de reintentos debido a la tasa de solicitudes.") from e
+                self.retries += 1
+                metricas.contar("reintentos_embeddings")
+                # Backoff exponencial con jitter completo
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                print(f"⚠️ {e}. Reintentando lote en {delay:.1f} segundos...")
+                time.sleep(delay)
+
+    def embed(self, texts, on_batch=None):
+        """
+        Genera los embeddings de todos los textos y los retorna en el orden original.
+        - on_batch(inicio, fin, embeddings): callback opcional llamado al terminar cada lote.
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        batches = self.make_batches(texts)
+
+        def run(bounds):
+            start, end = bounds
+            result = self._run_batch(texts[start:end])
+            if on_batch is not None:
+                on_batch(start, end, result)
+            return result
+
+        if len(batches) == 1:
+            results = [run(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                results = list(executor.map(run, batches))
+
+        return np.concatenate(results, axis=0).astype(np.float32, copy=False)
@@ -0,0 +1,153 @@
+# enrutador.py
+
+import threading
+import metricas
+from bm25 import tokenize
+from perezoso import importar
+
+np = importar("numpy")
+
+# Señales léxicas claras de cada intención (términos ya normalizados con bm25.tokenize).
+# "dropshipping", "producto" o "proveedor" no están: aparecen en casi cualquier consulta.
+SENALES_PRODUCTOS = {
+    "nicho", "nichos", "rentable", "rentables", "rentabilidad", "margen", "margenes", "ganancia",
+    "ganancias", "precio", "precios", "amazon", "aliexpress", "competencia", "demanda", "tendencia",
+    "tendencias", "saturado", "saturados", "vender", "venden", "bestseller",
+}
+SENALES_BASICO = {
+    "funciona", "pasos", "crear", "configurar", "marketing", "publicidad", "anuncios", "seo",
+    "devoluciones", "devolucion", "legal", "impuestos", "gestionar", "gestion", "atencion",
+    "shopify", "woocommerce", "consejos", "empezar", "definicion", "significa", "envios",
+}
+
+# Consultas de ejemplo de cada intención; sus centroides son los prototipos de la comparación vectorial
+EJEMPLOS = {
+    "productos": [
+        "¿Qué nicho es más rentable?",
+        "Análisis de productos para mascotas",
+        "Mejores productos para dropshipping",
+        "¿Qué precios manejan en Amazon vs AliExpress?",
+        "Análisis de competencia en accesorios de cocina",
+        "Margen de ganancia en relojes inteligentes",
+        "¿Qué puedo vender en verano?",
+        "¿Está saturado el nicho de fundas de móvil?",
+        "Productos en tendencia para el hogar",
+        "¿Cuánto cuesta un masajeador en AliExpress?",
+    ],
+    "basico": [
+        "¿Cómo funciona el dropshipping?",
+        "Pasos para crear una tienda",
+        "Consejos de marketing general",
+        "Gestión de proveedores",
+        "¿Cómo manejo las devoluciones?",
+        "¿Qué necesito legalmente para empezar?",
+        "¿Shopify o WooCommerce?",
+        "¿Cómo mejoro la atención al cliente?",
+        "¿Qué es un proveedor de dropshipping?",
+        "Cómo hacer anuncios en redes sociales",
+    ],
+}
+
+
+class EnrutadorIntencion:
+    def __init__(self, embed, ejemplos=EJEMPLOS, margen=0.03, timeout=3):
+        """
+        Decide si una consulta necesita datos de productos ("productos") o no ("basico").
+        - embed: función (lista de textos, timeout=None) -> np.array de embeddings; con timeout
+          lanza TimeoutError si no llega a tiempo (solo se usa en los casos ambiguos).
+        - ejemplos: dict intención -> consultas de ejemplo para calcular los prototipos.
+        - margen: diferencia mínima de similitud con el prototipo de productos para elegirlo;
+          ante la duda se usa el camino básico, que es el barato.
+        - timeout: segundos máximos para el embedding de la consulta.
+        Los prototipos se calculan con preparar() al construir el motor, no durante una consulta.
+        """
+        self.embed = embed
+        self.ejemplos = ejemplos
+        self.margen = margen
+        self.timeout = timeout
+        self.prototipos = None  # intención -> centroide normalizado
+        self._lock = threading.Lock()
+        self._preparando = False
+
+    @staticmethod
+    def prefiltro(consulta):
+        """
+        Clasificación léxica: retorna "productos" o "basico" si solo hay señales de una
+        intención, o None si no hay ninguna o hay de ambas.
+        """
+        terminos = set(tokenize(consulta))
+        productos = bool(terminos & SENALES_PRODUCTOS)
+        basico = bool(terminos & SENALES_BASICO)
+        if productos != basico:
+            return "productos" if productos else "basico"
+        return None
+
+    @staticmethod
+    def _normalizar(vectores):
+        normas = np.linalg.norm(vectores, axis=-1, keepdims=True)
+        return vectores / np.maximum(normas, 1e-12)
+
+    def preparar(self):
+        """
+        Calcula los prototipos de cada intención (una llamada a la API con todos los ejemplos).
+        Se llama al construir el motor; si falla, el enrutador usa el camino básico y lo
+        reintenta en segundo plano con la siguiente consulta ambigua.
+        """
+        with self._lock:
+            if self.prototipos is not None:
+                return
+            intenciones = list(self.ejemplos)
+            textos = [t for i in intenciones for t in self.ejemplos[i]]
+            vectores = self._normalizar(np.asarray(self.embed(textos), dtype=np.float32))
+            prototipos = {}
+            inicio = 0
+            for intencion in intenciones:
+                fin = inicio + len(self.ejemplos[intencion])
+                prototipos[intencion] = self._normalizar(vectores[inicio:fin].mean(axis=0))
+                inicio = fin
+            self.prototipos = prototipos
+
+    def _preparar_en_segundo_plano(self):
+        with self._lock:
+            if self._preparando or self.prototipos is not None:
+                return
+            self._preparando = True
+
+        def preparar():
+            try:
+                self.preparar()
+            except Exception as e:
+                print(f"⚠️ No se pudieron calcular los prototipos del enrutador: {e}")
+            finally:
+                self._preparando = False
+
+        threading.Thread(target=metricas.en_contexto(preparar), name="enrutador", daemon=True).start()
+
+    def _vectorial(self, consulta):
+        vector = self._normalizar(np.asarray(self.embed([consulta], timeout=self.timeout), dtype=np.float32)[0])
+        similitudes = {intencion: float(vector @ p) for intencion, p in self.prototipos.items()}
+        if similitudes["productos"] - similitudes["basico"] > self.margen:
+            return "productos"
+        return "basico"
+
+    def clasificar(self, consulta):
+        """Retorna "productos" o "basico"."""
+        modo = self.prefiltro(consulta)
+        if modo is not None:
+            metricas.contar("enrutador_lexico")
+            return modo
+
+        if self.prototipos is None:
+            # Sin prototipos no se espera a calcularlos en la consulta
+            metricas.contar("enrutador_sin_prototipos")
+            self._preparar_en_segundo_plano()
+            return "basico"
+
+        metricas.contar("enrutador_vectorial")
+        try:
+            return self._vectorial(consulta)
+        except TimeoutError:
+            print(f"⚠️ El enrutador no obtuvo el embedding en {self.timeout}s, se usa la respuesta básica.")
+        except Exception as e:
+            print(f"⚠️ Error en el enrutador: {e}")
+        return "basico"
@@ -1,133 +1,850 @@
 # faiss_manager.py
 
-import faiss
-import numpy as np
-from mistralai import Mistral
 import os
-from dotenv import load_dotenv
+import json
+import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from embedding_cache import EmbeddingCache
+from bm25 import BM25Index
+from chunker import StructuredChunker
+from chunk_store import ChunkStore
+from embedding_pipeline import EmbeddingPipeline, RetryableError
+import metricas
+import config
+from perezoso import importar
+
+# Dependencias pesadas: se importan la primera vez que se usan
+faiss = importar("faiss")
+np = importar("numpy")
+mistralai = importar("mistralai")
 
-load_dotenv()
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 
 class FAISSManager:
-    def __init__(self, api_key):
+    INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+    MAX_TRAIN = 100000  # Vectores máximos de la muestra de entrenamiento de IVF/PQ
+    PQ_NBITS = 8        # Bits de cada código PQ (2^8 centroides por subvector)
+    MIN_PQ_NBITS = 4    # Con menos vectores de los que necesitan 2^4 centroides se usa un índice exacto
+    SEARCH_MODES = ("dense", "hybrid", "lexical")
+
+    def __init__(self, api_key, cache_dir=".faiss_cache", embedding_cache_dir=".embedding_cache",
+                 index_type="flat", nlist=1024, pq_m=16, hnsw_m=32, nprobe=16, ef_search=64, chunker=None):
         """
         Inicializa el FAISS Manager con la API Key de Mistral.
+        - chunker: objeto con iter_chunks(pages) y describe() (por defecto StructuredChunker).
+        - cache_dir: carpeta donde se guardan los índices ya construidos (None para desactivar).
+        - embedding_cache_dir: carpeta de la caché de embeddings (None para desactivar).
+        - index_type: "flat" (búsqueda exacta), "ivf_flat", "hnsw" o "ivf_pq" (búsqueda aproximada).
+        - nlist, pq_m, hnsw_m: parámetros de construcción de los índices IVF, PQ y HNSW.
+        - nprobe, ef_search: parámetros de búsqueda de los índices IVF y HNSW.
         """
-        self.mistral_client = Mistral(api_key=MISTRAL_API_KEY)  # Inicializa el cliente de Mistral con la API Key de Mistral
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Tipo de índice no soportado: {index_type}. Opciones: {', '.join(self.INDEX_TYPES)}")
+        self.api_key = api_key
+        self._mistral_client = None  # Cliente de Mistral (se crea en la primera llamada a la API)
         self.index = None
-        self.chunks = []  # Guardamos el texto de cada chunk
+        self.chunks = []  # Guardamos el texto de cada chunk (su posición es su id en el índice; None = eliminado)
+        self.chunk_pages = []  # Página de origen de cada chunk (None si se desconoce)
+        self._mmap_path = None  # Ruta del índice abierto en modo mapeado en memoria (solo lectura)
+        self.bm25 = None        # Índice léxico (se construye o se carga al primer uso)
+        self._bm25_path = None  # Fichero del índice léxico guardado junto al índice cargado
+        # Embeddings de consultas con plazo: un hilo por consulta concurrente esperada, para que
+        # las llamadas lentas (que siguen en segundo plano tras su plazo) no dejen sin hilos al resto
+        self._query_executor = ThreadPoolExecutor(
+            max_workers=int(config.get("QUERY_EMBED_WORKERS", "16")), thread_name_prefix="query-embeddings"
+        )
+        self._inflight = {}  # consultas -> (future, evento de inicio, [instante de inicio])
+        self._inflight_lock = threading.Lock()
+        self.documents = {}  # doc_id -> {"hash": hash del contenido, "ids": ids de sus chunks}
+        self.removed = 0  # Chunks eliminados pendientes de compactar
+        self.stale = 0    # Vectores de chunks eliminados que siguen en el índice (HNSW no permite borrar)
+        self.index_type = index_type
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.hnsw_m = hnsw_m
+        self.nprobe = nprobe
+        self.ef_search = ef_search
         self.dim = None   # Dimensión de embeddings (se define tras la primera llamada)
+        self.embedding_model = "mistral-embed"
+        self.chunker = chunker or StructuredChunker()
+        self.cache_dir = cache_dir
+        self.embedding_cache = EmbeddingCache(embedding_cache_dir) if embedding_cache_dir else None
+        self.api_embeddings = 0  # Textos enviados a la API de embeddings (los aciertos de caché no cuentan)
+        self.ingest_batch_size = int(config.get("INGEST_BATCH_SIZE", "512"))  # Chunks por lote al indexar
+        # Lotes en paralelo respetando la cuota de la API de Mistral
+        self.embedding_pipeline = EmbeddingPipeline(
+            self._request_embeddings,
+            max_workers=int(config.get("MISTRAL_EMBED_WORKERS", "4")),
+            requests_per_second=float(config.get("MISTRAL_EMBED_RPS", "2")),
+            tokens_per_minute=int(config.get("MISTRAL_EMBED_TPM", "500000")),
+        )
 
-    def chunk_text(self, text, max_length=2048):
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + max_length
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start = end
-        return chunks
+    @property
+    def mistral_client(self):
+        if self._mistral_client is None:
+            self._mistral_client = mistralai.Mistral(api_key=self.api_key or config.get("MISTRAL_API_KEY"))
+        return self._mistral_client
+
+    @mistral_client.setter
+    def mistral_client(self, client):
+        self._mistral_client = client
+
+    def chunk_text(self, text):
+        """
+        Divide un texto (o un iterable de pares (página, texto)) en chunks usando el chunker configurado.
+        Retorna una lista de dicts {"text": ..., "page": ...}.
+        """
+        return list(self.chunker.iter_chunks(text))
 
-    def generate_embeddings(self, texts):
+    def generate_embeddings(self, texts, kind="chunk"):
         """
         Genera embeddings usando Mistral (modelo mistral-embed).
+        Solo se envían a la API los textos que no están en la caché de embeddings.
         Parámetros:
         - texts: lista de strings.
+        - kind: "chunk" para fragmentos de documentos o "query" para consultas (caché LRU).
         Retorna:
         - np.array de forma (len(texts), embedding_dim)
         """
-        retries = 0
-        max_retries = 5
-        delay = 2  # Pausa inicial de 2 segundos
+        with metricas.span("embed"):
+            return self._generate_embeddings(texts, kind)
 
-        while retries < max_retries:
-            try:
-                response = self.mistral_client.embeddings.create(
-                    model="mistral-embed",
-                    inputs=texts
+    def _generate_embeddings(self, texts, kind):
+        if self.embedding_cache is None:
+            self.api_embeddings += len(texts)
+            metricas.contar("embeddings_api", len(texts))
+            return self.embedding_pipeline.embed(texts)
+
+        keys = [EmbeddingCache.make_key(self.embedding_model, t) for t in texts]
+        results = self.embedding_cache.get(keys)
+
+        # Textos que faltan (sin duplicados dentro del lote)
+        missing = {}
+        for i, vector in enumerate(results):
+            if vector is None and keys[i] not in missing:
+                missing[keys[i]] = i
+        metricas.contar("embeddings_cache_aciertos", sum(v is not None for v in results))
+
+        if missing:
+            missing_keys = list(missing.keys())
+            self.api_embeddings += len(missing_keys)
+            metricas.contar("embeddings_api", len(missing_keys))
+            # Cada lote se guarda en la caché en cuanto termina, así un fallo no pierde lo ya generado
+            new_embeddings = self.embedding_pipeline.embed(
+                [texts[missing[k]] for k in missing_keys],
+                on_batch=lambda start, end, emb: self.embedding_cache.put(missing_keys[start:end], emb, kind=kind),
+            )
+            new_by_key = dict(zip(missing_keys, new_embeddings))
+            results = [new_by_key[keys[i]] if v is None else v for i, v in enumerate(results)]
+
+        return np.array(results, dtype=np.float32)
+
+    def embed_queries(self, queries, timeout=None):
+        """
+        Embeddings de consultas (caché LRU) con un plazo opcional.
+        - Las llamadas en curso se comparten: si la búsqueda ya pidió el embedding de la consulta,
+          la caché semántica o el enrutador esperan a esa misma llamada en lugar de repetirla.
+        - timeout: segundos desde que la llamada empieza a ejecutarse (el tiempo esperando un
+          hilo libre tiene su propio límite igual). Si se supera lanza TimeoutError; la llamada
+          sigue en segundo plano y su resultado queda en la caché de embeddings.
+        Retorna un np.array (una copia: el llamador puede modificarlo).
+        """
+        queries = tuple(queries)
+        with self._inflight_lock:
+            entry = self._inflight.get(queries)
+            if entry is None:
+                started = threading.Event()
+                start = []
+
+                def call():
+                    start.append(time.monotonic())
+                    started.set()
+                    return self.generate_embeddings(list(queries), kind="query")
+
+                future = self._query_executor.submit(metricas.en_contexto(call))
+                entry = self._inflight[queries] = (future, started, start)
+                future.add_done_callback(lambda _: self._forget_inflight(queries, entry))
+        future, started, start = entry
+
+        if timeout is None:
+            return np.array(future.result())
+        if not started.wait(timeout):
+            raise TimeoutError(f"El embedding de la consulta no empezó en {timeout}s (sin hilos libres)")
+        try:
+            return np.array(future.result(timeout=max(0.0, timeout - (time.monotonic() - start[0]))))
+        except FutureTimeoutError:
+            raise TimeoutError(f"El embedding de la consulta tardó más de {timeout}s")
+
+    def _forget_inflight(self, queries, entry):
+        with self._inflight_lock:
+            if self._inflight.get(queries) is entry:
+                del self._inflight[queries]
+
+    def _request_embeddings(self, texts):
+        """
+        Hace una única llamada a la API de Mistral para obtener los embeddings de los textos dados.
+        Los errores temporales (429 y 5xx) se lanzan como RetryableError para que
+        el pipeline reintente el lote.
+        """
+        try:
+            response = self.mistral_client.embeddings.create(
+                model=self.embedding_model,
+                inputs=texts
+            )
+        except Exception as e:
+            status = getattr(e, "status_code", None)
+            if status is None:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+            if status == 401:
+                raise Exception("Error de autenticación: Verifica tu API Key de Mistral.")
+            if status == 429 or (status is not None and status >= 500):
+                raise RetryableError(f"Error temporal de la API de Mistral ({status})")
+            raise
+
+        if hasattr(response, "data") and response.data:
+            embeddings_list = [item.embedding for item in response.data]
+        else:
+            raise Exception(f"Error al obtener embeddings: {response}")
+
+        return np.array(embeddings_list, dtype=np.float32)
+
+    def cache_key(self, source_bytes):
+        """
+        Calcula la clave de caché a partir de los bytes del documento fuente,
+        los parámetros de chunking y el modelo de embeddings.
+        """
+        h = hashlib.sha256()
+        h.update(source_bytes)
+        h.update(f"|chunker={self.chunker.describe()}|model={self.embedding_model}|format=4".encode("utf-8"))
+        h.update(f"|index={self.index_type},{self.nlist},{self.pq_m},{self.hnsw_m}".encode("utf-8"))
+        return h.hexdigest()
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def save_index(self, path):
+        """
+        Guarda el índice en disco:
+        - <path>.index: índice FAISS.
+        - <path>.chunks.bin y <path>.offsets.npy: texto de los chunks (ver ChunkStore).
+        - <path>.pages.npy: página de cada chunk (-1 si se desconoce).
+        - <path>.json: dimensión, documentos y contadores.
+        """
+        if self.index is None:
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Escribir a un temporal y renombrar para no dejar cachés a medias
+        faiss.write_index(self.index, path + ".index.tmp")
+        ChunkStore.write(path, self.chunks)
+        pages = np.array([-1 if page is None else page for page in self.chunk_pages], dtype=np.int32)
+        with open(path + ".pages.npy.tmp", "wb") as f:
+            np.save(f, pages)
+        with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "documents": self.documents,
+                       "removed": self.removed, "stale": self.stale}, f, ensure_ascii=False)
+        os.replace(path + ".index.tmp", path + ".index")
+        os.replace(path + ".pages.npy.tmp", path + ".pages.npy")
+        self.get_bm25().save(path + ".bm25.json")
+        os.replace(path + ".json.tmp", path + ".json")
+
+    def load_index(self, path, mmap=True):
+        """
+        Carga un índice guardado con save_index. Retorna True si se pudo cargar.
+        Con mmap=True el índice FAISS y los chunks se abren mapeados en memoria: el arranque
+        no lee los ficheros completos y los procesos que cargan el mismo índice comparten
+        la memoria. Antes de modificar el índice se carga automáticamente en memoria.
+        """
+        required = [".index", ".json", ".chunks.bin", ".offsets.npy", ".pages.npy"]
+        if not all(os.path.exists(path + ext) for ext in required):
+            return False
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if mmap:
+                self.index = faiss.read_index(path + ".index", self._mmap_flags())
+                self.chunks = ChunkStore(path)
+                self.chunk_pages = np.load(path + ".pages.npy", mmap_mode="r")
+                self._mmap_path = path
+            else:
+                self.index = faiss.read_index(path + ".index")
+                self.chunks = list(ChunkStore(path))
+                self.chunk_pages = [None if page < 0 else int(page) for page in np.load(path + ".pages.npy")]
+                self._mmap_path = None
+            self.bm25 = None
+            self._bm25_path = path + ".bm25.json" if os.path.exists(path + ".bm25.json") else None
+            self.documents = data.get("documents", {})
+            self.removed = data.get("removed", 0)
+            self.stale = data.get("stale", 0)
+            self.dim = data["dim"]
+            self.set_search_params()
+            return True
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar el índice en caché ({path}): {e}")
+            self.reset_index()
+            return False
+
+    @staticmethod
+    def _mmap_flags():
+        """
+        Flags de faiss.read_index para abrir el índice mapeado en memoria.
+        IO_FLAG_MMAP_IFC (faiss >= 1.10) mapea los índices flat y HNSW además de las listas IVF,
+        pero no se puede combinar con IO_FLAG_MMAP ni IO_FLAG_READ_ONLY: con ellos los índices
+        IVF no se pueden leer. En versiones anteriores solo se mapean las listas IVF.
+        """
+        return getattr(faiss, "IO_FLAG_MMAP_IFC", None) or faiss.IO_FLAG_MMAP
+
+    def _ensure_writable(self):
+        """
+        Si el índice está mapeado en memoria (solo lectura), lo carga completo para poder modificarlo.
+        El índice léxico guardado también se carga completo, para que reciba los cambios y no
+        se vuelva a guardar desactualizado.
+        """
+        if self._bm25_path is not None and not isinstance(self.bm25, BM25Index):
+            self.bm25 = BM25Index.load(self._bm25_path)
+        if self._mmap_path is None:
+            return
+        self.index = faiss.read_index(self._mmap_path + ".index")
+        self.chunks = list(self.chunks)
+        self.chunk_pages = [None if page < 0 else int(page) for page in self.chunk_pages]
+        self._mmap_path = None
+        self.set_search_params()
+
+    def get_bm25(self):
+        """
+        Retorna el índice léxico BM25, cargándolo del disco o construyéndolo a partir de los chunks
+        la primera vez que se necesita. Con el índice mapeado en memoria, las postings guardadas
+        también se mapean (solo lectura, compartidas entre procesos).
+        """
+        if self.bm25 is None:
+            if self._bm25_path is not None and self._mmap_path is not None:
+                self.bm25 = BM25Index.open(self._bm25_path)
+            elif self._bm25_path is not None:
+                self.bm25 = BM25Index.load(self._bm25_path)
+            else:
+                self.bm25 = BM25Index()
+                for chunk_id, chunk in enumerate(self.chunks):
+                    if chunk is not None:
+                        self.bm25.add(chunk_id, chunk)
+        return self.bm25
+
+    def load_cached_index(self, key):
+        """
+        Intenta cargar desde la caché el índice asociado a la clave dada.
+        """
+        if not self.cache_dir:
+            return False
+        return self.load_index(self._cache_path(key))
+
+    def reset_index(self):
+        """
+        Vacía el índice y la información de documentos.
+        """
+        self.index = None
+        self.chunks = []
+        self.chunk_pages = []
+        self._mmap_path = None
+        self.bm25 = None
+        self._bm25_path = None
+        self.documents = {}
+        self.removed = 0
+        self.stale = 0
+        self.dim = None
+
+    def _build_index(self, embeddings, max_train=MAX_TRAIN):
+        """
+        Crea un índice vacío del tipo configurado y lo entrena (si hace falta) con una
+        muestra de los embeddings dados. Con pocos vectores se reducen nlist y los bits de PQ
+        (k-means necesita unos 39 vectores por centroide) o se usa el índice exacto, porque
+        IVF/PQ no se pueden entrenar bien.
+        """
+        n, dim = embeddings.shape
+        index_type = self.index_type
+        nlist = max(1, min(self.nlist, n // 39))
+        nbits = min(self.PQ_NBITS, int(np.log2(max(n, 1) / 39)) if n >= 39 else 0)
+        if index_type == "ivf_pq" and nbits < self.MIN_PQ_NBITS:
+            print("⚠️ Muy pocos vectores para entrenar IVF-PQ, se usa un índice exacto.")
+            index_type = "flat"
+
+        if index_type == "ivf_flat":
+            description = f"IVF{nlist},Flat"
+        elif index_type == "ivf_pq":
+            m = self.pq_m
+            while dim % m:  # PQ necesita que m divida la dimensión
+                m -= 1
+            description = f"IVF{nlist},PQ{m}x{nbits}"
+        elif index_type == "hnsw":
+            description = f"IDMap2,HNSW{self.hnsw_m}"
+        else:
+            description = "IDMap2,Flat"
+
+        index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            sample = embeddings
+            if n > max_train:
+                sample = embeddings[np.random.default_rng(0).choice(n, max_train, replace=False)]
+            index.train(sample)
+        return index
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """
+        Ajusta los parámetros de búsqueda del índice aproximado (nprobe para IVF, efSearch para HNSW).
+        """
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+        if self.index is None:
+            return
+        params = faiss.ParameterSpace()
+        inner = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexIDMap2) else self.index
+        if isinstance(inner, faiss.IndexIVF):
+            params.set_index_parameter(self.index, "nprobe", self.nprobe)
+        elif isinstance(inner, faiss.IndexHNSW):
+            params.set_index_parameter(self.index, "efSearch", self.ef_search)
+
+    @staticmethod
+    def _hash_pages(pages, hasher):
+        """Generador que deja pasar los pares (página, texto) actualizando el hash con cada uno."""
+        for page_no, text in pages:
+            hasher.update(f"\0{page_no}\0".encode("utf-8"))
+            hasher.update(text.encode("utf-8"))
+            yield page_no, text
+
+    @classmethod
+    def _doc_hash(cls, doc):
+        """Hash del contenido de un documento (texto o lista de pares (página, texto))."""
+        if isinstance(doc, str):
+            return hashlib.sha256(doc.encode("utf-8")).hexdigest()
+        h = hashlib.sha256()
+        for _ in cls._hash_pages(doc, h):
+            pass
+        return h.hexdigest()
+
+    def add_documents(self, docs):
+        """
+        Añade documentos al índice sin reconstruirlo.
+        - docs: dict {doc_id: documento} o lista de documentos (en ese caso el doc_id es el hash
+          del contenido). Cada documento es un texto, una lista de pares (página, texto) o un
+          generador de esos pares (p. ej. DocumentUploader.iter_pages), que se consume en streaming.
+        Solo se generan embeddings para los documentos nuevos o cuyo contenido ha cambiado
+        (un generador sin cambios solo se detecta al terminar de leerlo: sus chunks se descartan
+        y sus embeddings salen de la caché); un documento modificado sustituye a su versión anterior.
+        Los chunks se procesan en lotes de ingest_batch_size (trocear, generar embeddings y
+        añadirlos al índice antes de pasar al siguiente lote), así que la memoria no crece con
+        el tamaño del documento. Si el índice aún no existe y hay que entrenarlo (IVF/PQ), se
+        acumulan primero los vectores de la muestra de entrenamiento (_train_size).
+        Retorna la lista de doc_id añadidos.
+        """
+        # Sin doc_id (lista) se usa el hash del contenido, que en los generadores solo se
+        # conoce después de consumirlos
+        items = docs.items() if isinstance(docs, dict) else ((None, doc) for doc in docs)
+        added = []
+        state = {
+            "batch": [],      # (documento, chunk o None = fin del documento) pendientes de embedding
+            "queue": [],      # documentos troceados cuyos vectores aún no están todos en el índice
+            "train": [],      # vectores retenidos hasta tener la muestra para entrenar el índice
+            "committed": len(self.chunks),  # Los chunks desde este id no pertenecen a ningún documento
+            "indexed": len(self.chunks),    # Los chunks desde este id no tienen su vector en el índice
+        }
+        try:
+            chunks_in_batch = 0
+            for entry, chunk in self._iter_new_chunks(items):
+                if not state["queue"] or state["queue"][-1] is not entry:
+                    state["queue"].append(entry)
+                state["batch"].append((entry, chunk))
+                chunks_in_batch += chunk is not None
+                if chunks_in_batch >= self.ingest_batch_size:
+                    self._flush_batch(state, added)
+                    chunks_in_batch = 0
+            self._flush_batch(state, added, final=True)
+        except BaseException:
+            # Se descartan los chunks de los documentos sin registrar: el índice queda con los
+            # documentos completos que ya se habían añadido
+            committed, indexed = state["committed"], state["indexed"]
+            self._drop_vectors(list(range(committed, indexed)))
+            self.chunks[committed:indexed] = [None] * (indexed - committed)
+            self.removed += indexed - committed
+            del self.chunks[indexed:]
+            del self.chunk_pages[indexed:]
+            raise
+        # Las versiones sustituidas y los chunks descartados cuentan para compactar
+        self._maybe_compact()
+        return added
+
+    def _iter_new_chunks(self, items):
+        """
+        Generador de pares (entrada, chunk) de los documentos nuevos o modificados, y un par
+        (entrada, None) al terminar cada documento. La entrada es un dict con doc_id, hash e ids.
+        """
+        queued = set()
+        for doc_id, doc in items:
+            entry = {"doc_id": doc_id, "hash": None, "ids": []}
+            if isinstance(doc, (str, list, tuple)):
+                entry["hash"] = self._doc_hash(doc)
+                if doc_id is None:
+                    entry["doc_id"] = entry["hash"]
+                info = self.documents.get(entry["doc_id"])
+                if (info is not None and info["hash"] == entry["hash"]) or entry["doc_id"] in queued:
+                    continue  # Sin cambios o repetido en la misma lista
+                queued.add(entry["doc_id"])
+                yield from ((entry, chunk) for chunk in self.chunker.iter_chunks(doc))
+            else:
+                # Documento en streaming (generador de páginas): el hash se calcula mientras el
+                # chunker lo consume y se comprueba al terminar (ver _finish_document)
+                hasher = hashlib.sha256()
+                yield from ((entry, chunk) for chunk in self.chunker.iter_chunks(self._hash_pages(doc, hasher)))
+                entry["hash"] = hasher.hexdigest()
+                if doc_id is None:
+                    entry["doc_id"] = entry["hash"]
+            yield entry, None
+
+    def _train_size(self):
+        """Vectores necesarios para entrenar el índice configurado (0 si no necesita entrenamiento)."""
+        if self.index_type == "ivf_flat":
+            return min(39 * self.nlist, self.MAX_TRAIN)
+        if self.index_type == "ivf_pq":
+            return min(max(39 * self.nlist, 39 * 2 ** self.PQ_NBITS), self.MAX_TRAIN)
+        return 0
+
+    def _flush_batch(self, state, added, final=False):
+        """
+        Genera los embeddings del lote, los añade al índice (o a la muestra de entrenamiento)
+        y registra los documentos cuyos vectores ya están todos en el índice.
+        """
+        batch, state["batch"] = state["batch"], []
+        chunks = [chunk for _, chunk in batch if chunk is not None]
+        if chunks:
+            self._ensure_writable()
+            embeddings = self.generate_embeddings([chunk["text"] for chunk in chunks])
+            faiss.normalize_L2(embeddings)
+            start_id = len(self.chunks)
+            self.chunks.extend(chunk["text"] for chunk in chunks)
+            self.chunk_pages.extend(chunk["page"] for chunk in chunks)
+            chunk_id = start_id
+            for entry, chunk in batch:
+                if chunk is not None:
+                    entry["ids"].append(chunk_id)
+                    chunk_id += 1
+            state["train"].append(embeddings)
+
+        pending = sum(len(e) for e in state["train"])
+        if self.index is None and pending and (final or pending >= self._train_size()):
+            # Crear el índice FAISS con ids propios para poder eliminar chunks después
+            sample = np.concatenate(state["train"])
+            self.dim = sample.shape[1]
+            self.index = self._build_index(sample)
+            self.set_search_params()
+        if self.index is not None and pending:
+            for embeddings in state["train"]:
+                self.index.add_with_ids(
+                    embeddings, np.arange(state["indexed"], state["indexed"] + len(embeddings), dtype=np.int64)
                 )
+                state["indexed"] += len(embeddings)
+            state["train"] = []
 
-                if hasattr(response, "data") and response.data:
-                    embeddings_list = [item.embedding for item in response.data]
-                else:
-                    raise Exception(f"Error al obtener embeddings: {response}")
+        for entry, chunk in batch:
+            if chunk is None:
+                entry["done"] = True
+        # Registrar, en orden, los documentos terminados (si no hay vectores retenidos para el
+        # entrenamiento, todos los chunks troceados hasta ahora ya están en el índice)
+        if not state["train"]:
+            while state["queue"] and state["queue"][0].get("done"):
+                self._finish_document(state["queue"].pop(0), added)
+            queue = state["queue"]
+            state["indexed"] = min(state["indexed"], len(self.chunks))  # Chunks descartados al final
+            state["committed"] = queue[0]["ids"][0] if queue and queue[0]["ids"] else len(self.chunks)
 
-                return np.array(embeddings_list, dtype=np.float32)
+    def _finish_document(self, entry, added):
+        """
+        Registra un documento ya indexado, sustituyendo a su versión anterior. Si resulta estar
+        sin cambios o repetido (solo se sabe al terminar de leer un generador), se descartan sus chunks.
+        """
+        doc_id = entry["doc_id"]
+        info = self.documents.get(doc_id)
+        if doc_id in added or (info is not None and info["hash"] == entry["hash"]):
+            ids = entry["ids"]
+            if self._drop_vectors(ids) and ids and ids[-1] == len(self.chunks) - 1:
+                # Son los últimos chunks y ya no están en el índice: sus ids se pueden reutilizar
+                del self.chunks[ids[0]:]
+                del self.chunk_pages[ids[0]:]
+                return
+            for chunk_id in ids:
+                self.chunks[chunk_id] = None
+            self.removed += len(ids)
+            return
+        if info is not None:
+            self.remove_document(doc_id, compact=False)
+        self.documents[doc_id] = {"hash": entry["hash"], "ids": entry["ids"]}
+        if self.bm25 is not None:
+            for chunk_id in entry["ids"]:
+                self.bm25.add(chunk_id, self.chunks[chunk_id])
+        added.append(doc_id)
 
-            except Exception as e:
-                if "401" in str(e):
-                    raise Exception("Error de autenticación: Verifica tu API Key de Mistral.")
-                elif "429" in str(e):
-                    print(f"Rate limit exceeded. Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                    retries += 1
-                    delay *= 2
-                else:
-                    raise  # Re-lanzar la excepción si no es un error de límite de tasa
+    def _drop_vectors(self, ids):
+        """
+        Quita del índice los vectores de los chunks dados.
+        Retorna False si el índice no permite borrarlos (quedan obsoletos hasta compactar).
+        """
+        if not ids or self.index is None:
+            return True
+        try:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+        except RuntimeError:
+            # HNSW no permite borrar: los vectores se ignoran en la búsqueda hasta compactar
+            self.stale += len(ids)
+            return False
+        return True
+
+    def remove_document(self, doc_id, compact=True):
+        """
+        Elimina un documento del índice. Sus chunks quedan marcados como eliminados (None)
+        y, si más de la mitad de los chunks están eliminados, se compacta el índice.
+        """
+        if doc_id not in self.documents:
+            return False
+        self._ensure_writable()
+        info = self.documents.pop(doc_id)
+        if info["ids"]:
+            self._drop_vectors(info["ids"])
+            for chunk_id in info["ids"]:
+                if self.bm25 is not None:
+                    self.bm25.remove(chunk_id, self.chunks[chunk_id])
+                self.chunks[chunk_id] = None
+            self.removed += len(info["ids"])
 
-        raise Exception("Se alcanzó el máximo de reintentos debido a la tasa de solicitudes.")
+        if compact:
+            self._maybe_compact()
+        return True
 
-    def create_faiss_index(self, docs):
+    def _maybe_compact(self):
+        """Compacta el índice si más de la mitad de los chunks están eliminados."""
+        if self.removed * 2 > len(self.chunks):
+            self.compact()
+
+    def compact(self):
+        """
+        Renumera los chunks vivos para eliminar los huecos de los documentos borrados.
+        El índice se reconstruye (ver rebuild_index): con la caché de embeddings no hay
+        llamadas a la API; sin ella se vuelven a generar los embeddings de todos los chunks.
         """
+        live_ids = [i for i, chunk in enumerate(self.chunks) if chunk is not None]
+        if len(live_ids) == len(self.chunks):
+            return
+        self._ensure_writable()
+        new_ids = {old_id: new_id for new_id, old_id in enumerate(live_ids)}
+        self.chunks = [self.chunks[i] for i in live_ids]
+        self.chunk_pages = [self.chunk_pages[i] for i in live_ids]
+        self.removed = 0
+        self.stale = 0
+        for info in self.documents.values():
+            info["ids"] = [new_ids[i] for i in info["ids"]]
+        # Los ids han cambiado: el índice léxico se reconstruye al próximo uso
+        self.bm25 = None
+        self._bm25_path = None
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        """
+        Reconstruye el índice con el tipo configurado (index_type) a partir de todos los chunks.
+        Sirve para cambiar de tipo de índice o para entrenar IVF/PQ con el corpus completo.
+        IVF/PQ se entrenan con una muestra aleatoria (_train_size) y los vectores se añaden en
+        lotes de ingest_batch_size, así que nunca están todos en memoria a la vez.
+        Los embeddings salen de la caché de embeddings, por lo que no hay llamadas a la API;
+        sin caché (embedding_cache_dir=None) se vuelven a generar todos (los de la muestra, dos veces).
+        """
+        if self.removed:
+            return self.compact()
+        self._ensure_writable()
+        self.index = None
+        n = len(self.chunks)
+        train_size = self._train_size()
+        if train_size and n > train_size:
+            sample_ids = np.sort(np.random.default_rng(0).choice(n, train_size, replace=False))
+            sample = self.generate_embeddings([self.chunks[i] for i in sample_ids])
+            faiss.normalize_L2(sample)
+            self.dim = sample.shape[1]
+            self.index = self._build_index(sample)
+            self.set_search_params()
+            del sample
+
+        start = 0
+        while start < n:
+            # Sin índice todavía (corpus menor que la muestra), el primer lote es todo lo que se entrena
+            size = self.ingest_batch_size if self.index is not None else max(self.ingest_batch_size, train_size)
+            end = min(n, start + size)
+            embeddings = self.generate_embeddings(self.chunks[start:end])
+            faiss.normalize_L2(embeddings)
+            if self.index is None:
+                self.dim = embeddings.shape[1]
+                self.index = self._build_index(embeddings)
+                self.set_search_params()
+            self.index.add_with_ids(embeddings, np.arange(start, end, dtype=np.int64))
+            start = end
+
+    @property
+    def built_index_type(self):
+        """
+        Tipo del índice realmente construido (None si no hay índice). Puede no coincidir con
+        index_type: con pocos vectores IVF-PQ se sustituye por el índice exacto.
+        """
+        if self.index is None:
+            return None
+        inner = faiss.downcast_index(self.index.index) if isinstance(self.index, faiss.IndexIDMap2) else self.index
+        if isinstance(inner, faiss.IndexIVFPQ):
+            return "ivf_pq"
+        if isinstance(inner, faiss.IndexIVF):
+            return "ivf_flat"
+        if isinstance(inner, faiss.IndexHNSW):
+            return "hnsw"
+        return "flat"
+
+    def create_faiss_index(self, docs, cache_key=None):
+        """
+        Construye el índice desde cero con los documentos dados:
         1) Divide todos los documentos en chunks.
         2) Genera embeddings para cada chunk (en lotes).
-        3) Crea y entrena el índice FAISS.
+        3) Crea el índice FAISS.
+        Si se pasa cache_key, primero se intenta cargar el índice desde la caché
+        y, tras construirlo, se guarda en ella.
         """
-        # 1) Crear chunks
-        all_chunks = []
-        for doc in docs:
-            doc_chunks = self.chunk_text(doc, max_length=2048)
-            all_chunks.extend(doc_chunks)
-        self.chunks = all_chunks
-
-        if not all_chunks:
+        if cache_key and self.load_cached_index(cache_key):
             return
-            
-        # 2) Generar embeddings por lotes
-        embeddings = []
-        batch_size = 16
-        for i in range(0, len(all_chunks), batch_size):
-            batch = all_chunks[i:i+batch_size]
-            emb_batch = self.generate_embeddings(batch)
-            embeddings.append(emb_batch)
-        
-        if not embeddings:
+
+        self.reset_index()
+        self.add_documents(docs)
+        if self.index is None:
             return
-        
-        embeddings = np.concatenate(embeddings, axis=0)
-        self.dim = embeddings.shape[1]
 
-        # 3) Crear el índice FAISS
-        self.index = faiss.IndexFlatIP(self.dim)
-        faiss.normalize_L2(embeddings)
-        self.index.add(embeddings)
+        # Guardar en caché para los próximos arranques
+        if cache_key and self.cache_dir:
+            try:
+                self.save_index(self._cache_path(cache_key))
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar el índice en caché: {e}")
 
-    def search_similar_chunks(self, query, k=2):
+    def search_similar_chunks(self, query, k=2, mode="dense", embed_timeout=None):
         """
         Dado un query en texto, retorna los k chunks más similares del índice FAISS.
+        Ver search_many para los modos de búsqueda.
+        """
+        return self.search_many([query], k=k, mode=mode, embed_timeout=embed_timeout)[0]["chunks"]
+
+    def _dense_search(self, queries, k, embed_timeout=None):
+        """
+        Búsqueda vectorial: un único lote de embeddings y una sola búsqueda matricial en FAISS.
+        Retorna, por consulta, una lista de pares (id, similitud coseno) de chunks no eliminados.
+        Si embed_timeout no es None y el embedding tarda más, lanza TimeoutError
+        (el embedding sigue en segundo plano y queda en la caché; ver embed_queries).
         """
-        # Generar embedding del query
-        query_emb = self.generate_embeddings([query])
+        if embed_timeout is None:
+            query_emb = self.generate_embeddings(queries, kind="query")
+        else:
+            query_emb = self.embed_queries(queries, timeout=embed_timeout)
         faiss.normalize_L2(query_emb)
 
-        # Hacer búsqueda en FAISS
-        distances, indices = self.index.search(query_emb, k)
+        # Hacer búsqueda en FAISS (pidiendo de más si hay vectores de chunks eliminados)
+        distances, indices = self.index.search(query_emb, k + self.stale)
 
-        # Obtener los chunks correspondientes a los índices
-        top_chunks = []
-        for idx in indices[0]:
-            top_chunks.append(self.chunks[idx])
+        # Quedarse con los chunks existentes (-1 = no hay más resultados)
+        results = []
+        for row_scores, row_ids in zip(distances, indices):
+            hits = [(int(idx), float(score)) for idx, score in zip(row_ids, row_scores)
+                    if idx >= 0 and self.chunks[idx] is not None]
+            results.append(hits[:k])
+        return results
 
-        return top_chunks
-        
-    def get_random_chunk(self):
+    def search_many(self, queries, k=2, mode="dense", embed_timeout=None, rrf_k=60):
         """
-        Devuelve un chunk aleatorio del índice FAISS.
+        Busca varias consultas a la vez.
+        - mode: "dense" (vectorial), "lexical" (BM25 local, sin llamadas a la API) o "hybrid"
+          (fusiona ambas con reciprocal rank fusion).
+        - embed_timeout: en modo híbrido, si el embedding de las consultas tarda más de estos
+          segundos o falla, se responde solo con la búsqueda léxica.
+        Retorna, por cada consulta, un dict con:
+        - "chunks": lista de textos de los chunks más similares.
+        - "ids": np.array con los ids de esos chunks.
+        - "scores": np.array con su puntuación (similitud coseno, BM25 o RRF según el modo).
         """
-        if not self.index or not self.chunks:
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Modo de búsqueda no soportado: {mode}. Opciones: {', '.join(self.SEARCH_MODES)}")
+        queries = list(queries)
+        # En modo híbrido se recuperan más candidatos de cada lista para fusionarlos
+        fetch = k if mode == "dense" else 4 * k
+
+        dense = None
+        if mode != "lexical":
+            try:
+                dense = self._dense_search(queries, fetch, embed_timeout)
+            except Exception as e:
+                if mode == "dense":
+                    raise
+                print(f"⚠️ Búsqueda vectorial no disponible ({e}), se usa solo la búsqueda léxica.")
+
+        if mode == "dense":
+            ranked = dense
+        else:
+            bm25 = self.get_bm25()
+            lexical = [bm25.search(query, fetch) for query in queries]
+            if dense is None:
+                ranked = lexical
+            else:
+                ranked = []
+                for dense_hits, lexical_hits in zip(dense, lexical):
+                    fused = {}
+                    for hits in (dense_hits, lexical_hits):
+                        for rank, (chunk_id, _) in enumerate(hits):
+                            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+                    ranked.append(sorted(fused.items(), key=lambda item: item[1], reverse=True))
+
+        results = []
+        for hits in ranked:
+            hits = hits[:k]
+            results.append({
+                "chunks": [self.chunks[chunk_id] for chunk_id, _ in hits],
+                "ids": np.array([chunk_id for chunk_id, _ in hits], dtype=np.int64),
+                "scores": np.array([score for _, score in hits], dtype=np.float32),
+            })
+        return results
+
+    def evaluate_recall(self, k=10, n_queries=100, seed=0):
+        """
+        Mide la calidad del índice aproximado frente a una búsqueda exacta (IndexFlatIP).
+        Usa como consultas una muestra de los propios chunks; los embeddings salen de la caché.
+        Retorna un dict con el recall@k medio y la latencia media por consulta (ms) de ambos índices.
+        """
+        live_ids = np.array([i for i, chunk in enumerate(self.chunks) if chunk is not None], dtype=np.int64)
+        if self.index is None or len(live_ids) == 0:
             return None
-        import numpy as np
-        idx = np.random.randint(0, len(self.chunks))
-        return self.chunks[idx]
+
+        embeddings = self.generate_embeddings([self.chunks[i] for i in live_ids])
+        faiss.normalize_L2(embeddings)
+        exact = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        exact.add_with_ids(embeddings, live_ids)
+
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(len(live_ids), min(n_queries, len(live_ids)), replace=False)
+        queries = embeddings[sample]
+        k = min(k, len(live_ids))
+
+        start = time.perf_counter()
+        _, exact_ids = exact.search(queries, k)
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        _, approx_ids = self.index.search(queries, k + self.stale)
+        approx_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        hits = 0
+        for exact_row, approx_row in zip(exact_ids, approx_ids):
+            approx_live = [i for i in approx_row if i >= 0 and self.chunks[i] is not None][:k]
+            hits += len(set(exact_row) & set(approx_live))
+
+        return {
+            "index_type": self.built_index_type,
+            "k": k,
+            "queries": len(queries),
+            "recall": hits / (k * len(queries)),
+            "exact_ms_per_query": exact_ms,
+            "index_ms_per_query": approx_ms,
+        }
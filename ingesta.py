@@ -0,0 +1,222 @@
+# ingesta.py
+#
+# Construye el índice FAISS fuera de la aplicación, a partir de una carpeta o un glob de PDFs.
+# Uso:
+#   python ingesta.py catalogos/ "guias/*.pdf" --salida indices --tipo-indice hnsw
+#
+# El resultado es un artefacto versionado en <salida>/<versión>/ y el fichero <salida>/ACTUAL
+# apunta a la última versión, que es la que carga la aplicación al arrancar.
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import config
+from documentos import DocumentUploader
+from faiss_manager import FAISSManager
+
+INDEX_NAME = "indice"
+WORK_DIR = "en_progreso"
+
+
+def buscar_pdfs(entradas):
+    """Expande carpetas (recursivamente) y patrones glob a una lista ordenada de PDFs."""
+    rutas = set()
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            rutas.update(glob.glob(os.path.join(entrada, "**", "*.pdf"), recursive=True))
+        else:
+            rutas.update(r for r in glob.glob(entrada, recursive=True) if r.lower().endswith(".pdf"))
+    return sorted(rutas)
+
+
+def hash_fichero(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def ultima_version(directorio):
+    """Retorna el nombre de la versión publicada en <directorio>/ACTUAL, o None."""
+    try:
+        with open(os.path.join(directorio, "ACTUAL"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def cargar_indice_publicado(faiss_manager, directorio):
+    """
+    Carga en faiss_manager la última versión publicada del índice.
+    Retorna el manifest de la versión cargada, o None si no hay ninguna compatible.
+    """
+    version = ultima_version(directorio)
+    if version is None:
+        return None
+    ruta = os.path.join(directorio, version)
+    try:
+        with open(os.path.join(ruta, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"⚠️ Índice publicado {version} sin manifest válido: {e}")
+        return None
+    if manifest.get("embedding_model") != faiss_manager.embedding_model:
+        print(f"⚠️ El índice {version} usa otro modelo de embeddings ({manifest.get('embedding_model')}), se ignora.")
+        return None
+    if not faiss_manager.load_index(os.path.join(ruta, INDEX_NAME)):
+        return None
+    return manifest
+
+
+def _contar_paginas(pages, stats):
+    for page in pages:
+        stats["pages"] += 1
+        yield page
+
+
+def _guardar_checkpoint(faiss_manager, trabajo, progreso):
+    faiss_manager.save_index(os.path.join(trabajo, INDEX_NAME))
+    tmp = os.path.join(trabajo, "progreso.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(progreso, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(trabajo, "progreso.json"))
+
+
+def ingerir(pdfs, salida, tipo_indice="flat", workers=None, checkpoint_cada=5, api_key=None):
+    """
+    Ingiere los PDFs dados y publica una nueva versión del índice en `salida`.
+    Si existe un trabajo a medias en <salida>/en_progreso se reanuda desde su último checkpoint,
+    saltando los documentos cuyo contenido no ha cambiado.
+    Retorna el manifest de la versión publicada.
+    """
+    trabajo = os.path.join(salida, WORK_DIR)
+    os.makedirs(trabajo, exist_ok=True)
+    workers = workers or os.cpu_count() or 1  # Proceso por lotes: se pueden usar todos los núcleos
+
+    # Durante la ingesta se usa un índice exacto; al final se reconstruye con el tipo pedido,
+    # así IVF/PQ se entrenan con el corpus completo y no solo con el primer documento
+    faiss_manager = FAISSManager(api_key=api_key, cache_dir=None, index_type="flat")
+    uploader = DocumentUploader()
+
+    progreso = {"documentos": {}, "stats": {"pages": 0, "chunks": 0, "embeddings": 0, "seconds": 0.0}}
+    ruta_progreso = os.path.join(trabajo, "progreso.json")
+    if os.path.exists(ruta_progreso) and faiss_manager.load_index(os.path.join(trabajo, INDEX_NAME)):
+        with open(ruta_progreso, "r", encoding="utf-8") as f:
+            progreso = json.load(f)
+        print(f"↻ Reanudando ingesta: {len(progreso['documentos'])} documentos ya procesados")
+
+    stats = progreso["stats"]
+    inicio = time.perf_counter()
+    segundos_previos = stats["seconds"]
+    pendientes_checkpoint = 0
+
+    for n, ruta in enumerate(pdfs, start=1):
+        doc_id = os.path.relpath(ruta)
+        hash_pdf = hash_fichero(ruta)
+        if progreso["documentos"].get(doc_id) == hash_pdf:
+            print(f"[{n}/{len(pdfs)}] {doc_id}: sin cambios, se salta")
+            continue
+
+        t0 = time.perf_counter()
+        paginas_antes = stats["pages"]
+        chunks_antes = len(faiss_manager.chunks) - faiss_manager.removed
+        embeddings_antes = faiss_manager.api_embeddings
+        try:
+            with open(ruta, "rb") as f:
+                faiss_manager.add_documents({doc_id: _contar_paginas(uploader.iter_pages(f, workers=workers), stats)})
+        except Exception as e:
+            print(f"[{n}/{len(pdfs)}] ❌ {doc_id}: {e}")
+            continue
+
+        nuevos_chunks = len(faiss_manager.chunks) - faiss_manager.removed - chunks_antes
+        stats["chunks"] += max(nuevos_chunks, 0)
+        stats["embeddings"] += faiss_manager.api_embeddings - embeddings_antes
+        progreso["documentos"][doc_id] = hash_pdf
+        print(f"[{n}/{len(pdfs)}] {doc_id}: {stats['pages'] - paginas_antes} páginas, "
+              f"{max(nuevos_chunks, 0)} chunks en {time.perf_counter() - t0:.1f}s")
+
+        pendientes_checkpoint += 1
+        if pendientes_checkpoint >= checkpoint_cada:
+            stats["seconds"] = segundos_previos + time.perf_counter() - inicio
+            _guardar_checkpoint(faiss_manager, trabajo, progreso)
+            pendientes_checkpoint = 0
+
+    # Documentos que ya no están en la entrada
+    vigentes = {os.path.relpath(r) for r in pdfs}
+    for doc_id in [d for d in progreso["documentos"] if d not in vigentes]:
+        faiss_manager.remove_document(doc_id)
+        del progreso["documentos"][doc_id]
+
+    if faiss_manager.documents and (tipo_indice != "flat" or faiss_manager.removed):
+        faiss_manager.index_type = tipo_indice
+        faiss_manager.rebuild_index()
+
+    stats["seconds"] = segundos_previos + time.perf_counter() - inicio
+    if faiss_manager.index is None:
+        raise ValueError("No se generó ningún chunk: revisa que los PDFs tengan texto extraíble.")
+
+    # Publicar la versión
+    version = time.strftime("v%Y%m%d-%H%M%S")
+    destino = os.path.join(salida, version)
+    os.makedirs(destino)
+    faiss_manager.save_index(os.path.join(destino, INDEX_NAME))
+    manifest = {
+        "version": version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "documents": progreso["documentos"],
+        "chunks": len(faiss_manager.chunks),
+        "chunker": faiss_manager.chunker.describe(),
+        "embedding_model": faiss_manager.embedding_model,
+        "index_type": faiss_manager.built_index_type,  # El construido, no el pedido (ver _build_index)
+        "stats": stats,
+    }
+    with open(os.path.join(destino, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp = os.path.join(salida, "ACTUAL.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(salida, "ACTUAL"))
+    shutil.rmtree(trabajo, ignore_errors=True)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construye el índice FAISS de GuíaShipping a partir de PDFs.")
+    parser.add_argument("entradas", nargs="+", help="Carpetas o patrones glob de PDFs")
+    parser.add_argument("--salida", default=config.get("INDEX_DIR", "indices"), help="Carpeta de los índices publicados")
+    parser.add_argument("--tipo-indice", default="flat", choices=FAISSManager.INDEX_TYPES)
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para extraer páginas (por defecto, todos los núcleos)")
+    parser.add_argument("--checkpoint-cada", type=int, default=5, help="Guardar un checkpoint cada N documentos")
+    args = parser.parse_args(argv)
+
+    config.cargar()
+    api_key = config.get("MISTRAL_API_KEY")
+    if not api_key:
+        print("⚠️ No se encontró la API Key de Mistral.")
+        return 1
+
+    pdfs = buscar_pdfs(args.entradas)
+    if not pdfs:
+        print("⚠️ No se encontraron PDFs en las entradas indicadas.")
+        return 1
+
+    manifest = ingerir(pdfs, args.salida, tipo_indice=args.tipo_indice, workers=args.workers,
+                       checkpoint_cada=args.checkpoint_cada, api_key=api_key)
+
+    stats = manifest["stats"]
+    segundos = max(stats["seconds"], 1e-9)
+    print(f"✅ Versión {manifest['version']} publicada en {args.salida}: "
+          f"{len(manifest['documents'])} documentos, {manifest['chunks']} chunks")
+    print(f"   {stats['pages'] / segundos:.1f} páginas/s | {stats['chunks'] / segundos:.1f} chunks/s | "
+          f"{stats['embeddings'] / segundos:.1f} embeddings/s ({segundos:.1f}s en total)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
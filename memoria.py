@@ -0,0 +1,79 @@
+# memoria.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from chunker import count_tokens
+
+# Hilos compartidos por todas las sesiones para actualizar los resúmenes
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memoria")
+
+
+class MemoriaConversacion:
+    def __init__(self, resumir, turnos_recientes=4, max_tokens_resumen=250):
+        """
+        Memoria de una conversación de tamaño constante.
+        - resumir: función (resumen anterior, lista de turnos) -> nuevo resumen.
+        - turnos_recientes: últimos turnos (consulta, respuesta) que se conservan literalmente.
+        - max_tokens_resumen: tamaño máximo del resumen de los turnos más antiguos.
+        Los turnos que salen de la ventana se incorporan al resumen en segundo plano,
+        así la respuesta nunca espera a que se actualice.
+        """
+        self.resumir = resumir
+        self.turnos_recientes = turnos_recientes
+        self.max_tokens_resumen = max_tokens_resumen
+        self.resumen = ""
+        self.turnos = []
+        self._pendientes = []  # Turnos fuera de la ventana que aún no están en el resumen
+        self._resumiendo = False
+        self._version = 0  # Cambia al limpiar, para descartar resúmenes ya en curso
+        self._lock = threading.Lock()
+
+    def agregar_turno(self, consulta, respuesta):
+        with self._lock:
+            self.turnos.append((consulta, respuesta))
+            if len(self.turnos) > self.turnos_recientes:
+                self._pendientes.append(self.turnos.pop(0))
+            lanzar = bool(self._pendientes) and not self._resumiendo
+            if lanzar:
+                self._resumiendo = True
+        if lanzar:
+            _executor.submit(self._actualizar_resumen)
+
+    def _actualizar_resumen(self):
+        # Un único resumen en curso por conversación; los turnos que lleguen mientras
+        # tanto se incorporan en la siguiente vuelta
+        while True:
+            with self._lock:
+                if not self._pendientes:
+                    self._resumiendo = False
+                    return
+                turnos, self._pendientes = self._pendientes, []
+                resumen = self.resumen
+                version = self._version
+            try:
+                resumen = self.resumir(resumen, turnos)
+            except Exception as e:
+                print(f"⚠️ No se pudo actualizar el resumen de la conversación: {e}")
+                # Sin modelo, el resumen conserva al menos las consultas
+                resumen = " ".join([resumen, *(f"El usuario preguntó: {c}" for c, _ in turnos)]).strip()
+            if count_tokens(resumen) > self.max_tokens_resumen:
+                # Se conserva lo más reciente
+                palabras = resumen.split()
+                while palabras and count_tokens(" ".join(palabras)) > self.max_tokens_resumen:
+                    palabras = palabras[len(palabras) // 10 + 1:]
+                resumen = " ".join(palabras)
+            with self._lock:
+                if version == self._version:
+                    self.resumen = resumen
+
+    def contexto(self):
+        """Retorna una copia {"resumen": str, "turnos": [(consulta, respuesta), ...]}."""
+        with self._lock:
+            return {"resumen": self.resumen, "turnos": list(self.turnos)}
+
+    def limpiar(self):
+        with self._lock:
+            self.resumen = ""
+            self.turnos = []
+            self._pendientes = []
+            self._version += 1
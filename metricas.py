@@ -0,0 +1,207 @@
+# metricas.py
+#
+# Trazas por petición (tiempos de cada etapa) y contadores agregados del proceso.
+# - span("etapa"): mide un bloque y lo anota en la traza actual y en el histograma global.
+# - contar("nombre", n): suma a un contador global y al de la traza actual.
+# - traza("consulta"): abre la traza de una petición; al cerrarse se escribe en METRICS_LOG
+#   (una línea JSON por petición) si está configurado.
+# Los totales se exportan en formato Prometheus en http://localhost:<METRICS_PORT>/metrics.
+
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+
+# Límites (segundos) de los buckets de los histogramas de duración
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_traza_actual = contextvars.ContextVar("traza_actual", default=None)
+
+
+class Traza:
+    def __init__(self, nombre):
+        self.id = uuid.uuid4().hex[:12]
+        self.nombre = nombre
+        self.inicio = time.time()
+        self.duracion = None
+        self.spans = {}       # etapa -> segundos (acumulados si se repite)
+        self.contadores = {}
+        self.atributos = {}
+        self._lock = threading.Lock()
+
+    def _span(self, nombre, segundos):
+        with self._lock:
+            self.spans[nombre] = self.spans.get(nombre, 0.0) + segundos
+
+    def _contar(self, nombre, n):
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    def resumen(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "nombre": self.nombre,
+                "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+                "duracion_s": round(self.duracion, 4) if self.duracion is not None else None,
+                "spans_s": {k: round(v, 4) for k, v in self.spans.items()},
+                "contadores": dict(self.contadores),
+                "atributos": dict(self.atributos),
+            }
+
+
+class Registro:
+    def __init__(self):
+        """Contadores e histogramas de duración acumulados en el proceso."""
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}  # etapa -> {"count", "sum", "buckets": [...]}
+
+    def observar(self, nombre, segundos):
+        with self._lock:
+            h = self.histogramas.get(nombre)
+            if h is None:
+                h = self.histogramas[nombre] = {"count": 0, "sum": 0.0, "buckets": [0] * len(BUCKETS)}
+            h["count"] += 1
+            h["sum"] += segundos
+            for i, limite in enumerate(BUCKETS):
+                if segundos <= limite:
+                    h["buckets"][i] += 1
+
+    def contar(self, nombre, n=1):
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    def prometheus(self):
+        """Texto en el formato de exposición de Prometheus."""
+        lineas = []
+        with self._lock:
+            for nombre, valor in sorted(self.contadores.items()):
+                lineas.append(f"# TYPE guiashipping_{nombre}_total counter")
+                lineas.append(f"guiashipping_{nombre}_total {valor}")
+            if self.histogramas:
+                lineas.append("# TYPE guiashipping_span_seconds histogram")
+            for nombre, h in sorted(self.histogramas.items()):
+                for limite, n in zip(BUCKETS, h["buckets"]):
+                    lineas.append(f'guiashipping_span_seconds_bucket{{span="{nombre}",le="{limite}"}} {n}')
+                lineas.append(f'guiashipping_span_seconds_bucket{{span="{nombre}",le="+Inf"}} {h["count"]}')
+                lineas.append(f'guiashipping_span_seconds_sum{{span="{nombre}"}} {h["sum"]:.6f}')
+                lineas.append(f'guiashipping_span_seconds_count{{span="{nombre}"}} {h["count"]}')
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+_log_lock = threading.Lock()
+_servidor = None
+_servidor_lock = threading.Lock()
+
+
+@contextmanager
+def traza(nombre="consulta"):
+    """Abre la traza de una petición; las etapas medidas dentro (en este hilo) se anotan en ella."""
+    t = Traza(nombre)
+    token = _traza_actual.set(t)
+    inicio = time.perf_counter()
+    try:
+        yield t
+    finally:
+        t.duracion = time.perf_counter() - inicio
+        _traza_actual.reset(token)
+        registro.observar(nombre, t.duracion)
+        _escribir_log(t)
+
+
+@contextmanager
+def span(nombre):
+    """Mide la duración del bloque como la etapa `nombre`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_span(nombre, time.perf_counter() - inicio)
+
+
+def registrar_span(nombre, segundos):
+    """Anota una duración ya medida (p. ej. la suma de varios tramos de un stream)."""
+    registro.observar(nombre, segundos)
+    t = _traza_actual.get()
+    if t is not None:
+        t._span(nombre, segundos)
+
+
+def contar(nombre, n=1):
+    if not n:
+        return
+    registro.contar(nombre, n)
+    t = _traza_actual.get()
+    if t is not None:
+        t._contar(nombre, n)
+
+
+def anotar(**atributos):
+    """Añade atributos (modo, tipo de índice...) a la traza actual."""
+    t = _traza_actual.get()
+    if t is not None:
+        with t._lock:
+            t.atributos.update(atributos)
+
+
+def en_contexto(func):
+    """
+    Retorna func ligada al contexto actual, para que las etapas que se ejecuten en otro
+    hilo (pools de hilos) se anoten en la traza de la petición que las lanzó.
+    """
+    contexto = contextvars.copy_context()
+    return lambda *args, **kwargs: contexto.run(func, *args, **kwargs)
+
+
+def _escribir_log(t):
+    ruta = config.get("METRICS_LOG")
+    if not ruta:
+        return
+    linea = json.dumps(t.resumen(), ensure_ascii=False)
+    try:
+        with _log_lock, open(ruta, "a", encoding="utf-8") as f:
+            f.write(linea + "\n")
+    except OSError as e:
+        print(f"⚠️ No se pudo escribir el log de métricas: {e}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = registro.prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass  # Sin una línea por cada scrape
+
+
+def iniciar_servidor(puerto=None):
+    """
+    Sirve /metrics en el puerto dado (por defecto METRICS_PORT) en un hilo de fondo.
+    Solo se inicia una vez por proceso; sin puerto configurado no hace nada.
+    """
+    global _servidor
+    puerto = puerto or config.get("METRICS_PORT")
+    if not puerto:
+        return None
+    with _servidor_lock:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer(("127.0.0.1", int(puerto)), _Handler)
+            except OSError as e:
+                print(f"⚠️ No se pudo iniciar el servidor de métricas en el puerto {puerto}: {e}")
+                return None
+            threading.Thread(target=_servidor.serve_forever, daemon=True, name="metricas").start()
+    return _servidor
@@ -0,0 +1,157 @@
+# motor_busqueda.py
+
+import os
+import threading
+import config
+from documentos import DocumentUploader
+from faiss_manager import FAISSManager
+from cache_respuestas import CacheRespuestas
+from enrutador import EnrutadorIntencion
+from ingesta import cargar_indice_publicado
+
+# Registro de motores por proceso: Streamlit re-ejecuta app.py en cada interacción
+# y para cada sesión, pero los módulos importados se conservan, así que el índice
+# se construye una sola vez y todas las sesiones lo comparten en modo lectura.
+_motores = {}
+_lock = threading.Lock()
+
+
+class MotorBusqueda:
+    def __init__(self, faiss_manager, documento_cargado):
+        self.faiss_manager = faiss_manager
+        self.documento_cargado = documento_cargado
+        # Búsqueda híbrida por defecto: si la API de embeddings tarda o falla, se responde con BM25
+        self.search_mode = config.get("SEARCH_MODE", "hybrid")
+        self.embed_timeout = float(config.get("SEARCH_EMBED_TIMEOUT", "3"))
+        self.cache_respuestas = CacheRespuestas(
+            umbral=float(config.get("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            ttl=int(config.get("SEMANTIC_CACHE_TTL", "3600")),
+            max_entradas=int(config.get("SEMANTIC_CACHE_SIZE", "500")),
+        )
+        # Decide qué consultas necesitan datos de productos. Usa el mismo pool y las mismas
+        # llamadas en curso que la búsqueda y la caché semántica (un solo embedding por consulta)
+        self.enrutador = EnrutadorIntencion(
+            lambda textos, timeout=None: self.faiss_manager.embed_queries(textos, timeout=timeout),
+            timeout=self.embed_timeout,
+        )
+
+    def preparar(self):
+        """
+        Trabajo previo a la primera consulta: los prototipos del enrutador.
+        Si falla se avisa y el enrutador los reintenta más tarde en segundo plano.
+        """
+        try:
+            self.enrutador.preparar()
+        except Exception as e:
+            print(f"⚠️ No se pudieron calcular los prototipos del enrutador: {e}")
+
+    def buscar_chunks(self, query, k=3):
+        """
+        Retorna la lista de los k chunks más relevantes para la consulta.
+        Si no hay documento cargado o la búsqueda falla, retorna [].
+        """
+        if not self.documento_cargado:
+            return []
+        try:
+            return self.faiss_manager.search_similar_chunks(
+                query, k=k, mode=self.search_mode, embed_timeout=self.embed_timeout
+            )
+        except Exception:
+            return []
+
+    def embedding_consulta(self, query):
+        """
+        Embedding de la consulta con el plazo embed_timeout, o None si no llega a tiempo o falla.
+        Si la búsqueda o el enrutador ya lo pidieron se reutiliza esa misma llamada.
+        """
+        try:
+            return self.faiss_manager.embed_queries([query], timeout=self.embed_timeout)[0]
+        except Exception:
+            return None
+
+    def buscar_respuesta_en_cache(self, query, contexto, modo):
+        """
+        Busca una consulta parecida en la caché semántica.
+        Retorna (respuesta o None, embedding de la consulta o None).
+        El embedding es el mismo que usa buscar_chunks, así que no supone una llamada extra
+        a la API; si no está en embed_timeout segundos se continúa sin caché.
+        """
+        query_emb = self.embedding_consulta(query)
+        if query_emb is None:
+            return None, None
+        return self.cache_respuestas.buscar(query_emb, contexto, modo), query_emb
+
+    def guardar_respuesta(self, query, query_emb, contexto, modo, respuesta):
+        """
+        Guarda la respuesta generada en la caché semántica. Sin query_emb (la búsqueda en
+        la caché no esperó al embedding) se obtiene ahora, que normalmente ya está en caché.
+        """
+        # Los mensajes de error no se guardan
+        if not respuesta or respuesta.startswith("❌"):
+            return
+        if query_emb is None:
+            query_emb = self.embedding_consulta(query)
+        if query_emb is not None:
+            self.cache_respuestas.guardar(query, query_emb, contexto, modo, respuesta)
+
+
+def _construir_motor(pdf_path, api_key):
+    """
+    Carga el índice del PDF (desde la caché si existe) y crea el motor.
+    """
+    faiss_manager = FAISSManager(
+        api_key=api_key,
+        index_type=config.get("FAISS_INDEX_TYPE", "flat"),
+        nprobe=int(config.get("FAISS_NPROBE", "16")),
+        ef_search=int(config.get("FAISS_EF_SEARCH", "64")),
+    )
+    documento_cargado = False
+
+    # Si hay un índice publicado por ingesta.py, se usa ese y no se indexa nada en la app
+    index_dir = config.get("INDEX_DIR", "indices")
+    manifest = cargar_indice_publicado(faiss_manager, index_dir)
+    if manifest is not None:
+        print(f"✅ Índice {manifest['version']} cargado ({manifest['chunks']} chunks)")
+        documento_cargado = True
+    elif os.path.exists(pdf_path):
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+        cache_key = faiss_manager.cache_key(pdf_bytes)
+
+        # Si el índice de este PDF ya está en caché, no hace falta leerlo ni generar embeddings
+        if faiss_manager.load_cached_index(cache_key):
+            documento_cargado = True
+        else:
+            doc_uploader = DocumentUploader()
+            # Crear el índice FAISS leyendo el PDF página a página (el chunker consume el stream
+            # directamente y cada chunk conserva su página). Sin pool de procesos dentro de la app:
+            # la extracción en paralelo de documentos grandes es cosa de ingesta.py
+            try:
+                with open(pdf_path, "rb") as f:
+                    faiss_manager.create_faiss_index({pdf_path: doc_uploader.iter_pages(f, workers=1)}, cache_key=cache_key)
+                documento_cargado = faiss_manager.index is not None
+            except Exception as e:
+                print(f"⚠️ No se pudo crear el índice FAISS: {e}")
+
+    motor = MotorBusqueda(faiss_manager, documento_cargado)
+    motor.preparar()
+    return motor
+
+
+def obtener_motor(pdf_path, api_key):
+    """
+    Retorna el motor de búsqueda compartido para el PDF dado.
+    Se construye una única vez por proceso; las llamadas concurrentes esperan
+    a que termine la primera construcción en lugar de repetirla.
+    """
+    motor = _motores.get(pdf_path)
+    if motor is not None:
+        return motor
+    with _lock:
+        motor = _motores.get(pdf_path)
+        if motor is None:
+            motor = _construir_motor(pdf_path, api_key)
+            # Si falló la carga no se registra, para reintentar en la siguiente ejecución
+            if motor.documento_cargado:
+                _motores[pdf_path] = motor
+        return motor
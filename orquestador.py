@@ -0,0 +1,214 @@
+# orquestador.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config
+from AI_model import (
+    analizar_documento_solo_texto_stream,
+    analizar_productos_stream,
+    obtener_datos_productos,
+    get_amazon_mock_data,
+    get_aliexpress_mock_data,
+)
+import metricas
+from enrutador import EnrutadorIntencion
+from chunker import count_tokens
+from prompts import PROMPT_TOKEN_BUDGET, MAX_FRACCION_MEMORIA, prompt_basico, prompt_productos, texto_memoria
+
+# Tiempo máximo (segundos) para los pasos previos a la generación: búsqueda, caché y datos de productos
+PIPELINE_TIMEOUT = float(config.get("PIPELINE_TIMEOUT", "15"))
+
+# Chunks candidatos que se recuperan; prompts.py se queda con los que caben en el presupuesto
+CHUNKS_CANDIDATOS = int(config.get("PROMPT_CHUNK_CANDIDATES", "5"))
+
+# Hilos propios para las llamadas bloqueantes: asyncio.run() espera al ejecutor por defecto al
+# terminar, y así una descarga de productos que ya no hace falta no retrasa la respuesta
+_executor = ThreadPoolExecutor(max_workers=int(config.get("PIPELINE_WORKERS", "8")))
+
+# Tipos de análisis que se muestran junto a cada respuesta
+TIPOS_ANALISIS = {
+    ("productos", False): "📊 Análisis con datos de productos",
+    ("productos", True): "📊 Análisis con datos de productos (detectado automáticamente)",
+    ("basico", False): "📝 Respuesta básica",
+    ("basico", True): "📝 Respuesta del conocimiento base",
+}
+
+def elegir_modo(user_message, configuracion="auto", enrutador=None):
+    """
+    Retorna (modo, tipo de análisis), donde modo es "productos" o "basico".
+    - configuracion: "auto", "productos" o "basico" (selector de la barra lateral).
+    - enrutador: EnrutadorIntencion para el modo automático; sin él solo se usa el prefiltro
+      léxico y, si es ambiguo, la respuesta básica.
+    """
+    if configuracion in ("productos", "basico"):
+        return configuracion, TIPOS_ANALISIS[(configuracion, False)]
+    # auto: detección automática
+    if enrutador is not None:
+        modo = enrutador.clasificar(user_message)
+    else:
+        modo = EnrutadorIntencion.prefiltro(user_message) or "basico"
+    return modo, TIPOS_ANALISIS[(modo, True)]
+
+def _en_hilo(func, *args):
+    # La función se ejecuta en el contexto de la petición para que sus etapas se anoten en su traza
+    return asyncio.get_running_loop().run_in_executor(_executor, metricas.en_contexto(func), *args)
+
+def _clave_memoria(memoria):
+    # Parte de la clave de la caché semántica: la misma consulta tras otra conversación
+    # (p. ej. "¿y en Amazon?") no debe reutilizar la respuesta. Es intencionado que, por eso,
+    # en la práctica solo acierten las consultas del primer turno (sin memoria) o las de
+    # conversaciones idénticas: una respuesta correcta en otro contexto sería peor que un fallo
+    return texto_memoria(memoria, int(PROMPT_TOKEN_BUDGET * MAX_FRACCION_MEMORIA))
+
+async def _preparar(motor, plan):
+    user_message = plan["user_message"]
+    modo = plan["modo"]
+    if modo == "productos":
+        # El análisis de productos no usa el contexto del documento, así que no se busca en él.
+        # La caché semántica y los datos de productos se consultan a la vez.
+        # Si los productos llegan antes que el embedding de la consulta, no se espera a la caché
+        # (la respuesta se guarda igualmente en ella al terminar).
+        plan["contexto"] = _clave_memoria(plan["memoria"])
+        cache = asyncio.ensure_future(_en_hilo(motor.buscar_respuesta_en_cache, user_message, plan["contexto"], modo))
+        productos = plan["_productos"] = asyncio.ensure_future(
+            _en_hilo(obtener_datos_productos, user_message, config.get("RAPIDAPI_KEY"))
+        )
+        await asyncio.wait([cache, productos], return_when=asyncio.FIRST_COMPLETED)
+        if cache.done():
+            plan["respuesta_cache"], plan["query_emb"] = cache.result()
+            if plan["respuesta_cache"] is not None:
+                productos.cancel()  # Los datos de productos ya no hacen falta
+                return
+        plan["datos_productos"] = await asyncio.shield(productos)
+    else:
+        # La búsqueda y la caché comparten el embedding de la consulta (si la búsqueda agotó su plazo,
+        # la caché espera a la misma llamada en curso, sin repetirla, y no más allá del plazo)
+        with metricas.span("retrieve"):
+            plan["chunks"] = await _en_hilo(motor.buscar_chunks, user_message, CHUNKS_CANDIDATOS)
+        plan["contexto"] = "\n\n".join(filter(None, [_clave_memoria(plan["memoria"]), *plan["chunks"]]))
+        plan["respuesta_cache"], plan["query_emb"] = await _en_hilo(
+            motor.buscar_respuesta_en_cache, user_message, plan["contexto"], modo
+        )
+
+async def preparar_respuesta(motor, user_message, modo, timeout=PIPELINE_TIMEOUT, memoria=None):
+    """
+    Ejecuta los pasos previos a la generación según el modo, lanzando a la vez los que son
+    independientes y omitiendo los que el modo no va a usar. Si se supera el timeout, los
+    pasos pendientes se cancelan y se continúa con lo obtenido hasta entonces.
+    - memoria: MemoriaConversacion de la sesión (opcional).
+    Retorna un dict (plan) con: modo, user_message, memoria (copia del contenido), chunks,
+    contexto (la conversación previa y los chunks unidos, que identifican el contexto en la
+    caché semántica), datos_productos, respuesta_cache, query_emb y error_generacion (lo
+    rellena generar_respuesta_stream si Gemini falla a mitad de la respuesta).
+    """
+    plan = {
+        "modo": modo,
+        "user_message": user_message,
+        "memoria": memoria.contexto() if memoria is not None else None,
+        "chunks": [],
+        "contexto": "",
+        "datos_productos": None,
+        "respuesta_cache": None,
+        "query_emb": None,
+        "error_generacion": None,
+    }
+    metricas.anotar(modo=modo)
+    try:
+        await asyncio.wait_for(_preparar(motor, plan), timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ La preparación de la respuesta superó {timeout}s, se continúa con lo obtenido.")
+        metricas.contar("pipeline_timeout")
+    # Los datos de productos que ya llegaron se usan aunque el plazo cortara la espera
+    productos = plan.pop("_productos", None)
+    if plan["datos_productos"] is None and productos is not None and productos.done() and not productos.cancelled():
+        plan["datos_productos"] = productos.result()
+    metricas.contar("cache_semantica_aciertos" if plan["respuesta_cache"] is not None else "cache_semantica_fallos")
+
+    if modo == "productos" and plan["respuesta_cache"] is None and plan["datos_productos"] is None:
+        plan["datos_productos"] = (get_amazon_mock_data(user_message), get_aliexpress_mock_data(user_message))
+    return plan
+
+def generar_respuesta_stream(motor, plan):
+    """
+    Generador con los fragmentos de la respuesta: la de la caché semántica si la hay,
+    o la generada por Gemini, que se guarda en la caché al terminar. Si la generación falla
+    (el último fragmento es el mensaje de error) se anota en plan["error_generacion"] y no se guarda.
+    """
+    if plan["respuesta_cache"] is not None:
+        yield plan["respuesta_cache"]
+        return
+
+    user_message = plan["user_message"]
+    inicio = time.perf_counter()
+    if plan["modo"] == "productos":
+        prompt, informe = prompt_productos(user_message, *plan["datos_productos"], memoria=plan["memoria"])
+        stream = analizar_productos_stream(prompt, estado=plan)
+    else:
+        prompt, informe = prompt_basico(user_message, plan["chunks"], memoria=plan["memoria"])
+        stream = analizar_documento_solo_texto_stream(prompt, estado=plan)
+    plan["informe_prompt"] = informe
+    metricas.registrar_span("prompt_build", time.perf_counter() - inicio)
+    metricas.contar("tokens_prompt", informe["total"])
+    metricas.anotar(tokens_prompt=informe)
+
+    # Solo cuenta el tiempo esperando a Gemini, no el que tarda quien consume el generador
+    partes = []
+    generacion = 0.0
+    inicio = time.perf_counter()
+    for fragmento in stream:
+        generacion += time.perf_counter() - inicio
+        partes.append(fragmento)
+        yield fragmento
+        inicio = time.perf_counter()
+    generacion += time.perf_counter() - inicio
+    metricas.registrar_span("generate", generacion)
+
+    respuesta = "".join(partes)
+    metricas.contar("tokens_respuesta", count_tokens(respuesta))
+    if plan["error_generacion"] is not None:
+        metricas.contar("errores")
+        return
+    motor.guardar_respuesta(user_message, plan["query_emb"], plan["contexto"], plan["modo"], respuesta)
+
+def responder_stream(motor, user_message, configuracion="auto", memoria=None):
+    """
+    Responde una consulta completa (enrutado, preparación y generación) dentro de su traza.
+    Generador de eventos (tipo, valor):
+    - ("modo", (modo, tipo de análisis)): en cuanto se elige el modo, antes de buscar nada.
+    - ("fragmento", texto): cada trozo de la respuesta a medida que se genera.
+    - ("fin", resultado): siempre el último; dict con respuesta, analysis_type y traza
+      (resumen de la traza de la consulta).
+    Los errores no se lanzan: la respuesta pasa a ser el mensaje de error (o termina con él si
+    Gemini falla a mitad). Solo las respuestas completas se añaden a la memoria de la conversación.
+    """
+    respuesta = ""
+    completa = False
+    with metricas.traza("consulta") as traza:
+        try:
+            with metricas.span("route"):
+                modo, analysis_type = elegir_modo(user_message, configuracion, motor.enrutador)
+            yield "modo", (modo, analysis_type)
+            plan = asyncio.run(preparar_respuesta(motor, user_message, modo, memoria=memoria))
+            for fragmento in generar_respuesta_stream(motor, plan):
+                respuesta += fragmento
+                yield "fragmento", fragmento
+            completa = plan["error_generacion"] is None
+        except Exception as e:
+            respuesta = f"❌ Ocurrió un error al procesar tu consulta: {str(e)}"
+            analysis_type = "⚠️ Error"
+            metricas.contar("errores")
+
+    # El resumen de la conversación se actualiza en segundo plano
+    if memoria is not None and completa and respuesta:
+        memoria.agregar_turno(user_message, respuesta)
+    yield "fin", {"respuesta": respuesta, "analysis_type": analysis_type, "traza": traza.resumen()}
+
+def obtener_respuesta_inteligente(motor, user_message, configuracion="auto", memoria=None):
+    """
+    Obtiene la respuesta completa usando la mejor estrategia según el tipo de consulta.
+    Retorna (respuesta, tipo de análisis).
+    """
+    for tipo, valor in responder_stream(motor, user_message, configuracion, memoria):
+        if tipo == "fin":
+            return valor["respuesta"], valor["analysis_type"]
@@ -0,0 +1,47 @@
+# perezoso.py
+#
+# Importación diferida de dependencias pesadas (faiss, numpy, Gemini, Mistral, PyPDF2):
+#   faiss = importar("faiss")
+# crea un módulo intermedio que no importa nada hasta el primer acceso a un atributo
+# (faiss.IndexFlatIP, ...). Así arrancar la aplicación no paga lo que todavía no usa.
+
+import importlib
+import sys
+import threading
+import types
+
+_lock = threading.RLock()
+
+
+class ModuloPerezoso(types.ModuleType):
+    def __init__(self, nombre):
+        super().__init__(nombre)
+        self.__dict__["_modulo"] = None
+
+    def _cargar(self):
+        modulo = self.__dict__["_modulo"]
+        if modulo is None:
+            with _lock:
+                modulo = self.__dict__["_modulo"]
+                if modulo is None:
+                    modulo = importlib.import_module(self.__name__)
+                    self.__dict__["_modulo"] = modulo
+        return modulo
+
+    def __getattr__(self, atributo):
+        return getattr(self._cargar(), atributo)
+
+    def __dir__(self):
+        return dir(self._cargar())
+
+
+def importar(nombre):
+    """
+    Retorna el módulo `nombre`: el real si ya está importado o un ModuloPerezoso que lo
+    importará en el primer uso.
+    """
+    modulo = sys.modules.get(nombre)
+    if modulo is not None:
+        return modulo
+    return ModuloPerezoso(nombre)
+
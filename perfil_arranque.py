@@ -0,0 +1,125 @@
+# perfil_arranque.py
+#
+# Mide cuánto tarda en importarse cada módulo al arrancar la aplicación (arranque en frío),
+# usando `python -X importtime` en un proceso nuevo.
+# Uso:
+#   python perfil_arranque.py --top 25
+#   python perfil_arranque.py --salida arranque.json
+#
+# El JSON incluye el commit, el tiempo total y el tiempo acumulado de cada módulo,
+# pensado para comparar entre commits y detectar regresiones del arranque.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Módulos que importa la aplicación al arrancar (lo mismo que paga cada worker de Streamlit)
+MODULOS_APP = ("streamlit", "orquestador", "motor_busqueda", "memoria", "metricas", "AI_model")
+
+# Dependencias pesadas que no deberían cargarse hasta su primer uso
+PESADAS = ("faiss", "numpy", "google.generativeai", "mistralai", "PyPDF2")
+
+
+def _directorio():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def medir_importaciones(modulos=MODULOS_APP):
+    """
+    Importa los módulos en un proceso nuevo con -X importtime.
+    Retorna (tiempos, cargados): tiempos es una lista de dicts con el módulo, su tiempo
+    propio y el acumulado (microsegundos); cargados, las dependencias pesadas que se cargaron.
+    """
+    codigo = (
+        f"import sys\nimport {', '.join(modulos)}\n"
+        f"print(','.join(m for m in {PESADAS!r} if m in sys.modules))"
+    )
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        capture_output=True, text=True, cwd=_directorio(),
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"No se pudieron importar los módulos:\n{proceso.stderr[-2000:]}")
+
+    tiempos = []
+    for linea in proceso.stderr.splitlines():
+        # Formato: "import time:       123 |        456 |   modulo"
+        if not linea.startswith("import time:"):
+            continue
+        partes = linea[len("import time:"):].split("|")
+        if len(partes) != 3 or not partes[0].strip().isdigit():
+            continue  # Cabecera
+        tiempos.append({
+            "modulo": partes[2].strip(),
+            "propio_us": int(partes[0]),
+            "acumulado_us": int(partes[1]),
+            "nivel": (len(partes[2]) - len(partes[2].lstrip())) // 2,
+        })
+    cargados = [m for m in proceso.stdout.strip().split(",") if m]
+    return tiempos, cargados
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=_directorio(),
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def informe(tiempos, cargados, modulos, top):
+    """Resumen del arranque: total, módulos de primer nivel y los `top` más lentos."""
+    primer_nivel = [t for t in tiempos if t["nivel"] == 0]
+    return {
+        "commit": _commit_actual(),
+        "python": sys.version.split()[0],
+        "total_ms": round(sum(t["acumulado_us"] for t in primer_nivel) / 1000, 1),
+        "pesadas_cargadas": cargados,
+        "modulos_app_ms": {
+            t["modulo"]: round(t["acumulado_us"] / 1000, 1)
+            for t in primer_nivel if t["modulo"] in modulos
+        },
+        "mas_lentos_ms": [
+            {"modulo": t["modulo"], "acumulado": round(t["acumulado_us"] / 1000, 1),
+             "propio": round(t["propio_us"] / 1000, 1)}
+            for t in sorted(tiempos, key=lambda t: -t["acumulado_us"])[:top]
+        ],
+    }
+
+
+def _tabla(resultado):
+    lineas = [
+        f"Arranque en frío ({resultado['commit'] or 'sin commit'}, Python {resultado['python']}): "
+        f"{resultado['total_ms']} ms",
+        f"Dependencias pesadas cargadas al importar: {', '.join(resultado['pesadas_cargadas']) or 'ninguna'}",
+        "",
+        f"{'acumulado ms':>13} {'propio ms':>10}  módulo",
+    ]
+    for t in resultado["mas_lentos_ms"]:
+        lineas.append(f"{t['acumulado']:>13} {t['propio']:>10}  {t['modulo']}")
+    return "\n".join(lineas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de importación de cada módulo al arrancar GuíaShipping.")
+    parser.add_argument("--top", type=int, default=20, help="Número de módulos más lentos a mostrar")
+    parser.add_argument("--modulos", nargs="+", default=MODULOS_APP, help="Módulos a importar")
+    parser.add_argument("--salida", default=None, help="Fichero JSON de resultados (por defecto, una tabla)")
+    args = parser.parse_args(argv)
+
+    tiempos, cargados = medir_importaciones(args.modulos)
+    resultado = informe(tiempos, cargados, args.modulos, args.top)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(json.dumps(resultado, ensure_ascii=False, indent=2) + "\n")
+    else:
+        print(_tabla(resultado))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# prompts.py
+
+import config
+from bm25 import tokenize
+from chunker import count_tokens
+
+# Tokens máximos del prompt de cada consulta (sin las instrucciones del sistema, que van aparte)
+PROMPT_TOKEN_BUDGET = int(config.get("PROMPT_TOKEN_BUDGET", "1200"))
+
+# Parte del presupuesto que puede ocupar la consulta del usuario
+MAX_FRACCION_CONSULTA = 0.25
+
+# Parte del presupuesto para la conversación previa (resumen + últimos turnos)
+MAX_FRACCION_MEMORIA = 0.3
+
+# Tokens máximos de cada respuesta anterior que se incluye literalmente
+MAX_TOKENS_RESPUESTA_PREVIA = 120
+
+# Un chunk recortado por debajo de este tamaño ya no aporta contexto útil
+MIN_TOKENS_CHUNK = 40
+
+# Columnas de la tabla de productos, en orden (la url no aporta nada al análisis)
+COLUMNAS_PRODUCTOS = ("precio", "precio_original", "rating", "reviews", "pedidos", "envio_gratis")
+MAX_CARACTERES_TITULO = 60
+
+PLANTILLA_MEMORIA = """Conversación previa:
+{memoria}
+
+"""
+
+PLANTILLA_BASICA = """Usa el siguiente contexto para responder a la consulta del usuario sobre dropshipping.
+
+Contexto:
+{contexto}
+
+Consulta:
+{consulta}
+
+Recuerda ser conversacional y amigable, como un mentor experto en e-commerce."""
+
+PLANTILLA_SIN_CONTEXTO = """Analiza la siguiente consulta de dropshipping y proporciona información detallada.
+
+Consulta:
+{consulta}
+
+Recuerda ser conversacional y amigable, enfocándote exclusivamente en temas de dropshipping."""
+
+PLANTILLA_PRODUCTOS = """ANÁLISIS DE PRODUCTOS PARA DROPSHIPPING: {consulta}
+
+{tablas}
+
+Analiza este nicho para dropshipping."""
+
+
+def recortar(texto, max_tokens):
+    """
+    Recorta el texto a max_tokens (aproximados), cortando entre palabras y
+    preferiblemente al final de una frase.
+    """
+    if count_tokens(texto) <= max_tokens:
+        return texto
+    palabras = []
+    tokens = 0
+    for palabra in texto.split():
+        n = count_tokens(palabra)
+        if tokens + n > max_tokens:
+            break
+        palabras.append(palabra)
+        tokens += n
+    recorte = " ".join(palabras)
+    fin_frase = max(recorte.rfind(". "), recorte.rfind("? "), recorte.rfind("! "))
+    if fin_frase > len(recorte) // 2:
+        return recorte[:fin_frase + 1]
+    return recorte + "…"
+
+
+def ordenar_chunks(consulta, chunks):
+    """
+    Ordena los chunks recuperados por relevancia: combina su posición en la búsqueda con
+    la fracción de términos de la consulta que contienen. Descarta los repetidos.
+    """
+    terminos = set(tokenize(consulta))
+    vistos = set()
+    candidatos = []
+    for posicion, chunk in enumerate(chunks):
+        if not chunk or chunk in vistos:
+            continue
+        vistos.add(chunk)
+        cobertura = len(terminos & set(tokenize(chunk))) / len(terminos) if terminos else 0.0
+        candidatos.append((cobertura + 1 / (1 + posicion), posicion, chunk))
+    candidatos.sort(key=lambda c: (-c[0], c[1]))
+    return [chunk for _, _, chunk in candidatos]
+
+
+def seleccionar_chunks(consulta, chunks, max_tokens):
+    """
+    Retorna los chunks más relevantes que caben en max_tokens; el último se recorta
+    si queda sitio suficiente para que sea útil.
+    """
+    seleccion = []
+    disponibles = max_tokens
+    for chunk in ordenar_chunks(consulta, chunks):
+        n = count_tokens(chunk)
+        if n > disponibles:
+            if disponibles >= MIN_TOKENS_CHUNK:
+                seleccion.append(recortar(chunk, disponibles))
+            break
+        seleccion.append(chunk)
+        disponibles -= n
+    return seleccion
+
+
+def _celda(valor):
+    if valor is None or valor == "N/A" or valor == "$N/A":
+        return "-"
+    if isinstance(valor, bool):
+        return "sí" if valor else "no"
+    return str(valor).replace("|", "/").replace("\n", " ")
+
+
+def tabla_productos(datos, max_filas=None):
+    """
+    Serializa los datos de una fuente ({"productos": [...], "source": ...}) como una tabla
+    compacta separada por "|", solo con las columnas que tienen algún valor.
+    """
+    productos = datos.get("productos", [])[:max_filas]
+    columnas = [c for c in COLUMNAS_PRODUCTOS if any(_celda(p.get(c)) != "-" for p in productos)]
+    lineas = [f"{datos.get('source', 'Fuente desconocida')}:", "|".join(["producto", *columnas])]
+    for p in productos:
+        titulo = _celda(p.get("titulo"))
+        if len(titulo) > MAX_CARACTERES_TITULO:
+            titulo = titulo[:MAX_CARACTERES_TITULO - 1] + "…"
+        lineas.append("|".join([titulo, *(_celda(p.get(c)) for c in columnas)]))
+    if not productos:
+        lineas.append("(sin resultados)")
+    return "\n".join(lineas)
+
+
+def texto_memoria(memoria, max_tokens):
+    """
+    Serializa la memoria de la conversación ({"resumen": ..., "turnos": [...]}) en max_tokens.
+    Los turnos más recientes tienen prioridad; después, el resumen de los anteriores.
+    """
+    if not memoria or not (memoria.get("resumen") or memoria.get("turnos")):
+        return ""
+    lineas = []
+    disponibles = max_tokens
+    for consulta, respuesta in reversed(memoria.get("turnos", [])):
+        turno = f"Usuario: {consulta}\nAsistente: {recortar(respuesta, MAX_TOKENS_RESPUESTA_PREVIA)}"
+        n = count_tokens(turno)
+        if n > disponibles:
+            break
+        lineas.insert(0, turno)
+        disponibles -= n
+    resumen = memoria.get("resumen", "")
+    if resumen and disponibles >= MIN_TOKENS_CHUNK:
+        lineas.insert(0, f"Resumen: {recortar(resumen, disponibles)}")
+    return "\n".join(lineas)
+
+
+def _con_memoria(prompt, memoria):
+    return PLANTILLA_MEMORIA.format(memoria=memoria) + prompt if memoria else prompt
+
+
+def _informe(secciones, prompt):
+    informe = {nombre: count_tokens(texto) for nombre, texto in secciones.items()}
+    informe["total"] = count_tokens(prompt)
+    informe["plantilla"] = informe["total"] - sum(v for k, v in informe.items() if k != "total")
+    return informe
+
+
+def prompt_basico(consulta, chunks, presupuesto=PROMPT_TOKEN_BUDGET, memoria=None):
+    """
+    Construye el prompt de respuesta básica con la conversación previa (si hay) y los
+    chunks que caben en el presupuesto.
+    Retorna (prompt, informe) donde informe tiene los tokens de cada sección y el total.
+    """
+    consulta = recortar(consulta, int(presupuesto * MAX_FRACCION_CONSULTA))
+    historial = texto_memoria(memoria, int(presupuesto * MAX_FRACCION_MEMORIA))
+    if not chunks:
+        prompt = _con_memoria(PLANTILLA_SIN_CONTEXTO.format(consulta=consulta), historial)
+        return prompt, _informe({"consulta": consulta, "memoria": historial}, prompt)
+
+    fijo = count_tokens(_con_memoria(PLANTILLA_BASICA.format(contexto="", consulta=consulta), historial))
+    contexto = "\n\n".join(seleccionar_chunks(consulta, chunks, presupuesto - fijo))
+    prompt = _con_memoria(PLANTILLA_BASICA.format(contexto=contexto, consulta=consulta), historial)
+    return prompt, _informe({"consulta": consulta, "memoria": historial, "contexto": contexto}, prompt)
+
+
+def prompt_productos(consulta, amazon_data, aliexpress_data, presupuesto=PROMPT_TOKEN_BUDGET, memoria=None):
+    """
+    Construye el prompt del análisis de productos con la conversación previa (si hay)
+    y las tablas de ambas fuentes.
+    Si no caben en el presupuesto se quitan filas del final de la tabla más larga.
+    Retorna (prompt, informe).
+    """
+    consulta = recortar(consulta, int(presupuesto * MAX_FRACCION_CONSULTA))
+    historial = texto_memoria(memoria, int(presupuesto * MAX_FRACCION_MEMORIA))
+    fijo = count_tokens(_con_memoria(PLANTILLA_PRODUCTOS.format(consulta=consulta, tablas=""), historial))
+    filas = [len(amazon_data.get("productos", [])), len(aliexpress_data.get("productos", []))]
+    while True:
+        tablas = tabla_productos(amazon_data, filas[0]) + "\n\n" + tabla_productos(aliexpress_data, filas[1])
+        if fijo + count_tokens(tablas) <= presupuesto or max(filas) <= 1:
+            break
+        filas[filas.index(max(filas))] -= 1
+    prompt = _con_memoria(PLANTILLA_PRODUCTOS.format(consulta=consulta, tablas=tablas), historial)
+    return prompt, _informe({"consulta": consulta, "memoria": historial, "productos": tablas}, prompt)
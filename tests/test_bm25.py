@@ -0,0 +1,49 @@
+# test_bm25.py
+
+import json
+
+import numpy as np
+
+from bm25 import BM25Index, FrozenBM25Index
+
+TEXTOS = {
+    0: "Cómo elegir un proveedor fiable de dropshipping",
+    1: "Proveedores de AliExpress con envíos rápidos a España",
+    2: "Márgenes de ganancia en relojes inteligentes",
+    4: "El proveedor envía el producto directamente al cliente",
+}
+
+
+def crear_indice():
+    indice = BM25Index()
+    for chunk_id, texto in TEXTOS.items():
+        indice.add(chunk_id, texto)
+    return indice
+
+
+def test_indice_mapeado_puntua_igual(tmp_path):
+    indice = crear_indice()
+    ruta = str(tmp_path / "indice.bm25.json")
+    indice.save(ruta)
+
+    mapeado = BM25Index.open(ruta)
+    assert isinstance(mapeado, FrozenBM25Index)
+    assert isinstance(mapeado.ids, np.memmap)
+    for consulta in ("proveedor de envíos", "ganancia", "nada que ver"):
+        esperado = indice.search(consulta, k=3)
+        obtenido = mapeado.search(consulta, k=3)
+        assert [i for i, _ in obtenido] == [i for i, _ in esperado]
+        assert np.allclose([p for _, p in obtenido], [p for _, p in esperado])
+
+    cargado = BM25Index.load(ruta)
+    assert cargado.postings == indice.postings and cargado.doc_len == indice.doc_len
+
+
+def test_formato_anterior(tmp_path):
+    indice = crear_indice()
+    ruta = tmp_path / "antiguo.bm25.json"
+    ruta.write_text(json.dumps({"k1": indice.k1, "b": indice.b, "postings": indice.postings,
+                                "doc_len": indice.doc_len}), encoding="utf-8")
+    abierto = BM25Index.open(str(ruta))
+    assert isinstance(abierto, BM25Index)
+    assert abierto.search("proveedor", k=2) == indice.search("proveedor", k=2)
@@ -0,0 +1,81 @@
+# test_cache_productos.py
+
+import threading
+
+from cache_productos import CacheProductos
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+class Cargador:
+    def __init__(self):
+        self.llamadas = 0
+        self.bloqueo = threading.Event()
+        self.bloqueo.set()
+
+    def __call__(self):
+        self.bloqueo.wait(5)
+        self.llamadas += 1
+        return {"productos": [f"version {self.llamadas}"]}
+
+
+def crear_cache(reloj, **kwargs):
+    return CacheProductos(ttl=60, max_antiguedad=600, reloj=reloj, **kwargs)
+
+
+def esperar_refrescos(cache):
+    cache._executor.shutdown(wait=True)
+
+
+def test_entrada_fresca():
+    reloj, cargar = Reloj(), Cargador()
+    cache = crear_cache(reloj)
+    assert cache.obtener("amazon", "Relojes", "ES", cargar) == {"productos": ["version 1"]}
+    reloj.ahora += 60
+    assert cache.obtener("amazon", "  relojes ", "es", cargar) == {"productos": ["version 1"]}
+    esperar_refrescos(cache)
+    assert cargar.llamadas == 1
+
+
+def test_entrada_caducada_se_sirve_y_se_refresca():
+    reloj, cargar = Reloj(), Cargador()
+    cache = crear_cache(reloj)
+    cache.obtener("amazon", "relojes", "ES", cargar)
+    reloj.ahora += 61
+
+    cargar.bloqueo.clear()  # El refresco no termina hasta que se libera
+    assert cache.obtener("amazon", "relojes", "ES", cargar) == {"productos": ["version 1"]}
+    assert cache.obtener("amazon", "relojes", "ES", cargar) == {"productos": ["version 1"]}
+    cargar.bloqueo.set()
+    esperar_refrescos(cache)
+    assert cargar.llamadas == 2  # Un solo refresco aunque se pidiera dos veces
+    assert cache.obtener("amazon", "relojes", "ES", cargar) == {"productos": ["version 2"]}
+
+
+def test_entrada_demasiado_antigua_se_carga_de_nuevo():
+    reloj, cargar = Reloj(), Cargador()
+    cache = crear_cache(reloj)
+    cache.obtener("amazon", "relojes", "ES", cargar)
+    reloj.ahora += 601
+    assert cache.obtener("amazon", "relojes", "ES", cargar) == {"productos": ["version 2"]}
+    assert cargar.llamadas == 2
+
+
+def test_no_cachea_lo_que_no_se_debe(tmp_path):
+    reloj, cargar = Reloj(), Cargador()
+    cache = crear_cache(reloj, ruta_sqlite=str(tmp_path / "productos.sqlite"))
+    cache.obtener("amazon", "relojes", "ES", cargar, cachear=lambda valor: False)
+    cache.obtener("amazon", "relojes", "ES", cargar)
+    assert cargar.llamadas == 2
+
+    # La entrada guardada en SQLite sobrevive a un reinicio con su marca de tiempo
+    reloj.ahora += 30
+    reiniciada = crear_cache(reloj, ruta_sqlite=str(tmp_path / "productos.sqlite"))
+    assert reiniciada.obtener("amazon", "relojes", "ES", cargar) == {"productos": ["version 2"]}
+    assert cargar.llamadas == 2
@@ -0,0 +1,61 @@
+# test_chunker.py
+
+import pytest
+
+from chunker import StructuredChunker, count_tokens
+
+
+def frases(prefijo, n):
+    # Cada frase tiene 6 tokens: "<prefijo> número <i> del texto ."
+    return " ".join(f"{prefijo} número {i} del texto." for i in range(n))
+
+
+def test_corta_en_los_parrafos():
+    chunker = StructuredChunker(max_tokens=40, overlap_tokens=0)
+    texto = frases("Uno", 4) + "\n\n" + frases("Dos", 4)  # 24 tokens cada párrafo
+    chunks = list(chunker.iter_chunks(texto))
+    assert [c["text"] for c in chunks] == [frases("Uno", 4), frases("Dos", 4)]
+
+
+def test_titulo_corto_va_con_su_parrafo():
+    chunker = StructuredChunker(max_tokens=40, overlap_tokens=0)
+    texto = "Proveedores\n\n" + frases("Uno", 4) + "\n\n" + frases("Dos", 4)
+    chunks = [c["text"] for c in chunker.iter_chunks(texto)]
+    assert chunks[0] == "Proveedores " + frases("Uno", 4)
+    assert chunks[1] == frases("Dos", 4)
+
+
+def test_solapamiento():
+    chunker = StructuredChunker(max_tokens=30, overlap_tokens=12)
+    chunks = [c["text"] for c in chunker.iter_chunks(frases("Uno", 12))]
+    assert len(chunks) > 1
+    for anterior, siguiente in zip(chunks, chunks[1:]):
+        # Las dos últimas frases (12 tokens) se repiten al inicio del siguiente chunk
+        cola = " ".join(anterior.split(" ")[-10:])
+        assert siguiente.startswith(cola)
+        assert siguiente != anterior
+    assert chunks[-1].endswith("Uno número 11 del texto.")
+
+
+def test_tamano_maximo():
+    chunker = StructuredChunker(max_tokens=25, overlap_tokens=5)
+    sin_puntos = " ".join(f"palabra{i}" for i in range(200))  # Una "frase" de 200 tokens
+    texto = frases("Uno", 20) + "\n\n" + sin_puntos
+    chunks = [c["text"] for c in chunker.iter_chunks(texto)]
+    assert all(count_tokens(c) <= 25 for c in chunks)
+    assert " ".join(chunks).count("palabra199") == 1
+
+
+def test_paginas():
+    chunker = StructuredChunker(max_tokens=20, overlap_tokens=6)
+    paginas = [(1, frases("Uno", 3)), (2, frases("Dos", 3)), (3, "")]
+    chunks = list(chunker.iter_chunks(iter(paginas)))
+    assert chunks[0]["page"] == 1 and chunks[0]["text"].startswith("Uno número 0")
+    # La página es la de la primera frase nueva, no la del solapamiento
+    assert chunks[1]["page"] == 2 and chunks[1]["text"].startswith("Uno número 2 del texto. Dos número 0")
+    assert all(c["page"] in (1, 2) for c in chunks)
+
+
+def test_solapamiento_mayor_que_el_maximo():
+    with pytest.raises(ValueError):
+        StructuredChunker(max_tokens=10, overlap_tokens=10)
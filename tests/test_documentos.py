@@ -0,0 +1,40 @@
+# test_documentos.py
+
+import io
+import os
+import tempfile
+
+from documentos import DocumentUploader
+
+PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "DROPSHIPPING.pdf")
+
+
+class ArchivoSubido(io.BytesIO):
+    """Archivo en memoria con nombre, como los que entrega st.file_uploader."""
+
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def test_paginas_en_paralelo_desde_memoria():
+    with open(PDF, "rb") as f:
+        data = f.read()
+    uploader = DocumentUploader()
+    esperado = list(uploader.iter_pages(ArchivoSubido(data, "doc.pdf"), workers=1))
+
+    temporales = set(os.listdir(tempfile.gettempdir()))
+    paginas = list(uploader.iter_pages(ArchivoSubido(data, "doc.pdf"), workers=2,
+                                       min_parallel_pages=1, pages_per_task=2))
+    assert paginas == esperado
+    # El fichero temporal con la copia del PDF se elimina al terminar
+    assert set(os.listdir(tempfile.gettempdir())) <= temporales
+
+
+def test_paginas_en_paralelo_desde_disco():
+    uploader = DocumentUploader()
+    with open(PDF, "rb") as f:
+        esperado = list(uploader.iter_pages(f, workers=1))
+    with open(PDF, "rb") as f:
+        paginas = list(uploader.iter_pages(f, workers=2, min_parallel_pages=1, pages_per_task=2))
+    assert paginas == esperado
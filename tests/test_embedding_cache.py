@@ -0,0 +1,81 @@
+# test_embedding_cache.py
+
+import json
+import os
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+def clave(i):
+    return EmbeddingCache.make_key("modelo", f"texto {i}")
+
+
+def vector(i, dim=8):
+    return np.full(dim, float(i), dtype=np.float32)
+
+
+def test_persistencia(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put([clave(i) for i in range(10)], [vector(i) for i in range(10)])
+    cache.flush()
+
+    recargada = EmbeddingCache(str(tmp_path))
+    resultados = recargada.get([clave(i) for i in range(11)])
+    assert resultados[10] is None
+    for i in range(10):
+        np.testing.assert_array_equal(resultados[i], vector(i))
+
+
+def test_dos_instancias_no_comparten_filas(tmp_path):
+    # Dos procesos (la app e ingesta.py) abiertos sobre la misma carpeta
+    a = EmbeddingCache(str(tmp_path))
+    b = EmbeddingCache(str(tmp_path))
+    a.put([clave(1)], [vector(1)])
+    b.put([clave(2)], [vector(2)])
+    a.put([clave(3)], [vector(3)])
+
+    for cache in (a, b, EmbeddingCache(str(tmp_path))):
+        resultados = cache.get([clave(1), clave(2), clave(3)])
+        for i, resultado in zip((1, 2, 3), resultados):
+            np.testing.assert_array_equal(resultado, vector(i))
+
+
+def test_fila_reutilizada_por_otra_instancia(tmp_path):
+    a = EmbeddingCache(str(tmp_path), max_queries=2)
+    b = EmbeddingCache(str(tmp_path), max_queries=2)
+    a.put([clave(1)], [vector(1)], kind="query")
+    assert b.get([clave(1)])[0] is not None
+
+    # a desaloja la consulta 1 y reutiliza su fila para otras consultas
+    for i in range(2, 6):
+        a.put([clave(i)], [vector(i)], kind="query")
+    resultados = b.get([clave(i) for i in range(1, 6)])
+    assert resultados[0] is None
+    for i, resultado in zip(range(2, 6), resultados[1:]):
+        if resultado is not None:
+            np.testing.assert_array_equal(resultado, vector(i))
+
+
+def test_desalojo_lru(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_queries=2)
+    cache.put([clave(1)], [vector(1)], kind="query")
+    cache.put([clave(2)], [vector(2)], kind="query")
+    cache.get([clave(1)])
+    cache.put([clave(3)], [vector(3)], kind="query")
+    assert cache.get([clave(2)])[0] is None
+    assert cache.get([clave(1)])[0] is not None
+
+
+def test_migracion_formato_anterior(tmp_path):
+    vectores = np.stack([vector(i) for i in range(3)])
+    vectores.tofile(tmp_path / "vectors.f32")
+    with open(tmp_path / "index.json", "w", encoding="utf-8") as f:
+        json.dump({"dim": 8, "size": 3, "chunks": {clave(0): 0, clave(2): 2},
+                   "queries": [[clave(1), 1]], "free": []}, f)
+
+    cache = EmbeddingCache(str(tmp_path))
+    assert not os.path.exists(tmp_path / "index.json")
+    for i, resultado in enumerate(cache.get([clave(i) for i in range(3)])):
+        np.testing.assert_array_equal(resultado, vector(i))
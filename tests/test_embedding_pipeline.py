@@ -0,0 +1,88 @@
+# test_embedding_pipeline.py
+
+import random
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+import embedding_pipeline
+from embedding_pipeline import EmbeddingPipeline, RetryableError
+
+
+class APIQueFalla:
+    """Stub de la API: falla `fallos` veces con un error temporal y después responde."""
+
+    def __init__(self, fallos=0, error=RetryableError("429 Too Many Requests")):
+        self.fallos = fallos
+        self.error = error
+        self.llamadas = 0
+        self._lock = threading.Lock()
+        self._azar = random.Random(0)
+
+    def __call__(self, textos):
+        with self._lock:
+            self.llamadas += 1
+            if self.fallos:
+                self.fallos -= 1
+                raise self.error
+        time.sleep(self._azar.uniform(0, 0.02))  # Los lotes terminan desordenados
+        return np.array([[float(t.split()[1]), 1.0] for t in textos], dtype=np.float32)
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Registra el límite superior de cada backoff y evita las esperas reales."""
+    limites = []
+
+    def uniform(a, b):
+        limites.append(b)
+        return b
+
+    monkeypatch.setattr(embedding_pipeline, "random", types.SimpleNamespace(uniform=uniform))
+    monkeypatch.setattr(embedding_pipeline, "time", types.SimpleNamespace(sleep=lambda s: None, monotonic=time.monotonic))
+    return limites
+
+
+def crear_pipeline(api, **kwargs):
+    return EmbeddingPipeline(api, requests_per_second=1e6, **kwargs)
+
+
+def test_reintenta_con_backoff_exponencial(esperas):
+    api = APIQueFalla(fallos=3)
+    pipeline = crear_pipeline(api, max_retries=5, base_delay=1.0, max_delay=5.0)
+    resultado = pipeline.embed(["texto 0", "texto 1"])
+    assert api.llamadas == 4
+    assert pipeline.retries == 3
+    assert esperas == [2.0, 4.0, 5.0]  # base_delay * 2^intento, hasta max_delay
+    np.testing.assert_array_equal(resultado[:, 0], [0, 1])
+
+
+def test_se_rinde_tras_max_retries(esperas):
+    api = APIQueFalla(fallos=10)
+    pipeline = crear_pipeline(api, max_retries=2)
+    with pytest.raises(Exception, match="máximo de reintentos"):
+        pipeline.embed(["texto 0"])
+    assert api.llamadas == 3
+    assert pipeline.retries == 2
+
+
+def test_errores_no_temporales_no_se_reintentan(esperas):
+    api = APIQueFalla(fallos=1, error=ValueError("petición inválida"))
+    pipeline = crear_pipeline(api)
+    with pytest.raises(ValueError):
+        pipeline.embed(["texto 0"])
+    assert api.llamadas == 1 and esperas == []
+
+
+def test_conserva_el_orden_de_los_lotes(esperas):
+    api = APIQueFalla(fallos=2)
+    pipeline = crear_pipeline(api, max_workers=4, max_texts_per_batch=3)
+    textos = [f"texto {i}" for i in range(20)]
+    lotes = []
+    resultado = pipeline.embed(textos, on_batch=lambda inicio, fin, emb: lotes.append((inicio, fin, emb[:, 0].tolist())))
+    np.testing.assert_array_equal(resultado[:, 0], np.arange(20))
+    assert sorted(l[:2] for l in lotes) == pipeline.make_batches(textos)
+    assert all(valores == list(range(inicio, fin)) for inicio, fin, valores in lotes)
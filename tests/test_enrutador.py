@@ -0,0 +1,49 @@
+# test_enrutador.py
+
+import time
+
+import numpy as np
+
+from enrutador import EnrutadorIntencion
+
+EJEMPLOS = {"productos": ["p1", "p2"], "basico": ["b1", "b2"]}
+AMBIGUA = "¿qué opinas de esto?"  # Sin señales léxicas: va a la comparación vectorial
+
+
+class EmbedFalso:
+    def __init__(self, segundos=0.0):
+        self.segundos = segundos
+        self.llamadas = []
+
+    def __call__(self, textos, timeout=None):
+        self.llamadas.append(list(textos))
+        if timeout is not None and self.segundos > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("lento")
+        time.sleep(self.segundos)
+        return np.array([[1.0, 0.0] if t.startswith("p") or t == AMBIGUA else [0.0, 1.0] for t in textos])
+
+
+def test_prototipos_al_preparar():
+    embed = EmbedFalso()
+    enrutador = EnrutadorIntencion(embed, ejemplos=EJEMPLOS, timeout=1)
+    enrutador.preparar()
+    assert enrutador.clasificar(AMBIGUA) == "productos"
+    assert embed.llamadas == [["p1", "p2", "b1", "b2"], [AMBIGUA]]
+
+
+def test_sin_prototipos_no_espera():
+    embed = EmbedFalso(segundos=0.5)
+    enrutador = EnrutadorIntencion(embed, ejemplos=EJEMPLOS, timeout=1)
+    inicio = time.perf_counter()
+    assert enrutador.clasificar(AMBIGUA) == "basico"
+    assert time.perf_counter() - inicio < 0.2
+    time.sleep(1.0)  # Los prototipos se calculan en segundo plano
+    assert enrutador.prototipos is not None
+
+
+def test_plazo_del_embedding():
+    embed = EmbedFalso(segundos=0.5)
+    enrutador = EnrutadorIntencion(embed, ejemplos=EJEMPLOS, timeout=0.1)
+    enrutador.prototipos = {"productos": np.array([1.0, 0.0]), "basico": np.array([0.0, 1.0])}
+    assert enrutador.clasificar(AMBIGUA) == "basico"
@@ -0,0 +1,222 @@
+# test_faiss_manager.py
+
+import time
+import types
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from embedding_pipeline import EmbeddingPipeline
+from faiss_manager import FAISSManager
+
+DIM = 32
+
+
+class MistralFalso:
+    """Cliente de Mistral sin red: el embedding de cada texto depende solo del texto."""
+
+    def __init__(self):
+        self.embeddings = types.SimpleNamespace(create=self._create)
+
+    @staticmethod
+    def vector(texto):
+        rng = np.random.default_rng(zlib.crc32(texto.encode("utf-8")))
+        return rng.standard_normal(DIM).astype(np.float32)
+
+    def _create(self, model, inputs):
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=self.vector(t)) for t in inputs])
+
+
+class ChunkerPorLineas:
+    """Un chunk por línea, para controlar exactamente cuántos vectores tiene el índice."""
+
+    def iter_chunks(self, pages):
+        if isinstance(pages, str):
+            pages = [(None, pages)]
+        for page, texto in pages:
+            for linea in texto.splitlines():
+                if linea.strip():
+                    yield {"text": linea, "page": page}
+
+    def describe(self):
+        return "lineas"
+
+
+def crear_manager(index_type="flat"):
+    manager = FAISSManager(
+        api_key="test", cache_dir=None, embedding_cache_dir=None, index_type=index_type,
+        nlist=8, pq_m=16, nprobe=8, chunker=ChunkerPorLineas(),
+    )
+    manager.mistral_client = MistralFalso()
+    manager.embedding_pipeline = EmbeddingPipeline(manager._request_embeddings, requests_per_second=1000)
+    return manager
+
+
+def documento(n, prefijo="chunk"):
+    return "\n".join(f"{prefijo} {i} texto de prueba número {i}" for i in range(n))
+
+
+@pytest.mark.parametrize("index_type", FAISSManager.INDEX_TYPES)
+def test_guardar_y_cargar_mapeado(tmp_path, index_type):
+    # 700 chunks: suficientes para entrenar IVF-PQ con códigos de 4 bits (39 * 2^4 vectores)
+    manager = crear_manager(index_type)
+    manager.add_documents({"doc": documento(700)})
+    assert manager.built_index_type == index_type
+    ruta = str(tmp_path / "indice")
+    manager.save_index(ruta)
+
+    cargado = crear_manager(index_type)
+    assert cargado.load_index(ruta, mmap=True)
+    assert cargado._mmap_path == ruta
+
+    consulta = "chunk 123 texto de prueba número 123"
+    esperados = manager.search_similar_chunks(consulta, k=5)
+    resultados = cargado.search_similar_chunks(consulta, k=5)
+    assert resultados == esperados
+    assert consulta in resultados
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_documento_anadido_tras_cargar_entra_en_bm25(tmp_path, mmap):
+    manager = crear_manager()
+    manager.add_documents({"a": documento(20, "alfa")})
+    ruta = str(tmp_path / "indice")
+    manager.save_index(ruta)
+
+    cargado = crear_manager()
+    assert cargado.load_index(ruta, mmap=mmap)
+    cargado.add_documents({"b": documento(5, "beta")})
+    cargado.save_index(ruta)
+
+    recargado = crear_manager()
+    assert recargado.load_index(ruta, mmap=mmap)
+    resultados = recargado.search_similar_chunks("beta 3", k=1, mode="lexical")
+    assert resultados == ["beta 3 texto de prueba número 3"]
+    assert recargado.search_similar_chunks("alfa 7", k=1, mode="lexical") == ["alfa 7 texto de prueba número 7"]
+
+
+def test_lista_de_generadores(tmp_path):
+    def paginas(prefijo):
+        for pagina in range(3):
+            yield pagina, f"{prefijo} página {pagina}"
+
+    manager = crear_manager()
+    ids = manager.add_documents([paginas("alfa"), paginas("beta")])
+    assert len(ids) == 2
+    assert len(manager.chunks) == 6
+    assert set(ids) == set(manager.documents)
+    assert manager._doc_hash([(p, f"alfa página {p}") for p in range(3)]) in ids
+
+    # El mismo contenido otra vez no genera chunks nuevos
+    assert manager.add_documents([paginas("alfa")]) == []
+    assert len(manager.chunks) == 6
+
+
+class MistralLento(MistralFalso):
+    def __init__(self, segundos):
+        super().__init__()
+        self.segundos = segundos
+        self.llamadas = 0
+
+    def _create(self, model, inputs):
+        self.llamadas += 1
+        time.sleep(self.segundos)
+        return super()._create(model, inputs)
+
+
+def test_consultas_concurrentes_no_esperan_hilos(tmp_path):
+    manager = crear_manager()
+    manager.add_documents({"doc": documento(20)})
+    manager.mistral_client = MistralLento(0.5)
+
+    def buscar(i):
+        inicio = time.perf_counter()
+        manager.search_similar_chunks(f"chunk {i} texto", k=2, mode="dense", embed_timeout=1.5)
+        return time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        latencias = list(executor.map(buscar, range(12)))
+    # Con solo 2 hilos las últimas consultas superaban el plazo esperando turno
+    assert max(latencias) < 1.4
+
+
+def test_embedding_en_curso_se_comparte():
+    manager = crear_manager()
+    lento = manager.mistral_client = MistralLento(0.5)
+
+    with pytest.raises(TimeoutError):
+        manager.embed_queries(["consulta"], timeout=0.1)
+    # La segunda petición espera a la misma llamada en lugar de repetirla
+    vector = manager.embed_queries(["consulta"], timeout=1.0)
+    assert lento.llamadas == 1
+    np.testing.assert_allclose(vector[0], MistralFalso.vector("consulta"))
+
+
+def test_ingesta_por_lotes():
+    manager = crear_manager("ivf_flat")  # Se entrena con 39 * nlist = 312 vectores
+    manager.ingest_batch_size = 100
+    lotes = []
+    generar = manager.generate_embeddings
+    manager.generate_embeddings = lambda textos, kind="chunk": lotes.append(len(textos)) or generar(textos, kind)
+
+    leidas = []
+
+    def paginas():
+        for i in range(10):
+            leidas.append(i)
+            yield i + 1, documento(50, f"p{i}")
+
+    manager.add_documents({"a": paginas()})
+    assert max(lotes) <= 100 and sum(lotes) == 500
+    assert manager.index.ntotal == 500 and manager.documents["a"]["ids"] == list(range(500))
+    assert manager.search_similar_chunks("p7 3 texto de prueba número 3", k=1) == ["p7 3 texto de prueba número 3"]
+
+
+def test_fallo_en_un_lote_conserva_lo_anterior():
+    manager = crear_manager()
+    manager.ingest_batch_size = 10
+    manager.add_documents({"a": documento(30, "a")})
+
+    def paginas():
+        yield 1, documento(25, "b")
+        raise OSError("PDF dañado")
+
+    with pytest.raises(OSError):
+        manager.add_documents({"b": paginas()})
+    assert list(manager.documents) == ["a"]
+    assert manager.index.ntotal == 30
+    assert manager.search_similar_chunks("b 3 texto de prueba número 3", k=1)[0].startswith("a ")
+
+
+def test_sustituir_documento_compacta():
+    manager = crear_manager()
+    manager.add_documents({"a": documento(10, "a"), "b": documento(2, "b")})
+    manager.add_documents({"a": documento(6, "a2")})
+    # Los 10 chunks de la versión anterior de "a" son más de la mitad de los 18
+    assert manager.removed == 0
+    assert len(manager.chunks) == 8 and None not in manager.chunks
+    assert manager.index.ntotal == 8
+
+
+def test_ivf_pq_con_pocos_vectores_usa_indice_exacto():
+    manager = crear_manager("ivf_pq")
+    manager.add_documents({"doc": documento(300)})
+    assert manager.built_index_type == "flat"
+
+
+def test_reconstruir_con_muestra_y_por_lotes():
+    manager = crear_manager()
+    manager.ingest_batch_size = 100
+    manager.add_documents({"doc": documento(700)})
+    lotes = []
+    generar = manager.generate_embeddings
+    manager.generate_embeddings = lambda textos, kind="chunk": lotes.append(len(textos)) or generar(textos, kind)
+
+    manager.index_type = "ivf_flat"  # Muestra de 39 * nlist = 312 vectores
+    manager.rebuild_index()
+    assert lotes == [312] + [100] * 7
+    assert manager.built_index_type == "ivf_flat" and manager.index.ntotal == 700
+    consulta = "chunk 456 texto de prueba número 456"
+    assert manager.search_similar_chunks(consulta, k=1) == [consulta]
@@ -0,0 +1,74 @@
+# test_memoria.py
+
+import threading
+import time
+
+from chunker import count_tokens
+from memoria import MemoriaConversacion
+
+
+def esperar_resumen(memoria, limite=5):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        with memoria._lock:
+            if not memoria._resumiendo and not memoria._pendientes:
+                return
+        time.sleep(0.01)
+    raise AssertionError("El resumen no terminó a tiempo")
+
+
+def test_ventana_de_turnos_y_resumen():
+    llamadas = []
+
+    def resumir(anterior, turnos):
+        llamadas.append((anterior, list(turnos)))
+        return " ".join(filter(None, [anterior, *(c for c, _ in turnos)]))
+
+    memoria = MemoriaConversacion(resumir, turnos_recientes=2)
+    for i in range(4):
+        memoria.agregar_turno(f"consulta{i}", f"respuesta{i}")
+    esperar_resumen(memoria)
+
+    contexto = memoria.contexto()
+    assert contexto["turnos"] == [("consulta2", "respuesta2"), ("consulta3", "respuesta3")]
+    assert contexto["resumen"] == "consulta0 consulta1"
+    # Cada turno que sale de la ventana se resume una sola vez
+    assert sum(len(turnos) for _, turnos in llamadas) == 2
+
+
+def test_resumen_recortado_conserva_lo_reciente():
+    largo = " ".join(f"palabra{i}" for i in range(100))
+    memoria = MemoriaConversacion(lambda anterior, turnos: largo, turnos_recientes=1, max_tokens_resumen=20)
+    memoria.agregar_turno("a", "1")
+    memoria.agregar_turno("b", "2")
+    esperar_resumen(memoria)
+    resumen = memoria.contexto()["resumen"]
+    assert 0 < count_tokens(resumen) <= 20
+    assert resumen.endswith("palabra99")
+
+
+def test_sin_modelo_el_resumen_guarda_las_consultas():
+    def resumir(anterior, turnos):
+        raise RuntimeError("sin API Key")
+
+    memoria = MemoriaConversacion(resumir, turnos_recientes=1)
+    memoria.agregar_turno("¿Qué es el dropshipping?", "...")
+    memoria.agregar_turno("¿Y los envíos?", "...")
+    esperar_resumen(memoria)
+    assert memoria.contexto()["resumen"] == "El usuario preguntó: ¿Qué es el dropshipping?"
+
+
+def test_limpiar_descarta_el_resumen_en_curso():
+    liberar = threading.Event()
+
+    def resumir(anterior, turnos):
+        liberar.wait(5)
+        return "resumen viejo"
+
+    memoria = MemoriaConversacion(resumir, turnos_recientes=1)
+    memoria.agregar_turno("a", "1")
+    memoria.agregar_turno("b", "2")
+    memoria.limpiar()
+    liberar.set()
+    esperar_resumen(memoria)
+    assert memoria.contexto() == {"resumen": "", "turnos": []}
@@ -0,0 +1,21 @@
+# test_motor_busqueda.py
+
+import time
+
+from motor_busqueda import MotorBusqueda
+from test_faiss_manager import MistralLento, crear_manager, documento
+
+
+def test_cache_reutiliza_el_embedding_de_la_busqueda():
+    manager = crear_manager()
+    manager.add_documents({"doc": documento(20)})
+    lento = manager.mistral_client = MistralLento(1.0)
+    motor = MotorBusqueda(manager, True)
+    motor.embed_timeout = 0.3
+
+    inicio = time.perf_counter()
+    chunks = motor.buscar_chunks("chunk 3 texto", k=2)  # Híbrida: cae a BM25 tras el plazo
+    respuesta, query_emb = motor.buscar_respuesta_en_cache("chunk 3 texto", "", "basico")
+    assert time.perf_counter() - inicio < 0.6
+    assert chunks and respuesta is None and query_emb is None
+    assert lento.llamadas == 1
@@ -0,0 +1,138 @@
+# test_orquestador.py
+
+import asyncio
+import time
+
+import AI_model
+import metricas
+import orquestador
+
+
+class MotorFalso:
+    enrutador = None
+
+    def __init__(self, respuesta_cache=None, error=None):
+        self.respuesta_cache = respuesta_cache
+        self.error = error
+        self.guardadas = []
+
+    def buscar_chunks(self, query, k):
+        if self.error:
+            raise self.error
+        return ["El dropshipping no requiere inventario."]
+
+    def buscar_respuesta_en_cache(self, query, contexto, modo):
+        return self.respuesta_cache, None
+
+    def guardar_respuesta(self, query, emb, contexto, modo, respuesta):
+        self.guardadas.append(respuesta)
+
+
+class MemoriaFalsa:
+    def __init__(self):
+        self.turnos = []
+
+    def contexto(self):
+        return {"resumen": "", "turnos": list(self.turnos)}
+
+    def agregar_turno(self, consulta, respuesta):
+        self.turnos.append((consulta, respuesta))
+
+
+def test_eventos_de_una_respuesta(monkeypatch):
+    monkeypatch.setattr(orquestador, "analizar_documento_solo_texto_stream", lambda prompt, estado=None: iter(["Hola, ", "mundo"]))
+    motor = MotorFalso()
+    memoria = MemoriaFalsa()
+
+    eventos = list(orquestador.responder_stream(motor, "¿Cómo funciona el dropshipping?", "basico", memoria))
+    assert eventos[0] == ("modo", ("basico", orquestador.TIPOS_ANALISIS[("basico", False)]))
+    assert eventos[1:3] == [("fragmento", "Hola, "), ("fragmento", "mundo")]
+    tipo, resultado = eventos[3]
+    assert tipo == "fin" and len(eventos) == 4
+    assert resultado["respuesta"] == "Hola, mundo"
+    assert {"route", "retrieve", "generate"} <= set(resultado["traza"]["spans_s"])
+    assert memoria.turnos == [("¿Cómo funciona el dropshipping?", "Hola, mundo")]
+    assert motor.guardadas == ["Hola, mundo"]
+
+
+def test_error_se_cuenta_y_no_entra_en_memoria():
+    motor = MotorFalso(error=RuntimeError("sin índice"))
+    memoria = MemoriaFalsa()
+    errores = metricas.registro.contadores.get("errores", 0)
+
+    respuesta, analysis_type = orquestador.obtener_respuesta_inteligente(motor, "hola", "basico", memoria)
+    assert respuesta.startswith("❌") and "sin índice" in respuesta
+    assert analysis_type == "⚠️ Error"
+    assert metricas.registro.contadores["errores"] == errores + 1
+    assert memoria.turnos == []
+
+
+def test_fallo_a_mitad_no_se_guarda(monkeypatch):
+    class ClienteQueFalla:
+        def generar_stream(self, prompt, tipo):
+            yield "Para empezar, "
+            raise ConnectionError("conexión cortada")
+
+    monkeypatch.setattr(AI_model, "_cliente", ClienteQueFalla())
+    motor = MotorFalso()
+    memoria = MemoriaFalsa()
+
+    respuesta, _ = orquestador.obtener_respuesta_inteligente(motor, "¿Cómo funciona el dropshipping?", "basico", memoria)
+    assert respuesta.startswith("Para empezar, ") and "❌" in respuesta
+    assert motor.guardadas == []
+    assert memoria.turnos == []
+
+
+def test_productos_no_esperan_al_embedding(monkeypatch):
+    datos = ({"productos": [], "source": "Amazon"}, {"productos": [], "source": "AliExpress"})
+    monkeypatch.setattr(orquestador, "obtener_datos_productos", lambda consulta, clave: datos)
+
+    class MotorLento(MotorFalso):
+        def buscar_respuesta_en_cache(self, query, contexto, modo):
+            time.sleep(1.0)
+            return None, None
+
+    inicio = time.perf_counter()
+    plan = asyncio.run(orquestador.preparar_respuesta(MotorLento(), "nichos rentables", "productos", timeout=0.5))
+    assert time.perf_counter() - inicio < 0.4
+    assert plan["datos_productos"] == datos
+    assert "_productos" not in plan
+
+
+def test_productos_llegados_se_conservan_tras_el_plazo(monkeypatch):
+    datos = ({"productos": [], "source": "Amazon"}, {"productos": [], "source": "AliExpress"})
+
+    def lentos(consulta, clave):
+        time.sleep(0.3)
+        return datos
+
+    monkeypatch.setattr(orquestador, "obtener_datos_productos", lentos)
+
+    class MotorLento(MotorFalso):
+        def buscar_respuesta_en_cache(self, query, contexto, modo):
+            time.sleep(0.1)
+            return None, None
+
+    plan = asyncio.run(orquestador.preparar_respuesta(MotorLento(), "nichos rentables", "productos", timeout=0.2))
+    assert "Mock" in plan["datos_productos"][0]["source"]
+    plan = asyncio.run(orquestador.preparar_respuesta(MotorLento(), "nichos rentables", "productos", timeout=1.0))
+    assert plan["datos_productos"] == datos
+
+
+def test_la_memoria_forma_parte_de_la_clave_de_cache():
+    class MotorRegistro(MotorFalso):
+        def __init__(self):
+            super().__init__()
+            self.contextos = []
+
+        def buscar_respuesta_en_cache(self, query, contexto, modo):
+            self.contextos.append(contexto)
+            return None, None
+
+    motor = MotorRegistro()
+    memoria = MemoriaFalsa()
+    asyncio.run(orquestador.preparar_respuesta(motor, "¿y en Amazon?", "basico", memoria=memoria))
+    memoria.agregar_turno("¿Qué vendo en verano?", "Ventiladores portátiles")
+    asyncio.run(orquestador.preparar_respuesta(motor, "¿y en Amazon?", "basico", memoria=memoria))
+    assert "Ventiladores" not in motor.contextos[0]
+    assert "Ventiladores" in motor.contextos[1]